@@ -0,0 +1,109 @@
+"""Backfills of many years of data.
+
+A backfill splits its date range into chunks of calendar months (a year by default) and
+imports each chunk as its own pipeline, optionally several chunks at once. Every imported
+window is recorded in a checkpoint, so an interrupted backfill resumes with exactly the
+windows that are still missing. Chunks share the DHIS2 client, the org unit geometries
+and the aggregation processes.
+"""
+
+import logging
+import threading
+from collections.abc import Sequence
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from dataclasses import replace
+from datetime import date
+from pathlib import Path
+
+from dhis2_era5land.checkpoint import Checkpoint
+from dhis2_era5land.importer import ImportOptions, import_era5_land_to_dhis2
+from dhis2_era5land.orgunits import get_org_units
+from dhis2_era5land.pipeline import create_aggregation_pool
+from dhis2_era5land.progress import ImportProgress
+from dhis2_era5land.settings import VariableSpec
+from dhis2_era5land.window import DayWindow, plan_chunks, plan_windows
+
+logger = logging.getLogger(__name__)
+
+
+def open_checkpoint(
+    path: Path,
+    specs: Sequence[VariableSpec],
+    timezone_offset: int,
+    org_unit_level: int | Sequence[int],
+) -> Checkpoint:
+    """Open the checkpoint of a backfill of these variables, org unit levels and timezone."""
+    params = {
+        "variables": [spec.model_dump(mode="json") for spec in specs],
+        "timezone_offset": timezone_offset,
+        "org_unit_level": org_unit_level if isinstance(org_unit_level, int) else list(org_unit_level),
+    }
+    return Checkpoint(path, params)
+
+
+def run_backfill(
+    options: ImportOptions,
+    checkpoint: Checkpoint,
+    months_per_chunk: int = 12,
+    parallel_chunks: int = 1,
+) -> None:
+    """Import a long date range in chunks of `months_per_chunk` months, resuming from a checkpoint.
+
+    Up to `parallel_chunks` chunks are imported at once, with up to `download_concurrency`
+    CDS requests in flight between all of them. Months are not grouped into larger CDS
+    requests: the CDS accepts one month of hourly ERA5-Land data per request, so a chunk is
+    downloaded as one request per month. If a chunk fails, the other chunks stop at their
+    next window boundary and the error is raised; windows imported until then stay
+    recorded in the checkpoint.
+    """
+    start, end = date.fromisoformat(options.start_date), date.fromisoformat(options.end_date)
+    chunks = [
+        chunk
+        for chunk in plan_chunks(start, end, months_per_chunk)
+        if not all(checkpoint.is_done(window) for window in plan_windows(chunk.start, chunk.end))
+    ]
+    logger.info(
+        "Backfilling %s to %s: %d chunks of %d months to import, %d windows already imported",
+        start,
+        end,
+        len(chunks),
+        months_per_chunk,
+        len(checkpoint),
+    )
+    if not chunks:
+        return
+
+    cache = options.cache
+    org_units_dir = cache.directory / "org-units" if cache is not None else None
+    org_units = get_org_units(options.client, options.org_unit_level, org_units_dir, options.org_unit_simplify)
+    pool = create_aggregation_pool(options.aggregation_workers) if options.aggregation_workers > 0 else None
+    progress = {chunk: ImportProgress() for chunk in chunks}
+    cds_slots = threading.Semaphore(max(options.download_concurrency, 1))
+
+    def import_chunk(chunk: DayWindow) -> None:
+        logger.info("Importing chunk %s", chunk)
+        import_era5_land_to_dhis2(
+            replace(options, start_date=chunk.start.isoformat(), end_date=chunk.end.isoformat()),
+            progress=progress[chunk],
+            org_units=org_units,
+            aggregation_pool=pool,
+            checkpoint=checkpoint,
+            cds_slots=cds_slots,
+        )
+        logger.info("Imported chunk %s", chunk)
+
+    executor = ThreadPoolExecutor(max_workers=max(parallel_chunks, 1), thread_name_prefix="backfill")
+    try:
+        futures = [executor.submit(import_chunk, chunk) for chunk in chunks]
+        done, _ = wait(futures, return_when=FIRST_EXCEPTION)
+        for future in done:
+            future.result()
+    except BaseException:
+        # stop the other chunks at their next window boundary; queued chunks don't start
+        for chunk_progress in progress.values():
+            chunk_progress.cancel()
+        raise
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,271 @@
+"""Benchmarks of the import with synthetic ERA5-Land data and a fake DHIS2.
+
+Each scenario imports synthetic hourly cubes (standing in for `era5_land.hourly.get`) for
+a grid of synthetic org unit polygons into an in-process fake DHIS2, which reads and
+counts the posted data values. Scenarios run in a fresh process each, so their peak
+memory use doesn't depend on earlier scenarios. Results are returned as plain dicts
+(and written as JSON by the CLI), to compare them between commits.
+"""
+
+import gzip
+import json
+import math
+import multiprocessing
+import platform
+import resource
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from datetime import UTC, date, datetime, timedelta
+from typing import Any, cast
+from unittest import mock
+
+import httpx
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from dhis2_era5land import __version__
+from dhis2_era5land.cache import BBox
+from dhis2_era5land.settings import VariableSpec
+from dhis2_era5land.timing import reset_stage_stats, stage_stats
+from dhis2_era5land.upload import DHIS2Connection, UploadOptions
+
+START = date(2020, 1, 1)
+
+# Lower left corner of the synthetic org units, in degrees
+ORIGIN = (30.0, -10.0)
+
+
+@dataclass(frozen=True)
+class Scenario:
+    """Size of one benchmark run."""
+
+    org_units: int
+    months: int
+    variables: int = 1
+    extent: float = 10.0  # Width and height of the area covered by org units, in degrees
+
+
+def synthetic_org_units(count: int, extent: float = 10.0, seed: int = 0) -> dict[str, Any]:
+    """Generate a GeoJSON FeatureCollection of `count` irregular quadrilaterals tiling a square area."""
+    rng = np.random.default_rng(seed)
+    cols = math.ceil(math.sqrt(count))
+    rows = math.ceil(count / cols)
+    width, height = extent / cols, extent / rows
+
+    features = []
+    for i in range(count):
+        x0 = ORIGIN[0] + (i % cols) * width
+        y0 = ORIGIN[1] + (i // cols) * height
+        # move the corners inwards a little, so polygons cover grid cells partially
+        dx = rng.uniform(0, 0.2, 4) * width
+        dy = rng.uniform(0, 0.2, 4) * height
+        ring = [
+            [x0 + dx[0], y0 + dy[0]],
+            [x0 + width - dx[1], y0 + dy[1]],
+            [x0 + width - dx[2], y0 + height - dy[2]],
+            [x0 + dx[3], y0 + height - dy[3]],
+        ]
+        features.append(
+            {
+                "type": "Feature",
+                "id": f"ou{i:09d}",
+                "properties": {"name": f"Org unit {i}"},
+                "geometry": {"type": "Polygon", "coordinates": [[*ring, ring[0]]]},
+            }
+        )
+    return {"type": "FeatureCollection", "features": features}
+
+
+def synthetic_month(year: int, month: int, value_cols: list[str], bbox: BBox, seed: int = 0) -> xr.Dataset:
+    """Generate one month of hourly data on the ERA5-Land grid covering a bbox."""
+    xmin, ymin, xmax, ymax = bbox
+    rng = np.random.default_rng([seed, year, month])
+    lat = np.round(np.arange(math.ceil(ymax * 10), math.floor(ymin * 10) - 1, -1) / 10, 1)
+    lon = np.round(np.arange(math.floor(xmin * 10), math.ceil(xmax * 10) + 1) / 10, 1)
+    start = pd.Timestamp(year=year, month=month, day=1)
+    times = pd.date_range(start, start + pd.offsets.MonthBegin(1), freq="h", inclusive="left")
+
+    shape = (len(times), len(lat), len(lon))
+    dims = ("valid_time", "latitude", "longitude")
+    return xr.Dataset(
+        {col: (dims, rng.random(shape, dtype=np.float32) * 0.001) for col in value_cols},
+        coords={"valid_time": times, "latitude": lat, "longitude": lon},
+    )
+
+
+class FakeDHIS2:
+    """In-process stand-in for DHIS2Client that accepts and counts posted data values."""
+
+    base_url = "http://dhis2.benchmark"
+
+    def __init__(self, org_units: dict[str, Any]) -> None:
+        """Serve the given org units and accept any data values."""
+        self.org_units = org_units
+        self.values_received = 0
+        self.requests = 0
+        self._lock = threading.Lock()
+        # data values are posted over this connection, as to a real DHIS2
+        self.connection = DHIS2Connection(self.base_url, transport=httpx.MockTransport(self._handle))
+
+    def get(self, path: str, params: dict[str, Any] | None = None) -> dict[str, Any]:
+        """Return the synthetic org units, filtered by `level` and `lastUpdated` like the metadata API.
+
+        Org units without a `level` property are returned for any level.
+        """
+        filters = dict(f.split(":eq:" if ":eq:" in f else ":gt:", 1) for f in (params or {}).get("filter", []))
+        units = []
+        for feature in self.org_units["features"]:
+            level = str(feature["properties"].get("level", filters.get("level")))
+            last_updated = feature["properties"].get("lastUpdated", "2024-01-01T00:00:00.000")
+            if level == filters.get("level") and last_updated > filters.get("lastUpdated", ""):
+                units.append(
+                    {
+                        "id": feature["id"],
+                        "name": feature["properties"]["name"],
+                        "lastUpdated": last_updated,
+                        "geometry": feature["geometry"],
+                    }
+                )
+        if (params or {}).get("fields") == "id":
+            units = [{"id": unit["id"]} for unit in units]
+        return {"organisationUnits": units}
+
+    def analytics_latest_period_for_level(self, de_uid: str, level: int) -> dict[str, Any]:
+        """Report that nothing was imported yet."""
+        return {"existing": None}
+
+    def _handle(self, request: httpx.Request) -> httpx.Response:
+        body = request.read()
+        if body[:2] == b"\x1f\x8b":
+            body = gzip.decompress(body)
+        if body.startswith(b"{"):
+            count = len(json.loads(body)["dataValues"])
+        else:
+            count = body.count(b"\n") - 1
+        with self._lock:
+            self.values_received += count
+            self.requests += 1
+        import_count = {"imported": count, "updated": 0, "ignored": 0, "deleted": 0}
+        return httpx.Response(200, json={"response": {"importCount": import_count}})
+
+
+def peak_rss_mb() -> float:
+    """Peak resident memory of this process and its finished child processes, in MB."""
+    usage = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return usage / (1024 * 1024) if sys.platform == "darwin" else usage / 1024
+
+
+def run_scenario(
+    scenario: Scenario,
+    aggregation_workers: int = 0,
+    upload_options: UploadOptions | None = None,
+) -> dict[str, Any]:
+    """Run one import with synthetic data and return its timings."""
+    from dhis2_era5land import importer
+    from dhis2_era5land.sinks import create_sinks
+
+    specs = [
+        VariableSpec(
+            variable=f"variable_{i}",
+            data_element_id=f"de{i:09d}",
+            value_col=f"v{i}",
+            temporal_aggregation="sum",
+        )
+        for i in range(scenario.variables)
+    ]
+    value_cols = [spec.value_col for spec in specs]
+    client = FakeDHIS2(synthetic_org_units(scenario.org_units, scenario.extent))
+    end = (pd.Timestamp(START) + pd.DateOffset(months=scenario.months) - timedelta(days=1)).date()
+
+    def get(year: int, month: int, variables: list[str], bbox: BBox) -> xr.Dataset:
+        return synthetic_month(year, month, value_cols, bbox)
+
+    reset_stage_stats()
+    start = time.perf_counter()
+    with mock.patch.object(importer.era5_land.hourly, "get", get):
+        importer.import_era5_land_to_dhis2(
+            importer.ImportOptions(
+                client=cast(Any, client),
+                specs=specs,
+                start_date=START.isoformat(),
+                end_date=end.isoformat(),
+                timezone_offset=0,
+                org_unit_level=2,
+                sinks=create_sinks(client.connection, upload_options=upload_options),
+                aggregation_workers=aggregation_workers,
+            ),
+        )
+    wall_time = time.perf_counter() - start
+
+    return {
+        **asdict(scenario),
+        "values": client.values_received,
+        "requests": client.requests,
+        "wall_time": round(wall_time, 3),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "stages": {
+            stage: {**asdict(stats), "seconds": round(stats.seconds, 3)}
+            for stage, stats in sorted(stage_stats().items())
+        },
+    }
+
+
+def _commit() -> str | None:
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.strip()
+
+
+def run_benchmarks(
+    scenarios: list[Scenario],
+    aggregation_workers: int = 0,
+    upload_options: UploadOptions | None = None,
+) -> dict[str, Any]:
+    """Run scenarios, each in a fresh process, and return the results with environment details."""
+    results = []
+    for scenario in scenarios:
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+            results.append(executor.submit(run_scenario, scenario, aggregation_workers, upload_options).result())
+    return {
+        "version": __version__,
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": multiprocessing.cpu_count(),
+        "created": datetime.now(UTC).isoformat(timespec="seconds"),
+        "aggregation_workers": aggregation_workers,
+        "results": results,
+    }
+
+
+def compare(results: dict[str, Any], baseline: dict[str, Any]) -> list[dict[str, Any]]:
+    """Compare the wall time and peak memory of matching scenarios against a baseline run."""
+    keys = ("org_units", "months", "variables", "extent")
+    previous = {tuple(r[k] for k in keys): r for r in baseline["results"]}
+    rows = []
+    for result in results["results"]:
+        before = previous.get(tuple(result[k] for k in keys))
+        if before is None:
+            continue
+        rows.append(
+            {
+                **{k: result[k] for k in keys},
+                "wall_time": result["wall_time"],
+                "baseline_wall_time": before["wall_time"],
+                "wall_time_ratio": round(result["wall_time"] / before["wall_time"], 3) if before["wall_time"] else None,
+                "peak_rss_mb": result["peak_rss_mb"],
+                "baseline_peak_rss_mb": before["peak_rss_mb"],
+            }
+        )
+    return rows
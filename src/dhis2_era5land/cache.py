@@ -0,0 +1,213 @@
+"""On-disk cache of downloaded ERA5-Land monthly cubes.
+
+Cubes are stored as NetCDF files named by a hash of the request (variables, bbox, month)
+and tracked in a JSON manifest. A cached cube is reused for any request whose variables
+and bbox it covers, as long as the month was complete (past the ERA5T latency) when it
+was downloaded. The cache is capped in size and evicts least recently used cubes first.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections.abc import Sequence
+from datetime import UTC, date, datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+import xarray as xr
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+# ERA5-Land (ERA5T) data is published with a delay of about five days
+ERA5_LAND_LATENCY = timedelta(days=5)
+
+# ERA5-Land native grid resolution in degrees
+GRID_RESOLUTION = 0.1
+
+MANIFEST_NAME = "manifest.json"
+
+BBox = tuple[float, float, float, float]
+
+
+class CacheEntry(BaseModel):
+    """Manifest entry for one cached monthly cube."""
+
+    key: str
+    variables: list[str]
+    bbox: BBox  # xmin, ymin, xmax, ymax
+    year: int
+    month: int
+    downloaded_at: datetime
+    last_accessed: datetime
+    complete: bool
+    size: int
+
+    def covers(self, variables: Sequence[str], bbox: BBox) -> bool:
+        """Check whether this cube contains all requested variables over the requested bbox."""
+        xmin, ymin, xmax, ymax = bbox
+        return (
+            set(variables) <= set(self.variables)
+            and self.bbox[0] <= xmin
+            and self.bbox[1] <= ymin
+            and self.bbox[2] >= xmax
+            and self.bbox[3] >= ymax
+        )
+
+
+def month_is_complete(year: int, month: int, now: datetime) -> bool:
+    """Check whether all hours of a month should be published, given the ERA5T latency."""
+    next_month = date(year + month // 12, month % 12 + 1, 1)
+    return now.date() >= next_month + ERA5_LAND_LATENCY
+
+
+def cache_key(year: int, month: int, variables: Sequence[str], bbox: BBox) -> str:
+    """Build a stable key for a download request."""
+    request = {
+        "variables": sorted(variables),
+        "bbox": [round(v, 4) for v in bbox],
+        "year": year,
+        "month": month,
+    }
+    return hashlib.sha256(json.dumps(request, sort_keys=True).encode()).hexdigest()[:32]
+
+
+def crop_to_bbox(data: xr.Dataset, bbox: BBox, pad: float = GRID_RESOLUTION) -> xr.Dataset:
+    """Crop a cube to a bbox, keeping one grid cell of padding around it."""
+    xmin, ymin, xmax, ymax = bbox
+    pad += 1e-6  # tolerate floating point noise in grid coordinates
+    lat = data["latitude"].values
+    lon = data["longitude"].values
+    lat_idx = np.flatnonzero((lat >= ymin - pad) & (lat <= ymax + pad))
+    lon_idx = np.flatnonzero((lon >= xmin - pad) & (lon <= xmax + pad))
+    return data.isel(latitude=lat_idx, longitude=lon_idx)
+
+
+class DownloadCache:
+    """Size-capped LRU cache of monthly ERA5-Land cubes."""
+
+    def __init__(self, directory: Path, max_bytes: int) -> None:
+        """Open (or create) a cache in the given directory."""
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._entries = self._load_manifest()
+
+    @property
+    def size(self) -> int:
+        """Total size of cached cubes in bytes."""
+        return sum(entry.size for entry in self._entries.values())
+
+    def get(
+        self,
+        year: int,
+        month: int,
+        variables: Sequence[str],
+        bbox: BBox,
+        chunks: dict[str, int] | None = None,
+    ) -> xr.Dataset | None:
+        """Return a cached cube covering the request, or `None` if it has to be downloaded.
+
+        The cube is loaded into memory, unless `chunks` are given: it is then opened
+        lazily as dask chunks of these sizes and only read when it is computed.
+        """
+        with self._lock:
+            entry = self._find(year, month, variables, bbox)
+            if entry is None:
+                return None
+            entry.last_accessed = datetime.now(UTC)
+            self._save_manifest()
+
+        logger.info("Using cached download for %d-%02d (%s)", year, month, entry.key)
+        if chunks is not None:
+            data = xr.open_dataset(self._path(entry.key), chunks=chunks)
+        else:
+            with xr.open_dataset(self._path(entry.key)) as ds:
+                data = ds.load()
+        if tuple(entry.bbox) != tuple(bbox):
+            data = crop_to_bbox(data, bbox)
+        return data
+
+    def put(self, year: int, month: int, variables: Sequence[str], bbox: BBox, data: xr.Dataset) -> None:
+        """Store a downloaded cube and evict old cubes if the cache is over its size cap."""
+        now = datetime.now(UTC)
+        key = cache_key(year, month, variables, bbox)
+        path = self._path(key)
+        # a temporary file of its own, as other threads or processes may store the same cube
+        tmp_path = path.with_name(f"{path.stem}.{os.getpid()}-{threading.get_ident()}.tmp")
+        try:
+            data.to_netcdf(tmp_path)
+            tmp_path.replace(path)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+
+        with self._lock:
+            # a complete cube supersedes any older (incomplete) cube for the same month it covers
+            for old in list(self._entries.values()):
+                if old.key != key and old.year == year and old.month == month and not old.complete:
+                    self._remove(old)
+            self._entries[key] = CacheEntry(
+                key=key,
+                variables=sorted(variables),
+                bbox=bbox,
+                year=year,
+                month=month,
+                downloaded_at=now,
+                last_accessed=now,
+                complete=month_is_complete(year, month, now),
+                size=path.stat().st_size,
+            )
+            self._evict(keep=key)
+            self._save_manifest()
+
+    def _find(self, year: int, month: int, variables: Sequence[str], bbox: BBox) -> CacheEntry | None:
+        candidates = [
+            entry
+            for entry in self._entries.values()
+            if entry.year == year and entry.month == month and entry.covers(variables, bbox)
+        ]
+        for entry in sorted(candidates, key=lambda e: e.downloaded_at, reverse=True):
+            # months still being filled in by ERA5T are re-fetched until they were downloaded complete
+            if entry.complete and self._path(entry.key).exists():
+                return entry
+        return None
+
+    def _evict(self, keep: str) -> None:
+        total = self.size
+        for entry in sorted(self._entries.values(), key=lambda e: e.last_accessed):
+            if total <= self.max_bytes:
+                break
+            if entry.key == keep:
+                continue
+            logger.debug("Evicting cached download %s (%d-%02d)", entry.key, entry.year, entry.month)
+            total -= entry.size
+            self._remove(entry)
+
+    def _remove(self, entry: CacheEntry) -> None:
+        self._path(entry.key).unlink(missing_ok=True)
+        del self._entries[entry.key]
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.nc"
+
+    def _load_manifest(self) -> dict[str, CacheEntry]:
+        manifest_path = self.directory / MANIFEST_NAME
+        if not manifest_path.exists():
+            return {}
+        try:
+            raw = json.loads(manifest_path.read_text())
+            entries = [CacheEntry.model_validate(item) for item in raw["entries"]]
+        except (ValueError, KeyError):
+            logger.warning("Ignoring unreadable cache manifest at %s", manifest_path)
+            return {}
+        return {entry.key: entry for entry in entries if self._path(entry.key).exists()}
+
+    def _save_manifest(self) -> None:
+        manifest_path = self.directory / MANIFEST_NAME
+        tmp_path = manifest_path.with_suffix(".tmp")
+        entries = [entry.model_dump(mode="json") for entry in self._entries.values()]
+        tmp_path.write_text(json.dumps({"entries": entries}, indent=2))
+        tmp_path.replace(manifest_path)
@@ -0,0 +1,54 @@
+"""Checkpoints of long-running imports.
+
+A checkpoint records each window once it has been imported into DHIS2, in a JSON file
+rewritten atomically after every window, so an interrupted backfill resumes with exactly
+the windows that weren't imported yet. The file also stores the parameters of the import
+it belongs to, so it isn't resumed by a different import by mistake.
+"""
+
+import json
+import logging
+import threading
+from pathlib import Path
+from typing import Any
+
+from dhis2_era5land.window import DayWindow
+
+logger = logging.getLogger(__name__)
+
+
+class Checkpoint:
+    """Windows already imported by a resumable import."""
+
+    def __init__(self, path: Path, params: dict[str, Any]) -> None:
+        """Open (or create) the checkpoint of the import with the given parameters.
+
+        Raises ValueError if the file belongs to an import with other parameters.
+        """
+        self.path = path
+        self.params = json.loads(json.dumps(params, default=str))
+        self._lock = threading.Lock()
+        self._done: set[str] = set()
+        if path.exists():
+            stored = json.loads(path.read_text())
+            if stored["params"] != self.params:
+                raise ValueError(f"Checkpoint {path} belongs to another import: {stored['params']}")
+            self._done = set(stored["done"])
+            logger.info("Resuming from checkpoint %s (%d windows imported)", path, len(self._done))
+
+    def __len__(self) -> int:
+        """Number of windows imported."""
+        return len(self._done)
+
+    def is_done(self, window: DayWindow) -> bool:
+        """Whether a window was already imported."""
+        return str(window) in self._done
+
+    def mark_done(self, window: DayWindow) -> None:
+        """Record that a window was imported."""
+        with self._lock:
+            self._done.add(str(window))
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix(".tmp")
+            tmp_path.write_text(json.dumps({"params": self.params, "done": sorted(self._done)}, indent=2))
+            tmp_path.replace(self.path)
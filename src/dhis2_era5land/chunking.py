@@ -0,0 +1,52 @@
+"""Out-of-core aggregation with dask.
+
+By default each month of hourly data is held in memory while it is aggregated. With
+chunking, cached cubes are opened lazily and all cubes are split into dask chunks along
+time and space, so the daily reduction reads and reduces one chunk at a time on a thread
+pool and peak memory depends on the chunk size rather than the month size. The daily
+values, 24 times smaller than the hourly data, are then computed into memory for the
+spatial reduction.
+"""
+
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+import xarray as xr
+
+if TYPE_CHECKING:
+    from dhis2_era5land.settings import Settings
+
+
+@dataclass(frozen=True)
+class Chunking:
+    """Chunk sizes and threads for out-of-core aggregation."""
+
+    hours: int = 24 * 7  # Hours per chunk
+    cells: int = 256  # Grid cells per chunk along latitude and longitude
+    threads: int = 0  # Threads computing chunks (0 = one per core)
+
+    @classmethod
+    def from_settings(cls, settings: "Settings") -> "Chunking | None":
+        """Build chunking options from settings, or `None` if chunking is disabled."""
+        if settings.chunk_hours <= 0:
+            return None
+        return cls(hours=settings.chunk_hours, cells=settings.chunk_cells, threads=settings.chunk_threads)
+
+    @property
+    def sizes(self) -> dict[str, int]:
+        """Chunk sizes per dimension of ERA5-Land cubes."""
+        return {"valid_time": self.hours, "latitude": self.cells, "longitude": self.cells}
+
+    def chunk(self, data: xr.Dataset) -> xr.Dataset:
+        """Split a cube into chunks (lazily, when it isn't loaded yet)."""
+        return data.chunk({dim: size for dim, size in self.sizes.items() if dim in data.dims})
+
+    def compute(self, data: xr.DataArray) -> xr.DataArray:
+        """Compute a lazy array chunk by chunk (arrays already in memory are returned as they are)."""
+        if data.chunks is None:
+            return data
+
+        import dask
+
+        with dask.config.set(scheduler="threads", num_workers=self.threads or None):
+            return data.compute()
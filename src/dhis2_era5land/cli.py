@@ -1,16 +1,23 @@
 """CLI for dhis2-era5land."""
 
+import json
 import logging
 import os
+import signal
+import threading
+from pathlib import Path
 from typing import Annotated
 
 import typer
-import uvicorn
-from dhis2_client import DHIS2Client
+from pydantic import TypeAdapter
 
-from dhis2_era5land.importer import import_era5_land_to_dhis2
-from dhis2_era5land.settings import cds_settings, settings
-from dhis2_era5land.transforms import Transform, get_transform
+from dhis2_era5land.metrics import track_run
+from dhis2_era5land.periods import PeriodType
+from dhis2_era5land.settings import VariableSpec, cds_settings, org_unit_levels, settings
+from dhis2_era5land.transforms import Transform
+
+# The scientific stack, the DHIS2 client and the server are imported by the commands that
+# use them, so that `--help` and the server start without loading them.
 
 LOG_FORMAT = "%(asctime)s %(levelname)-5s [%(name)s] %(message)s"
 LOG_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
@@ -31,22 +38,66 @@ def run(
     username: Annotated[str, typer.Option(help="DHIS2 username")] = settings.username or ...,  # type: ignore[assignment]
     # ERA5 config
     variable: Annotated[str, typer.Option(help="ERA5 variable name")] = settings.variable,
-    data_element_id: Annotated[str, typer.Option(help="DHIS2 data element ID")] = settings.data_element_id or ...,  # type: ignore[assignment]
+    data_element_id: Annotated[str | None, typer.Option(help="DHIS2 data element ID")] = settings.data_element_id,
     value_col: Annotated[str, typer.Option(help="Value column name")] = settings.value_col,
     value_transform: Annotated[Transform, typer.Option(help="Value transform")] = settings.value_transform,
+    value_scale: Annotated[float, typer.Option(help="Scale applied after the transform")] = settings.value_scale,
+    value_offset: Annotated[float, typer.Option(help="Offset applied after the scale")] = settings.value_offset,
+    spec: Annotated[
+        Path | None, typer.Option(help="JSON file with a list of variables to import (replaces the options above)")
+    ] = None,
     # Aggregation
     temporal_aggregation: Annotated[
         str, typer.Option(help="Temporal aggregation (sum/mean)")
     ] = settings.temporal_aggregation,
     spatial_aggregation: Annotated[str, typer.Option(help="Spatial aggregation (mean)")] = settings.spatial_aggregation,
+    period_type: Annotated[PeriodType, typer.Option(help="DHIS2 period type to aggregate to")] = settings.period_type,
     # Other
     timezone_offset: Annotated[int, typer.Option(help="Timezone offset in hours")] = settings.timezone_offset,
-    org_unit_level: Annotated[int, typer.Option(help="Org unit level")] = settings.org_unit_level,
+    org_unit_level: Annotated[
+        list[int], typer.Option(help="Org unit level (repeat to import several levels together)")
+    ] = org_unit_levels(settings.org_unit_level),
+    cache_dir: Annotated[str | None, typer.Option(help="Directory for cached downloads")] = settings.cache_dir,
+    ledger_path: Annotated[
+        str | None, typer.Option(help="SQLite ledger of sent values, to skip unchanged values")
+    ] = settings.ledger_path,
+    store_dir: Annotated[
+        str | None, typer.Option(help="Also write values to a Parquet/Arrow store in this directory")
+    ] = settings.store_dir,
+    store_format: Annotated[str, typer.Option(help="Store format (parquet/arrow)")] = settings.store_format,
+    store_only: Annotated[
+        bool, typer.Option("--store-only", help="Only write values to the store, without posting to DHIS2")
+    ] = settings.store_only,
+    # Concurrency
+    download_concurrency: Annotated[int, typer.Option(help="Concurrent CDS downloads")] = settings.download_concurrency,
+    download_tiles: Annotated[
+        int, typer.Option(help="Download up to this many tiles around the org units (0 = one bbox)")
+    ] = settings.download_tiles,
+    aggregation_workers: Annotated[
+        int, typer.Option(help="Aggregation processes (0 = no process pool)")
+    ] = settings.aggregation_workers,
+    chunk_hours: Annotated[
+        int, typer.Option(help="Aggregate out of core in chunks of this many hours (0 = whole months)")
+    ] = settings.chunk_hours,
+    # Upload
+    upload_batch_size: Annotated[int, typer.Option(help="Max data values per request")] = settings.upload_batch_size,
+    upload_async: Annotated[bool, typer.Option(help="Use DHIS2 async import jobs")] = settings.upload_async,
+    upload_connections: Annotated[
+        int, typer.Option(help="Connections shared by batches posted with asyncio (0 = a thread per batch)")
+    ] = settings.upload_connections,
+    upload_http2: Annotated[
+        bool, typer.Option(help="Post with asyncio over HTTP/2 (needs the h2 package)")
+    ] = settings.upload_http2,
     # Flags
+    summary_path: Annotated[
+        str | None, typer.Option("--summary", help="Write a JSON summary of the run to this file")
+    ] = settings.run_summary,
     dry_run: Annotated[bool, typer.Option("--dry-run", help="Don't actually import")] = False,
     verbose: Annotated[bool, typer.Option("--verbose", "-v", help="Enable debug logging")] = False,
 ) -> None:
     """Run the ERA5-Land to DHIS2 import."""
+    from dhis2_era5land.importer import ImportOptions, import_era5_land_to_dhis2
+
     # Validate required env vars
     if not settings.password:
         raise typer.BadParameter("DHIS2_PASSWORD environment variable is required")
@@ -62,31 +113,293 @@ def run(
     log_level = logging.DEBUG if verbose else logging.INFO
     logging.basicConfig(level=log_level, format=LOG_FORMAT, datefmt=LOG_DATE_FORMAT)
 
-    # Create DHIS2 client
-    client = DHIS2Client(
-        base_url=base_url,
-        username=username,
-        password=settings.password,
+    # Variables to import, from a spec file, DHIS2_VARIABLES or the single variable options
+    if spec is not None:
+        specs = TypeAdapter(list[VariableSpec]).validate_json(spec.read_text())
+    elif settings.variables:
+        specs = settings.variables
+    elif data_element_id:
+        specs = [
+            VariableSpec(
+                variable=variable,
+                data_element_id=data_element_id,
+                value_col=value_col,
+                value_transform=value_transform,
+                value_scale=value_scale,
+                value_offset=value_offset,
+                temporal_aggregation=temporal_aggregation,
+                spatial_aggregation=spatial_aggregation,
+                period_type=period_type,
+            )
+        ]
+    else:
+        raise typer.BadParameter("--data-element-id or --spec is required")
+
+    # The options override the settings from the environment
+    run_settings = settings.model_copy(
+        update={
+            "start_date": start_date,
+            "end_date": end_date,
+            "base_url": base_url,
+            "username": username,
+            "timezone_offset": timezone_offset,
+            "org_unit_level": org_unit_level,
+            "cache_dir": cache_dir,
+            "ledger_path": ledger_path,
+            "store_dir": store_dir,
+            "store_format": store_format,
+            "store_only": store_only,
+            "download_concurrency": download_concurrency,
+            "download_tiles": download_tiles,
+            "aggregation_workers": aggregation_workers,
+            "chunk_hours": chunk_hours,
+            "upload_batch_size": upload_batch_size,
+            "upload_async": upload_async,
+            "upload_connections": upload_connections,
+            "upload_http2": upload_http2,
+        }
     )
+    try:
+        options = ImportOptions.from_settings(run_settings, dry_run, specs)
+    except (ImportError, ValueError) as exc:
+        raise typer.BadParameter(str(exc)) from exc
+
+    # Track stage statistics, and write them as a JSON summary when the run ends
+    try:
+        with track_run() as summary:
+            import_era5_land_to_dhis2(options)
+    finally:
+        if summary_path:
+            Path(summary_path).write_text(json.dumps(summary.to_dict(), indent=2))
+
+
+@app.command()
+def backfill(
+    start_date: Annotated[str, typer.Option(help="Start date (YYYY-MM-DD)")] = "1950-01-01",
+    end_date: Annotated[str, typer.Option(help="End date (YYYY-MM-DD)")] = settings.end_date,
+    spec: Annotated[
+        Path | None, typer.Option(help="JSON file with a list of variables to import (default: from the environment)")
+    ] = None,
+    checkpoint_path: Annotated[
+        Path, typer.Option("--checkpoint", help="Checkpoint file recording imported windows")
+    ] = Path(settings.backfill_checkpoint),
+    chunk_months: Annotated[int, typer.Option(help="Months per chunk (12 = calendar years)")] = 12,
+    parallel_chunks: Annotated[int, typer.Option(help="Chunks imported at the same time")] = 1,
+    summary_path: Annotated[
+        str | None, typer.Option("--summary", help="Write a JSON summary of the run to this file")
+    ] = settings.run_summary,
+    dry_run: Annotated[bool, typer.Option("--dry-run", help="Don't actually import")] = False,
+    verbose: Annotated[bool, typer.Option("--verbose", "-v", help="Enable debug logging")] = False,
+) -> None:
+    """Backfill many years in resumable chunks. Other settings are read from the environment."""
+    from dhis2_era5land.backfill import open_checkpoint, run_backfill
+    from dhis2_era5land.importer import ImportOptions
+    from dhis2_era5land.settings import validate_settings
+
+    logging.basicConfig(level=logging.DEBUG if verbose else logging.INFO, format=LOG_FORMAT, datefmt=LOG_DATE_FORMAT)
+    try:
+        validate_settings(require_variables=spec is None)
+        if spec is not None:
+            specs = TypeAdapter(list[VariableSpec]).validate_json(spec.read_text())
+        else:
+            specs = settings.variable_specs()
+        checkpoint = open_checkpoint(checkpoint_path, specs, settings.timezone_offset, settings.org_unit_level)
+        backfill_settings = settings.model_copy(update={"start_date": start_date, "end_date": end_date})
+        options = ImportOptions.from_settings(backfill_settings, dry_run, specs)
+    except (ImportError, ValueError) as exc:
+        raise typer.BadParameter(str(exc)) from exc
+
+    try:
+        with track_run() as summary:
+            run_backfill(options, checkpoint, months_per_chunk=chunk_months, parallel_chunks=parallel_chunks)
+    finally:
+        if summary_path:
+            Path(summary_path).write_text(json.dumps(summary.to_dict(), indent=2))
 
-    # Get transform function by name
-    value_func = get_transform(value_transform)
-
-    import_era5_land_to_dhis2(
-        client,
-        variable=variable,
-        data_element_id=data_element_id,
-        value_col=value_col,
-        value_func=value_func,
-        temporal_aggregation=temporal_aggregation,
-        spatial_aggregation=spatial_aggregation,
-        start_date=start_date,
-        end_date=end_date,
-        timezone_offset=timezone_offset,
-        org_unit_level=org_unit_level,
-        dry_run=dry_run,
+
+@app.command("import-from-store")
+def import_from_store(
+    store_dir: Annotated[str, typer.Option(help="Directory of the value store")] = settings.store_dir or ...,  # type: ignore[assignment]
+    data_element: Annotated[
+        list[str], typer.Option(help="Only import this data element (repeatable, default all)")
+    ] = [],
+    start_month: Annotated[str | None, typer.Option(help="First month to import (YYYY-MM)")] = None,
+    end_month: Annotated[str | None, typer.Option(help="Last month to import (YYYY-MM)")] = None,
+    level: Annotated[list[int], typer.Option(help="Only import this org unit level (repeatable, default all)")] = [],
+    summary_path: Annotated[
+        str | None, typer.Option("--summary", help="Write a JSON summary of the run to this file")
+    ] = settings.run_summary,
+    dry_run: Annotated[bool, typer.Option("--dry-run", help="Don't actually import")] = False,
+    verbose: Annotated[bool, typer.Option("--verbose", "-v", help="Enable debug logging")] = False,
+) -> None:
+    """Import values from a value store into DHIS2, without downloading or aggregating them."""
+    from dhis2_era5land.ledger import ValueLedger
+    from dhis2_era5land.sinks import import_from_store as import_values
+    from dhis2_era5land.upload import DHIS2Connection, UploadOptions
+
+    missing = [
+        name
+        for name, value in [
+            ("DHIS2_BASE_URL", settings.base_url),
+            ("DHIS2_USERNAME", settings.username),
+            ("DHIS2_PASSWORD", settings.password),
+        ]
+        if not value
+    ]
+    if missing:
+        raise typer.BadParameter(f"Missing required environment variables: {', '.join(missing)}")
+    if not Path(store_dir).is_dir():
+        raise typer.BadParameter(f"Store directory not found: {store_dir}")
+
+    logging.basicConfig(level=logging.DEBUG if verbose else logging.INFO, format=LOG_FORMAT, datefmt=LOG_DATE_FORMAT)
+    ledger = (
+        ValueLedger(Path(settings.ledger_path), tolerance=settings.ledger_tolerance) if settings.ledger_path else None
     )
 
+    try:
+        with track_run() as summary:
+            try:
+                posted = import_values(
+                    DHIS2Connection.from_settings(settings),
+                    Path(store_dir),
+                    data_elements=data_element,
+                    start_month=start_month,
+                    end_month=end_month,
+                    levels=level,
+                    dry_run=dry_run,
+                    upload_options=UploadOptions.from_settings(settings),
+                    ledger=ledger,
+                )
+            except ImportError as exc:
+                raise typer.BadParameter(str(exc)) from exc
+        typer.echo(f"Imported {posted} values from {store_dir}")
+    finally:
+        if summary_path:
+            Path(summary_path).write_text(json.dumps(summary.to_dict(), indent=2))
+
+
+@app.command("fan-out")
+def fan_out(
+    instances_path: Annotated[
+        Path | None,
+        typer.Option("--instances", help="JSON file with a list of DHIS2 instances (default: DHIS2_INSTANCES)"),
+    ] = None,
+    start_date: Annotated[str, typer.Option(help="Start date (YYYY-MM-DD)")] = settings.start_date,
+    end_date: Annotated[str, typer.Option(help="End date (YYYY-MM-DD)")] = settings.end_date,
+    cds_concurrency: Annotated[
+        int, typer.Option(help="CDS requests in flight across all instances")
+    ] = settings.cds_concurrency,
+    summary_path: Annotated[
+        str | None, typer.Option("--summary", help="Write a JSON summary of the run to this file")
+    ] = settings.run_summary,
+    dry_run: Annotated[bool, typer.Option("--dry-run", help="Don't actually import")] = False,
+    verbose: Annotated[bool, typer.Option("--verbose", "-v", help="Enable debug logging")] = False,
+) -> None:
+    """Import into several DHIS2 instances at once, sharing downloads between them."""
+    from dhis2_era5land.fanout import run_fan_out
+    from dhis2_era5land.settings import InstanceSpec
+
+    if not cds_settings.key:
+        raise typer.BadParameter(
+            "CDSAPI_KEY environment variable is required (get one from https://cds.climate.copernicus.eu/how-to-api)"
+        )
+    try:
+        if instances_path is not None:
+            instances = TypeAdapter(list[InstanceSpec]).validate_json(instances_path.read_text())
+        else:
+            instances = settings.instances
+        if not instances:
+            raise ValueError("--instances or DHIS2_INSTANCES is required")
+        for instance in instances:
+            instance.password()
+            if not instance.variables:
+                settings.variable_specs()
+    except ValueError as exc:
+        raise typer.BadParameter(str(exc)) from exc
+    os.environ["CDSAPI_URL"] = cds_settings.url
+    os.environ["CDSAPI_KEY"] = cds_settings.key
+
+    logging.basicConfig(level=logging.DEBUG if verbose else logging.INFO, format=LOG_FORMAT, datefmt=LOG_DATE_FORMAT)
+    try:
+        with track_run() as summary:
+            run_fan_out(
+                instances,
+                settings,
+                start_date=start_date,
+                end_date=end_date,
+                cds_concurrency=cds_concurrency,
+                dry_run=dry_run,
+            )
+    finally:
+        if summary_path:
+            Path(summary_path).write_text(json.dumps(summary.to_dict(), indent=2))
+
+
+@app.command()
+def benchmark(
+    org_units: Annotated[list[int], typer.Option(help="Number of synthetic org units (repeatable)")] = [10, 1000],
+    months: Annotated[list[int], typer.Option(help="Number of months to import (repeatable)")] = [1],
+    variables: Annotated[int, typer.Option(help="Variables imported per run")] = 1,
+    aggregation_workers: Annotated[int, typer.Option(help="Aggregation processes (0 = no process pool)")] = 0,
+    output: Annotated[Path | None, typer.Option(help="Write results as JSON to this file")] = None,
+    baseline: Annotated[Path | None, typer.Option(help="Compare with results of an earlier run")] = None,
+) -> None:
+    """Benchmark the import with synthetic ERA5-Land data and a fake DHIS2."""
+    from dhis2_era5land.benchmark import Scenario, compare, run_benchmarks
+
+    scenarios = [Scenario(org_units=n, months=m, variables=variables) for n in org_units for m in months]
+    results = run_benchmarks(scenarios, aggregation_workers=aggregation_workers)
+
+    for result in results["results"]:
+        stages = ", ".join(f"{stage} {stats['seconds']:.2f}s" for stage, stats in result["stages"].items())
+        typer.echo(
+            f"{result['org_units']:>7} org units {result['months']:>4} months: "
+            f"{result['wall_time']:.2f}s, {result['peak_rss_mb']:.0f} MB peak ({stages})"
+        )
+
+    if baseline is not None:
+        for row in compare(results, json.loads(baseline.read_text())):
+            typer.echo(
+                f"{row['org_units']:>7} org units {row['months']:>4} months: "
+                f"{row['baseline_wall_time']:.2f}s -> {row['wall_time']:.2f}s (x{row['wall_time_ratio']})"
+            )
+
+    if output is not None:
+        output.write_text(json.dumps(results, indent=2))
+        typer.echo(f"Results written to {output}")
+
+
+@app.command()
+def scheduler(
+    verbose: Annotated[bool, typer.Option("--verbose", "-v", help="Enable debug logging")] = False,
+) -> None:
+    """Run imports on the DHIS2_CRON schedule (or DHIS2_SCHEDULES) in a long-lived process."""
+    from dhis2_era5land.jobs import JobManager
+    from dhis2_era5land.scheduler import ScheduledImporter, Scheduler
+    from dhis2_era5land.settings import validate_settings
+
+    logging.basicConfig(level=logging.DEBUG if verbose else logging.INFO, format=LOG_FORMAT, datefmt=LOG_DATE_FORMAT)
+    try:
+        validate_settings()
+        schedules = settings.schedule_specs()
+        importer = ScheduledImporter(settings, schedules)
+        jobs = JobManager(importer, workers=settings.job_workers, history=settings.job_history)
+        runner = Scheduler(schedules, jobs)
+    except ValueError as exc:
+        raise typer.BadParameter(str(exc)) from exc
+
+    # stop on `docker stop` as well as on Ctrl-C
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    try:
+        runner.run(stop)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # running imports stop at the next window boundary
+        jobs.shutdown()
+        importer.close()
+
 
 @app.command()
 def serve(
@@ -95,6 +408,8 @@ def serve(
     verbose: Annotated[bool, typer.Option("--verbose", "-v", help="Enable debug logging")] = False,
 ) -> None:
     """Start the API server."""
+    import uvicorn
+
     log_level = "debug" if verbose else "info"
     logging.basicConfig(
         level=logging.DEBUG if verbose else logging.INFO,
@@ -0,0 +1,122 @@
+"""Cron expressions for the scheduler."""
+
+import calendar
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+# Name and range of each field of a cron expression
+CRON_FIELDS = (
+    ("minute", 0, 59),
+    ("hour", 0, 23),
+    ("day of month", 1, 31),
+    ("month", 1, 12),
+    ("day of week", 0, 7),
+)
+
+# Names accepted (in any case) instead of numbers in the month and day of week fields
+CRON_NAMES = {
+    "month": {name.upper(): number for number, name in enumerate(calendar.month_abbr) if name},
+    "day of week": {name: number for number, name in enumerate(["SUN", "MON", "TUE", "WED", "THU", "FRI", "SAT"])},
+}
+
+# How far ahead to look for the next run before giving up on an expression (e.g. `0 0 31 2 *`)
+_MAX_YEARS_AHEAD = 5
+
+
+def _parse_cron_value(text: str, name: str) -> int:
+    names = CRON_NAMES.get(name, {})
+    return names[text.upper()] if text.upper() in names else int(text)
+
+
+def _parse_cron_field(text: str, name: str, low: int, high: int) -> frozenset[int]:
+    values: set[int] = set()
+    for part in text.split(","):
+        base, has_step, step_text = part.partition("/")
+        try:
+            step = int(step_text) if has_step else 1
+            if base == "*":
+                start, stop = low, high
+            elif "-" in base:
+                first, last = base.split("-", 1)
+                start, stop = _parse_cron_value(first, name), _parse_cron_value(last, name)
+            else:
+                start = _parse_cron_value(base, name)
+                stop = high if has_step else start
+        except ValueError:
+            raise ValueError(f"Invalid cron {name} field: {text!r}") from None
+        if step < 1 or not low <= start <= stop <= high:
+            raise ValueError(f"Invalid cron {name} field: {text!r} (allowed values are {low}-{high})")
+        values.update(range(start, stop + 1, step))
+    return frozenset(values)
+
+
+@dataclass(frozen=True)
+class CronSchedule:
+    """Parsed five-field cron expression (minute, hour, day of month, month, day of week).
+
+    Supports `*`, lists (`1,15`), ranges (`9-17`) and steps (`*/15`, `0-30/10`), and
+    names for months (`JAN`-`DEC`) and days of the week (`SUN`-`SAT`, e.g. `MON-FRI`). Like
+    cron, when both day fields are restricted a day matches if either of them does; as in
+    Vixie cron, a day field starting with `*` (e.g. `*/2`) is not restricted, so
+    `0 1 */2 * 1` runs on odd days that are Mondays. Times are local and without time
+    zone, as for system cron.
+    """
+
+    minutes: frozenset[int]
+    hours: frozenset[int]
+    days: frozenset[int]
+    months: frozenset[int]
+    weekdays: frozenset[int]  # 0 = Sunday
+    any_day: bool
+    any_weekday: bool
+
+    @classmethod
+    def parse(cls, expression: str) -> "CronSchedule":
+        """Parse a cron expression, raising ValueError if it is invalid."""
+        fields = expression.split()
+        if len(fields) != len(CRON_FIELDS):
+            raise ValueError(f"Cron expression must have {len(CRON_FIELDS)} fields: {expression!r}")
+        minutes, hours, days, months, weekdays = (
+            _parse_cron_field(text, *field) for text, field in zip(fields, CRON_FIELDS, strict=True)
+        )
+        return cls(
+            minutes=minutes,
+            hours=hours,
+            days=days,
+            months=months,
+            weekdays=frozenset(day % 7 for day in weekdays),  # 7 is Sunday too
+            any_day=fields[2].startswith("*"),
+            any_weekday=fields[4].startswith("*"),
+        )
+
+    def _day_matches(self, when: datetime) -> bool:
+        day = when.day in self.days
+        weekday = (when.weekday() + 1) % 7 in self.weekdays
+        if not self.any_day and not self.any_weekday:
+            return day or weekday
+        return day and weekday
+
+    def matches(self, when: datetime) -> bool:
+        """Whether the schedule runs in the minute of `when`."""
+        return (
+            when.minute in self.minutes
+            and when.hour in self.hours
+            and when.month in self.months
+            and self._day_matches(when)
+        )
+
+    def next_after(self, when: datetime) -> datetime:
+        """Get the first minute after `when` in which the schedule runs."""
+        current = when.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        while current.year <= when.year + _MAX_YEARS_AHEAD:
+            if current.month not in self.months:
+                current = (current.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(current):
+                current = current.replace(hour=0, minute=0) + timedelta(days=1)
+            elif current.hour not in self.hours:
+                current = current.replace(minute=0) + timedelta(hours=1)
+            elif current.minute not in self.minutes:
+                current += timedelta(minutes=1)
+            else:
+                return current
+        raise ValueError("Cron schedule never runs")
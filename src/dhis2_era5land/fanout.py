@@ -0,0 +1,279 @@
+"""Imports into several DHIS2 instances sharing their downloads.
+
+Each instance (e.g. one per country) imports its own variables and org units into its own
+DHIS2, but their downloads are planned together: bounding boxes are grouped so that
+instances whose boxes overlap, or lie close enough that one request is no larger than
+separate ones (within a margin), share one CDS request per month with the variables of all of them. Each
+instance crops the shared cube to its own bounding box and aggregates and uploads it in
+its own pipeline, with all instances running in parallel. The CDS requests of all
+instances together are limited to `cds_concurrency` at a time, so the instances don't
+compete for the queue slots of the CDS account.
+"""
+
+import logging
+import threading
+from collections import Counter
+from collections.abc import Mapping, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import partial
+from itertools import combinations
+from pathlib import Path
+
+import xarray as xr
+from dhis2_client import DHIS2Client
+
+from dhis2_era5land.cache import BBox, DownloadCache, crop_to_bbox
+from dhis2_era5land.chunking import Chunking
+from dhis2_era5land.importer import ImportOptions, download_month, import_era5_land_to_dhis2
+from dhis2_era5land.orgunits import get_org_units
+from dhis2_era5land.pipeline import create_aggregation_pool
+from dhis2_era5land.settings import InstanceSpec, Settings
+from dhis2_era5land.tiling import grid_cells, snap_bbox
+from dhis2_era5land.upload import DHIS2Connection
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class DownloadGroup:
+    """Instances sharing one CDS request per month."""
+
+    bbox: BBox
+    variables: list[str]
+    instances: list[str]
+
+    @property
+    def size(self) -> int:
+        """Values per hour of a request: grid cells times variables."""
+        return grid_cells(self.bbox) * len(self.variables)
+
+    def merge(self, other: "DownloadGroup") -> "DownloadGroup":
+        """One request covering the bboxes and variables of both groups."""
+        return DownloadGroup(
+            bbox=(
+                min(self.bbox[0], other.bbox[0]),
+                min(self.bbox[1], other.bbox[1]),
+                max(self.bbox[2], other.bbox[2]),
+                max(self.bbox[3], other.bbox[3]),
+            ),
+            variables=sorted({*self.variables, *other.variables}),
+            instances=[*self.instances, *other.instances],
+        )
+
+
+def group_downloads(
+    requests: Mapping[str, tuple[BBox, Sequence[str]]], max_overhead: float = 0.25
+) -> list[DownloadGroup]:
+    """Group the downloads of instances, given as their bbox and variables, into shared requests.
+
+    Groups are merged, smallest request first relative to the separate ones, while one
+    request for both is at most `max_overhead` larger (in grid cells times variables) than
+    two separate requests. Each CDS request waits in the queue on its own, so fewer
+    requests are worth downloading a few cells more.
+    """
+    groups = [
+        DownloadGroup(snap_bbox(bbox), sorted(set(variables)), [name]) for name, (bbox, variables) in requests.items()
+    ]
+    while True:
+        best: tuple[float, int, int, DownloadGroup] | None = None
+        for i, j in combinations(range(len(groups)), 2):
+            merged = groups[i].merge(groups[j])
+            ratio = merged.size / (groups[i].size + groups[j].size)
+            if ratio <= 1 + max_overhead and (best is None or ratio < best[0]):
+                best = (ratio, i, j, merged)
+        if best is None:
+            return groups
+        _, i, j, merged = best
+        groups = [group for k, group in enumerate(groups) if k not in (i, j)] + [merged]
+
+
+class SharedDownloads:
+    """Downloads each month of each group once, and crops it for each instance of the group.
+
+    Each instance `plan`s the months it will fetch, and how many times, once it knows its
+    windows. A downloaded cube is kept in memory until every instance of its group whose
+    plan includes the month has fetched it as many times, so instances that are behind or
+    ahead of each other still share it, while months only one instance needs are freed
+    right away. Until an instance has planned, cubes are kept for it too. Instances that
+    finish or fail are `release`d, after which no cube waits for them.
+    """
+
+    def __init__(
+        self,
+        groups: Sequence[DownloadGroup],
+        cds_concurrency: int = 2,
+        cache: DownloadCache | None = None,
+        chunking: Chunking | None = None,
+    ) -> None:
+        """Share downloads within `groups`, with at most `cds_concurrency` CDS requests at a time."""
+        self._groups = {name: (index, group) for index, group in enumerate(groups) for name in group.instances}
+        self._instances = [group.instances for group in groups]
+        self._plans: dict[str, Counter[tuple[int, int]] | None] = {name: None for name in self._groups}
+        self._cds_slots = threading.Semaphore(max(cds_concurrency, 1))
+        self._cache = cache
+        self._chunking = chunking
+        self._lock = threading.Lock()
+        self._month_locks: dict[tuple[int, int, int], threading.Lock] = {}
+        self._cubes: dict[tuple[int, int, int], tuple[xr.Dataset, Counter[str]]] = {}
+
+    @property
+    def pending(self) -> int:
+        """Cubes held in memory for instances that haven't fetched them yet."""
+        with self._lock:
+            return len(self._cubes)
+
+    def plan(self, instance: str, months: Counter[tuple[int, int]]) -> None:
+        """Set how many times an instance will fetch each month, freeing cubes it doesn't need."""
+        with self._lock:
+            self._plans[instance] = Counter(months)
+            self._free_fetched()
+
+    def get(self, instance: str, year: int, month: int, variables: list[str], bbox: BBox) -> xr.Dataset:
+        """Get one month of hourly data for an instance, cropped to its bbox."""
+        index, group = self._groups[instance]
+        key = (index, year, month)
+        with self._lock:
+            month_lock = self._month_locks.setdefault(key, threading.Lock())
+
+        with month_lock:
+            with self._lock:
+                cube, fetched = self._cubes.get(key, (None, Counter()))
+            if cube is None:
+                cube = download_month(
+                    year, month, group.variables, group.bbox, self._cache, self._chunking, self._cds_slots
+                )
+            with self._lock:
+                fetched[instance] += 1
+                self._cubes[key] = (cube, fetched)
+                self._free_fetched()
+        return crop_to_bbox(cube, bbox)
+
+    def release(self, instance: str) -> None:
+        """Stop keeping cubes for an instance, freeing those that no other instance still needs."""
+        with self._lock:
+            self._plans[instance] = Counter()
+            self._free_fetched()
+
+    def _free_fetched(self) -> None:
+        # called with the lock held: free the cubes no instance of their group waits for
+        for key, (_, fetched) in list(self._cubes.items()):
+            index, year, month = key
+            if not any(
+                (plan := self._plans[name]) is None or fetched[name] < plan[(year, month)]
+                for name in self._instances[index]
+            ):
+                del self._cubes[key]
+                self._month_locks.pop(key, None)
+
+
+def run_fan_out(
+    instances: Sequence[InstanceSpec],
+    settings: Settings,
+    start_date: str,
+    end_date: str,
+    cds_concurrency: int = 2,
+    dry_run: bool = False,
+    clients: Mapping[str, DHIS2Client] | None = None,
+    connections: Mapping[str, DHIS2Connection] | None = None,
+) -> None:
+    """Import into several DHIS2 instances at once, sharing their downloads.
+
+    Settings not given for an instance are taken from `settings`. The instances are
+    connected to with their own settings, unless `clients` (and `connections` to post data
+    values over) are given by instance name.
+    If an instance fails, the others still finish, and a RuntimeError naming the failed
+    instances is raised at the end.
+    """
+    names = [instance.name for instance in instances]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Instance names must be unique: {', '.join(names)}")
+    if clients is None:
+        clients = {
+            instance.name: DHIS2Client(
+                base_url=instance.base_url, username=instance.username, password=instance.password()
+            )
+            for instance in instances
+        }
+    if connections is None:
+        connections = {
+            instance.name: DHIS2Connection(
+                instance.base_url, instance.username, instance.password(), timeout=settings.upload_timeout
+            )
+            for instance in instances
+        }
+
+    cache = None
+    if settings.cache_dir:
+        cache = DownloadCache(Path(settings.cache_dir), settings.cache_max_size_mb * 1024 * 1024)
+    chunking = Chunking.from_settings(settings)
+
+    # org units of each instance, and the downloads they share
+    org_units = {}
+    specs = {}
+    requests: dict[str, tuple[BBox, list[str]]] = {}
+    for instance in instances:
+        org_units_dir = cache.directory / "org-units" if cache is not None else None
+        org_unit_level = instance.org_unit_level or settings.org_unit_level
+        org_units[instance.name] = get_org_units(
+            clients[instance.name], org_unit_level, org_units_dir, settings.org_unit_simplify
+        )
+        specs[instance.name] = instance.variables or settings.variable_specs()
+        xmin, ymin, xmax, ymax = (float(v) for v in org_units[instance.name].total_bounds)
+        requests[instance.name] = ((xmin, ymin, xmax, ymax), [spec.variable for spec in specs[instance.name]])
+    groups = group_downloads(requests)
+    for group in groups:
+        logger.info("Sharing downloads of %s for %s", group.bbox, ", ".join(group.instances))
+    downloads = SharedDownloads(groups, cds_concurrency, cache, chunking)
+
+    pool = create_aggregation_pool(settings.aggregation_workers) if settings.aggregation_workers > 0 else None
+
+    def import_instance(instance: InstanceSpec) -> None:
+        # whether it succeeds or fails, no shared cube waits for this instance anymore
+        try:
+            instance_settings = settings.model_copy(
+                update={
+                    "start_date": start_date,
+                    "end_date": end_date,
+                    "timezone_offset": settings.timezone_offset
+                    if instance.timezone_offset is None
+                    else instance.timezone_offset,
+                    "org_unit_level": instance.org_unit_level or settings.org_unit_level,
+                    "ledger_path": instance.ledger_path,
+                    "store_dir": instance.store_dir,
+                }
+            )
+            options = ImportOptions.from_settings(
+                instance_settings,
+                dry_run,
+                specs[instance.name],
+                client=clients[instance.name],
+                connection=connections[instance.name],
+                cache=cache,
+            )
+            import_era5_land_to_dhis2(
+                options,
+                org_units=org_units[instance.name],
+                aggregation_pool=pool,
+                fetch_month=partial(downloads.get, instance.name),
+                plan_fetches=partial(downloads.plan, instance.name),
+            )
+            logger.info("Imported instance %s", instance.name)
+        finally:
+            downloads.release(instance.name)
+
+    failed = []
+    try:
+        with ThreadPoolExecutor(max_workers=len(instances), thread_name_prefix="instance") as executor:
+            futures = {instance.name: executor.submit(import_instance, instance) for instance in instances}
+            for name, future in futures.items():
+                try:
+                    future.result()
+                except Exception:
+                    logger.exception("Import into instance %s failed", name)
+                    failed.append(name)
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+    if failed:
+        raise RuntimeError(f"Import failed for instances: {', '.join(failed)}")
@@ -1,130 +1,589 @@
 """ERA5-Land to DHIS2 import functionality."""
 
-import json
 import logging
-from collections.abc import Callable
-from datetime import date
-from typing import Any
+import threading
+from collections import Counter
+from collections.abc import Callable, Sequence
+from concurrent.futures import Executor, ThreadPoolExecutor
+from contextlib import nullcontext
+from dataclasses import dataclass
+from datetime import UTC, date, datetime
+from functools import lru_cache, partial
+from pathlib import Path
+from tempfile import TemporaryDirectory
 
 import geopandas as gpd
 import numpy as np
+import pandas as pd
+import xarray as xr
 from dhis2_client import DHIS2Client
-from dhis2eo import utils
 from dhis2eo.data.cds import era5_land
-from dhis2eo.integrations.pandas import dataframe_to_dhis2_json
 from earthkit import transforms
 
+from dhis2_era5land.cache import BBox, DownloadCache
+from dhis2_era5land.checkpoint import Checkpoint
+from dhis2_era5land.chunking import Chunking
+from dhis2_era5land.ledger import ValueLedger
+from dhis2_era5land.orgunits import get_org_units
+from dhis2_era5land.periods import PeriodType
+from dhis2_era5land.pipeline import run_pipeline
+from dhis2_era5land.progress import ImportProgress
+from dhis2_era5land.settings import Settings, VariableSpec, org_unit_levels
+from dhis2_era5land.sinks import DHIS2Sink, Sink, create_sinks
+from dhis2_era5land.tiling import grid_cells, merge_tiles, plan_tiles
+from dhis2_era5land.timing import timed
+from dhis2_era5land.upload import DHIS2Connection, UploadOptions
+from dhis2_era5land.weights import WEIGHTED_AGGREGATIONS, get_weights, land_cells, org_units_key, weighted_reduce
+from dhis2_era5land.window import (
+    DayWindow,
+    parse_period_day,
+    period_ids,
+    plan_windows,
+    reduce_periods,
+    select_hours,
+)
+
 logger = logging.getLogger(__name__)
 
+# Org units listed when reporting invalid values
+INVALID_SAMPLE_SIZE = 10
 
-def import_era5_land_to_dhis2(
-    client: DHIS2Client,
-    variable: str,
-    data_element_id: str,
-    value_col: str,
-    value_func: Callable[[Any], Any],
-    temporal_aggregation: str,
-    spatial_aggregation: str,
-    start_date: str,
-    end_date: str,
+# First month of ERA5-Land data
+FIRST_MONTH = (1950, 1)
+
+
+def download_month(
+    year: int,
+    month: int,
+    variables: list[str],
+    bbox: BBox,
+    cache: DownloadCache | None = None,
+    chunking: Chunking | None = None,
+    cds_slots: threading.Semaphore | None = None,
+) -> xr.Dataset:
+    """Download one month of hourly ERA5-Land data, reusing a cached cube when possible.
+
+    With `chunking`, the cube is returned as lazy dask chunks; cached cubes are then read
+    from disk one chunk at a time when they are aggregated. With `cds_slots`, the CDS
+    request waits for a slot, so imports sharing it have a limited number of requests in
+    flight between them.
+    """
+    if cache is not None:
+        cached = cache.get(year, month, variables, bbox, chunks=chunking.sizes if chunking is not None else None)
+        if cached is not None:
+            return cached
+
+    with cds_slots if cds_slots is not None else nullcontext(), timed("download") as span:
+        hourly_data: xr.Dataset = era5_land.hourly.get(year=year, month=month, variables=variables, bbox=bbox)
+        span.rows = hourly_data.sizes.get("valid_time", 0)
+        span.bytes = hourly_data.nbytes
+    if cache is not None:
+        cache.put(year, month, variables, bbox, hourly_data)
+    if chunking is not None:
+        hourly_data = chunking.chunk(hourly_data)
+    return hourly_data
+
+
+def download_month_tiles(
+    year: int,
+    month: int,
+    variables: list[str],
+    bbox: BBox,
+    tiles: Sequence[BBox],
+    cache: DownloadCache | None = None,
+    chunking: Chunking | None = None,
+    cds_slots: threading.Semaphore | None = None,
+) -> xr.Dataset:
+    """Download one month of hourly ERA5-Land data as tiles within `bbox`, merged into one cube.
+
+    The tiles are requested in parallel, and cached one by one. Each tile request waits for
+    one of `cds_slots`, so tiles of all months share the same limit. Cells between tiles are
+    NaN (see `tiling`).
+    """
+
+    def download_tile(tile: BBox) -> xr.Dataset:
+        return download_month(year, month, variables, tile, cache, chunking, cds_slots)
+
+    with ThreadPoolExecutor(max_workers=len(tiles), thread_name_prefix="tile") as executor:
+        cubes = list(executor.map(download_tile, tiles))
+    tile_bytes = sum(cube.nbytes for cube in cubes)
+    bbox_bytes = tile_bytes * grid_cells(bbox) / sum(grid_cells(tile) for tile in tiles)
+    logger.info(
+        "%d tiles for %d-%02d hold %.1f MB, %.1f MB less than the bbox",
+        len(tiles),
+        year,
+        month,
+        tile_bytes / 1e6,
+        (bbox_bytes - tile_bytes) / 1e6,
+    )
+    hourly_data = merge_tiles(cubes)
+    if chunking is not None:
+        hourly_data = chunking.chunk(hourly_data)
+    return hourly_data
+
+
+class ReusedMonths:
+    """Keeps downloaded months in memory until every window needing them has fetched them.
+
+    Without a download cache, neighbouring windows need the same month when local days or
+    periods reach into it; the window that downloads it first hands it to the other instead
+    of both downloading it.
+    """
+
+    def __init__(
+        self, fetch_month: Callable[[int, int, list[str], BBox], xr.Dataset], needed: Counter[tuple[int, int]]
+    ) -> None:
+        """Fetch months with `fetch_month`, keeping each for as many fetches as `needed` counts."""
+        self._fetch_month = fetch_month
+        self._needed = Counter(needed)
+        self._lock = threading.Lock()
+        self._month_locks: dict[tuple[int, int], threading.Lock] = {}
+        self._cubes: dict[tuple[int, int], xr.Dataset] = {}
+
+    @property
+    def pending(self) -> int:
+        """Months held in memory for windows that haven't fetched them yet."""
+        with self._lock:
+            return len(self._cubes)
+
+    def __call__(self, year: int, month: int, variables: list[str], bbox: BBox) -> xr.Dataset:
+        """Get one month of hourly data, downloading it only if no other window has."""
+        key = (year, month)
+        with self._lock:
+            month_lock = self._month_locks.setdefault(key, threading.Lock())
+
+        with month_lock:
+            with self._lock:
+                cube = self._cubes.get(key)
+            if cube is None:
+                cube = self._fetch_month(year, month, variables, bbox)
+            with self._lock:
+                self._needed[key] -= 1
+                if self._needed[key] > 0:
+                    self._cubes[key] = cube
+                else:
+                    self._cubes.pop(key, None)
+                    self._month_locks.pop(key, None)
+        return cube
+
+
+def drop_invalid_values(data: xr.DataArray, mask_dim: str = "id", time_dim: str = "valid_time") -> pd.DataFrame:
+    """Flatten (org unit, time) values to `id`, `valid_time` and `value` columns, leaving out NaN and inf values.
+
+    Org unit IDs are returned as a Categorical of the org units, so each value holds a
+    small code instead of its own copy of the ID. Invalid values (org units without data
+    coverage or bad data) are logged as a count per org unit, listing the
+    `INVALID_SAMPLE_SIZE` org units with the most.
+    """
+    data = data.transpose(mask_dim, time_dim)
+    values = data.values
+    valid = np.isfinite(values)
+    ids = data[mask_dim].values
+
+    invalid_counts = valid.shape[1] - np.count_nonzero(valid, axis=1)
+    invalid_units = np.flatnonzero(invalid_counts)
+    if len(invalid_units):
+        sample = invalid_units[np.argsort(-invalid_counts[invalid_units], kind="stable")[:INVALID_SAMPLE_SIZE]]
+        logger.warning(
+            "Dropping %d invalid values (NaN/inf) of %d org units: %s%s",
+            invalid_counts.sum(),
+            len(invalid_units),
+            ", ".join(f"{ids[i]} ({invalid_counts[i]})" for i in sample),
+            ", ..." if len(invalid_units) > len(sample) else "",
+        )
+
+    units, times = np.nonzero(valid)
+    return pd.DataFrame(
+        {
+            "id": pd.Categorical.from_codes(units, categories=ids),
+            "valid_time": data[time_dim].values[times],
+            "value": values[units, times],
+        }
+    )
+
+
+def aggregate_variable(
+    hourly_data: xr.Dataset,
+    org_units: gpd.GeoDataFrame,
+    spec: VariableSpec,
     timezone_offset: int,
-    org_unit_level: int,
-    dry_run: bool = False,
-) -> None:
-    """Download ERA5-Land data and import aggregated values into DHIS2."""
-    # define the era5 variable names to download
-    variables = [variable]
-
-    # parse start and end month
-    start = date.fromisoformat(start_date)
-    end = date.fromisoformat(end_date)
-    start_year, start_month = start.year, start.month
-    end_year, end_month = end.year, end.month
-
-    # get org units from DHIS2
-    org_units_geojson = client.get_org_units_geojson(level=org_unit_level)
-    org_units = gpd.read_file(json.dumps(org_units_geojson))
-
-    # get last imported month, and convert to string to use for comparisons
-    # the results contains an `existing` entry which contains information about the last imported period
-    # ...for which data was found, or `None` if no existing data was found
-    last_imported_response = client.analytics_latest_period_for_level(de_uid=data_element_id, level=org_unit_level)
-    logger.debug("Last imported response: %s", last_imported_response)
-    last_imported_period = last_imported_response["existing"]
-    last_imported_month_string = last_imported_period["id"][:6] if last_imported_period else None
-
-    # loop through and process one month at a time
-    for year, month in utils.time.iter_months(start_year, start_month, end_year, end_month):
-        month_string = utils.time.dhis2_period(year=year, month=month)
-        logger.info("Processing %s", month_string)
-
-        # determine whether data for this month has already been imported
-        # we still import if this month is the latest imported one (to allow updates to partially imported months)
-        needs_import = last_imported_month_string is None or (month_string >= last_imported_month_string)
-        logger.debug("Comparing %s with %s, needs import: %s", month_string, last_imported_month_string, needs_import)
-
-        # only continue if some of the data needs importing
-        if not needs_import:
-            logger.info("All data already imported for this month")
-            continue
-
-        # download era5 data
-        logger.info("Downloading data...")
-        hourly_data = era5_land.hourly.get(year=year, month=month, variables=variables, bbox=org_units.total_bounds)
-
-        # aggregate to time period
-        logger.info("Aggregating time...")
+    weights_dir: Path | None = None,
+    chunking: Chunking | None = None,
+    geometries_key: str | None = None,
+) -> pd.DataFrame:
+    """Aggregate one variable of hourly data (at most a month) to org unit values per period.
+
+    Chunked (lazy) hourly data is reduced to days chunk by chunk, and only the daily
+    values are held in memory. Daily values are then reduced to the period type of the
+    variable, with `temporal_aggregation` over the days of each period. Values are
+    labelled with the first day of their period in `valid_time` and the DHIS2 period ID
+    in `period`. Org units, data elements and periods are Categoricals, formatted once per
+    distinct value (see `serialize`).
+    """
+    # aggregate to time period
+    logger.info("Aggregating time for %s...", spec.variable)
+    with timed("temporal") as span:
         agg_time = transforms.temporal.daily_reduce(
-            hourly_data[value_col],
-            how=temporal_aggregation,
+            hourly_data[spec.value_col],
+            how=spec.temporal_aggregation,
             time_shift={"hours": timezone_offset},
             remove_partial_periods=False,
         )
+        if chunking is not None:
+            agg_time = chunking.compute(agg_time)
+        if spec.period_type != PeriodType.DAILY:
+            agg_time = reduce_periods(agg_time, spec.period_type, how=spec.temporal_aggregation)
+        span.rows = agg_time.size
+        span.bytes = agg_time.nbytes
 
-        # aggregate to org units
-        logger.info("Aggregating to org units...")
-        agg_org_units = transforms.spatial.reduce(
-            agg_time,
+    # aggregate to org units
+    logger.info("Aggregating %s to org units...", spec.variable)
+    with timed("spatial") as span:
+        # weights are shared by all variables and reused across runs
+        weights = get_weights(
             org_units,
-            mask_dim="id",
-            how=spatial_aggregation,
+            agg_time["latitude"].values,
+            agg_time["longitude"].values,
+            weights_dir,
+            geometries_key=geometries_key,
         )
-        agg_df = agg_org_units.to_dataframe().reset_index()
-
-        # post-processing
-        logger.info("Post-processing...")
-        agg_df[value_col] = agg_df[value_col].apply(value_func)
-
-        # filter out NaN and inf values (org units with no data coverage or bad data)
-        invalid_mask = agg_df[value_col].isna() | np.isinf(agg_df[value_col])
-        invalid_count = invalid_mask.sum()
-        if invalid_count > 0:
-            invalid_rows = agg_df[invalid_mask][["id", "valid_time", value_col]]
-            logger.warning(
-                "Dropping %d rows with invalid values (NaN/inf):\n%s",
-                invalid_count,
-                invalid_rows.to_string(),  # pyright: ignore[reportAttributeAccessIssue]
+        if spec.spatial_aggregation in WEIGHTED_AGGREGATIONS:
+            # one sparse matrix product for all days
+            agg_org_units = weighted_reduce(agg_time, weights, how=spec.spatial_aggregation, mask_dim="id")
+        else:
+            # earthkit masks, for the same org units as the weighted reduction
+            excluded = weights.excluded(land_cells(agg_time))
+            agg_org_units = transforms.spatial.reduce(
+                agg_time,
+                org_units[~excluded] if excluded.any() else org_units,
+                mask_dim="id",
+                how=spec.spatial_aggregation,
             )
-            agg_df = agg_df[~invalid_mask]
-
-        logger.debug("Data sample:\n%s", agg_df.head(10).to_string())
-
-        # create json payload
-        logger.info("Creating payload with %d values...", len(agg_df))
-        payload = dataframe_to_dhis2_json(
-            df=agg_df,
-            org_unit_col="id",
-            period_col="valid_time",
-            value_col=value_col,
-            data_element_id=data_element_id,
+        span.rows = agg_org_units.size
+        span.bytes = agg_org_units.nbytes
+
+    # post-processing (transforms are vectorized, so apply them to the whole array at once)
+    logger.info("Post-processing...")
+    with timed("postprocess") as span:
+        agg_org_units = spec.value_func()(agg_org_units)
+        agg_df = drop_invalid_values(agg_org_units)
+        agg_df.insert(
+            0, "data_element", pd.Categorical.from_codes(np.zeros(len(agg_df), np.int8), [spec.data_element_id])
         )
+        days, starts = pd.factorize(agg_df["valid_time"].to_numpy())
+        agg_df["period"] = pd.Categorical.from_codes(days, period_ids(starts, spec.period_type))
+        span.rows = len(agg_df)
+        span.bytes = int(agg_df.memory_usage(deep=True).sum())
+    logger.debug("Data sample:\n%s", agg_df.head(10).to_string())
+    return agg_df
+
+
+@dataclass(frozen=True)
+class OrgUnitsFile:
+    """Org units written to a file, to hand them to aggregation processes by path.
+
+    Each process loads the file once, instead of receiving all geometries with every month.
+    """
+
+    path: Path
 
-        # Convert values to string format (DHIS2 doesn't accept scientific notation)
-        data_values = payload.get("dataValues", [])
-        for dv in data_values:
-            dv["value"] = f"{dv['value']:.10f}".rstrip("0").rstrip(".")
+    @classmethod
+    def write(cls, org_units: gpd.GeoDataFrame, directory: Path) -> "OrgUnitsFile":
+        """Write org units to a file in `directory`."""
+        path = directory / "org-units.pkl"
+        org_units.to_pickle(path)
+        return cls(path)
 
-        # import to dhis2
-        logger.info("Importing...")
-        res = client.post("/api/dataValueSets", json=payload, params={"dryRun": str(dry_run).lower()})
-        logger.info("Import results: %s", res["response"]["importCount"])
+    def load(self) -> gpd.GeoDataFrame:
+        """Load the org units, once per process."""
+        return _load_org_units_file(self.path)
+
+
+@lru_cache(maxsize=4)
+def _load_org_units_file(path: Path) -> gpd.GeoDataFrame:
+    org_units: gpd.GeoDataFrame = pd.read_pickle(path)
+    return org_units
+
+
+def aggregate_month(
+    hourly_data: xr.Dataset,
+    org_units: gpd.GeoDataFrame | OrgUnitsFile,
+    specs: Sequence[VariableSpec],
+    timezone_offset: int,
+    weights_dir: Path | None = None,
+    chunking: Chunking | None = None,
+    geometries_key: str | None = None,
+) -> pd.DataFrame:
+    """Aggregate hourly data (at most a month) of all variables to daily org unit values.
+
+    Runs in an aggregation worker process, so all arguments must be picklable; pass org
+    units as an `OrgUnitsFile` there, and their `org_units_key` as `geometries_key` (see
+    `get_weights`). Returns the values of all variables with their data element in the
+    `data_element` column.
+    """
+    if isinstance(org_units, OrgUnitsFile):
+        org_units = org_units.load()
+    frames = [
+        aggregate_variable(hourly_data, org_units, spec, timezone_offset, weights_dir, chunking, geometries_key)
+        for spec in specs
+    ]
+    if len(frames) == 1:
+        return frames[0]
+    agg_df = pd.concat(frames, ignore_index=True)
+    # concat falls back to strings for categoricals with different categories
+    for column in ("data_element", "id", "period"):
+        agg_df[column] = pd.api.types.union_categoricals([frame[column] for frame in frames])
+    return agg_df
+
+
+@dataclass(frozen=True)
+class ImportOptions:
+    """What an import downloads, how, and where it writes the values.
+
+    All variables in `specs` are downloaded in one request per month, aggregated with
+    shared org unit weights, and imported together. Org units are kept in the download
+    `cache` and only fetched again when they changed in DHIS2 (see `orgunits`); without a
+    cache, a month needed by two windows is kept in memory between them.
+    """
+
+    client: DHIS2Client
+    specs: Sequence[VariableSpec]
+    start_date: str
+    end_date: str
+    timezone_offset: int
+    org_unit_level: int | Sequence[int]  # One level, or several aggregated with one weight matrix
+    sinks: Sequence[Sink]  # DHIS2 and/or a value store (see `sinks`)
+    dry_run: bool = False
+    cache: DownloadCache | None = None
+    download_concurrency: int = 1  # Windows downloaded at the same time
+    aggregation_workers: int = 0  # Aggregation processes (0 = aggregate on the download threads)
+    max_pending_months: int = 2  # Windows downloaded or aggregated ahead of the upload
+    chunking: Chunking | None = None  # Aggregate hourly data out of core in dask chunks
+    org_unit_simplify: float = 0.0  # Simplify org unit geometries to this tolerance in degrees
+    download_tiles: int = 0  # Download up to this many tiles covering the org units (see `tiling`)
+
+    @classmethod
+    def from_settings(
+        cls,
+        settings: Settings,
+        dry_run: bool = False,
+        specs: Sequence[VariableSpec] | None = None,
+        client: DHIS2Client | None = None,
+        connection: DHIS2Connection | None = None,
+        cache: DownloadCache | None = None,
+    ) -> "ImportOptions":
+        """Build the options of an import with `settings`, the same for every entry point.
+
+        `specs`, or a `client`, `connection` or `cache` to share between imports, replace
+        those of the settings. Raises ValueError for incomplete settings, and ImportError
+        if a sink needs a package that is not installed.
+        """
+        if connection is None:
+            connection = DHIS2Connection.from_settings(settings)
+        if client is None:
+            client = DHIS2Client(base_url=settings.base_url, username=settings.username, password=settings.password)
+        if cache is None and settings.cache_dir:
+            cache = DownloadCache(Path(settings.cache_dir), settings.cache_max_size_mb * 1024 * 1024)
+        ledger = None
+        if settings.ledger_path:
+            ledger = ValueLedger(Path(settings.ledger_path), tolerance=settings.ledger_tolerance)
+
+        return cls(
+            client=client,
+            specs=list(specs) if specs is not None else settings.variable_specs(),
+            start_date=settings.start_date,
+            end_date=settings.end_date,
+            timezone_offset=settings.timezone_offset,
+            org_unit_level=settings.org_unit_level,
+            sinks=create_sinks(
+                connection,
+                dry_run,
+                UploadOptions.from_settings(settings),
+                ledger,
+                settings.store_dir,
+                settings.store_format,
+                settings.store_only,
+            ),
+            dry_run=dry_run,
+            cache=cache,
+            download_concurrency=settings.download_concurrency,
+            aggregation_workers=settings.aggregation_workers,
+            max_pending_months=settings.max_pending_months,
+            chunking=Chunking.from_settings(settings),
+            org_unit_simplify=settings.org_unit_simplify,
+            download_tiles=settings.download_tiles,
+        )
+
+
+def import_era5_land_to_dhis2(
+    options: ImportOptions,
+    progress: ImportProgress | None = None,
+    org_units: gpd.GeoDataFrame | None = None,
+    aggregation_pool: Executor | None = None,
+    checkpoint: Checkpoint | None = None,
+    fetch_month: Callable[[int, int, list[str], BBox], xr.Dataset] | None = None,
+    cds_slots: threading.Semaphore | None = None,
+    plan_fetches: Callable[[Counter[tuple[int, int]]], None] | None = None,
+) -> None:
+    """Download ERA5-Land data and import aggregated values, as set out in `options`.
+
+    The days from the last imported period onwards are imported in windows of at most a
+    calendar month, run as a pipeline (see `run_pipeline`): downloaded, aggregated to the
+    period type of each variable and written to the sinks in period order. With a
+    `checkpoint`, the windows it records are skipped instead, and each imported window is
+    recorded unless it is a dry run. Cancelling `progress` stops the import at the next
+    window.
+
+    Long-running callers can pass `org_units` (see `get_org_units`) and an
+    `aggregation_pool` to reuse between imports, and `cds_slots` to limit the CDS requests
+    of several imports together. `fetch_month(year, month, variables, bbox)` replaces
+    `download_month`, and `plan_fetches` is told how many times each month will be
+    fetched (see `fanout`).
+    """
+    progress = progress if progress is not None else ImportProgress()
+    if not options.sinks:
+        raise ValueError("An import needs at least one sink to write values to")
+    if date.fromisoformat(options.start_date) < date(*FIRST_MONTH, 1):
+        raise ValueError(f"ERA5-Land data starts in {FIRST_MONTH[0]}-{FIRST_MONTH[1]:02d}, not {options.start_date}")
+    # progress counts the values posted to DHIS2, or the values stored when they are only stored
+    counted_sink = next((sink for sink in options.sinks if isinstance(sink, DHIS2Sink)), options.sinks[0])
+
+    # define the era5 variable names to download
+    variables = sorted({spec.variable for spec in options.specs})
+
+    # get org units of all levels from DHIS2
+    levels = org_unit_levels(options.org_unit_level)
+    if org_units is None:
+        org_units_dir = options.cache.directory / "org-units" if options.cache is not None else None
+        org_units = get_org_units(options.client, levels, org_units_dir, options.org_unit_simplify)
+    elif "level" not in org_units.columns:
+        org_units = org_units.assign(level=levels[0])
+    level_ids = {level: org_units.loc[org_units["level"] == level, "id"].to_numpy() for level in levels}
+    xmin, ymin, xmax, ymax = (float(v) for v in org_units.total_bounds)
+    bbox = (xmin, ymin, xmax, ymax)
+    if cds_slots is None:
+        cds_slots = threading.Semaphore(max(options.download_concurrency, 1))
+    shared_fetch = fetch_month is not None
+    if fetch_month is None:
+        fetch_month = partial(download_month, cache=options.cache, chunking=options.chunking, cds_slots=cds_slots)
+        if options.download_tiles > 1:
+            plan = plan_tiles(org_units, options.download_tiles)
+            logger.info(
+                "Downloading %d tiles with %d grid cells instead of %d in the bbox (%.0f%% fewer)",
+                len(plan.tiles),
+                plan.cells,
+                plan.bbox_cells,
+                100 * plan.saved_cells / plan.bbox_cells,
+            )
+            if len(plan.tiles) > 1:
+                fetch_month = partial(
+                    download_month_tiles,
+                    tiles=plan.tiles,
+                    cache=options.cache,
+                    chunking=options.chunking,
+                    cds_slots=cds_slots,
+                )
+
+    # get last imported day for each data element and level
+    # we import again from the latest imported day (to allow updates to partially imported days)
+    # ...unless a checkpoint records the windows already imported
+    start, end = date.fromisoformat(options.start_date), date.fromisoformat(options.end_date)
+    resume_from: dict[int, dict[str, date]] = {
+        level: {spec.data_element_id: start for spec in options.specs} for level in levels
+    }
+    if checkpoint is None:
+        for level in levels:
+            for spec in options.specs:
+                # the results contains an `existing` entry which contains information about the last imported period
+                # ...for which data was found, or `None` if no existing data was found
+                last_imported_response = options.client.analytics_latest_period_for_level(
+                    de_uid=spec.data_element_id, level=level
+                )
+                logger.debug("Last imported response for %s: %s", spec.data_element_id, last_imported_response)
+                last_imported_period = last_imported_response["existing"]
+                if last_imported_period:
+                    resume_from[level][spec.data_element_id] = parse_period_day(last_imported_period["id"])
+
+    # work out which days need importing (for the data element and level furthest behind),
+    # with windows reaching to the end of the last period starting in them
+    period_types = sorted({spec.period_type for spec in options.specs} - {PeriodType.DAILY})
+    first_day = min(day for days in resume_from.values() for day in days.values())
+    windows = plan_windows(start, end, resume_from=first_day, period_types=period_types)
+    if checkpoint is not None:
+        windows = [window for window in windows if not checkpoint.is_done(window)]
+    progress.windows_total = len(windows)
+    for level, days in resume_from.items():
+        for data_element_id, day in days.items():
+            if day > start:
+                logger.info(
+                    "All data already imported for %s at level %d before %s", data_element_id, level, day.isoformat()
+                )
+
+    def window_months(window: DayWindow) -> list[tuple[int, int]]:
+        # local days can reach into neighbouring UTC months, so days at month edges need the
+        # hours of those too (and periods running past the end of the month their days),
+        # as far as ERA5-Land has them
+        months = [month for month in window.months(options.timezone_offset) if month >= FIRST_MONTH]
+        now = datetime.now(UTC).replace(tzinfo=None)
+        return months[:1] + [(y, m) for y, m in months[1:] if datetime(y, m, 1) < now]
+
+    needed = Counter(month for window in windows for month in window_months(window))
+    if plan_fetches is not None:
+        plan_fetches(needed)
+    if options.cache is None and not shared_fetch and any(count > 1 for count in needed.values()):
+        logger.warning(
+            "No download cache: months needed by two windows are kept in memory until both "
+            "have used them; set a cache directory to keep them on disk instead"
+        )
+        fetch_month = ReusedMonths(fetch_month, needed)
+
+    def download(window: DayWindow) -> xr.Dataset:
+        progress.check_cancelled()
+        logger.info("Downloading data for %s...", window)
+        cubes = [fetch_month(year, month, variables, bbox) for year, month in window_months(window)]
+        hourly_data = cubes[0] if len(cubes) == 1 else xr.concat(cubes, dim="valid_time")
+        return select_hours(hourly_data, window, options.timezone_offset)
+
+    def upload(window: DayWindow, agg_df: pd.DataFrame) -> None:
+        progress.check_cancelled()
+        progress.current = str(window)
+        logger.info("Processing %s", window)
+        # drop periods that started before the window (imported whole by the previous one)
+        agg_df = agg_df[agg_df["valid_time"] >= np.datetime64(window.start, "ns")]
+        posted = 0
+        for level in levels:
+            level_df = agg_df[agg_df["id"].isin(level_ids[level])] if len(levels) > 1 else agg_df
+            # drop days already imported for data elements that are ahead of the others
+            first_day = level_df["data_element"].map(resume_from[level]).astype("datetime64[ns]")
+            level_df = level_df[level_df["valid_time"] >= first_day]
+            for sink in options.sinks:
+                written = sink.write(level_df, window.start, level)
+                if sink is counted_sink:
+                    posted += written
+        if checkpoint is not None and not options.dry_run:
+            checkpoint.mark_done(window)
+        progress.window_done(posted)
+
+    # process windows as a pipeline, importing them in period order; aggregation processes
+    # get the org units as a file they load once, instead of with every window
+    geometries_key = org_units_key(org_units)
+    on_processes = aggregation_pool is not None or options.aggregation_workers > 0
+    with TemporaryDirectory(prefix="dhis2-era5land-") if on_processes else nullcontext() as shared_dir:
+        run_pipeline(
+            windows,
+            download=download,
+            aggregate=partial(
+                aggregate_month,
+                org_units=OrgUnitsFile.write(org_units, Path(shared_dir)) if shared_dir else org_units,
+                specs=list(options.specs),
+                timezone_offset=options.timezone_offset,
+                weights_dir=options.cache.directory / "weights" if options.cache is not None else None,
+                chunking=options.chunking,
+                geometries_key=geometries_key,
+            ),
+            upload=upload,
+            download_workers=options.download_concurrency,
+            aggregation_workers=options.aggregation_workers,
+            max_pending=options.max_pending_months,
+            aggregation_pool=aggregation_pool,
+        )
@@ -0,0 +1,195 @@
+"""Import jobs run by the API server.
+
+Imports are queued as jobs and run on a bounded pool of worker threads, so requests
+(and `/health`) are answered while imports run. Each job has a target: the settings that
+decide what it imports and where (DHIS2 instance, variables, window, cache, ledger and
+store). A request identical to a job with the same target that is still queued or
+running returns that job instead of starting another import of the same data, and jobs
+with the same target run one at a time, so they never share a cache or ledger while
+running. Jobs can be cancelled: queued jobs don't start, and running jobs stop at the
+next window boundary.
+"""
+
+import json
+import logging
+import threading
+import uuid
+from collections import OrderedDict
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import UTC, datetime
+from enum import StrEnum
+from typing import Any
+
+from dhis2_era5land.metrics import RunSummary, track_run
+from dhis2_era5land.progress import ImportCancelled, ImportProgress
+from dhis2_era5land.timing import StageStats, stage_stats, stage_stats_since
+
+logger = logging.getLogger(__name__)
+
+
+class JobStatus(StrEnum):
+    """Lifecycle states of a job."""
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+ACTIVE_STATUSES = (JobStatus.QUEUED, JobStatus.RUNNING)
+
+
+@dataclass
+class Job:
+    """One queued, running or finished import."""
+
+    id: str
+    params: dict[str, Any]
+    target: dict[str, Any] = field(default_factory=dict)
+    status: JobStatus = JobStatus.QUEUED
+    created: datetime = field(default_factory=lambda: datetime.now(UTC))
+    started: datetime | None = None
+    finished: datetime | None = None
+    error: str | None = None
+    progress: ImportProgress = field(default_factory=ImportProgress)
+    summary: RunSummary | None = None
+    _stages_at_start: dict[str, StageStats] = field(default_factory=dict, repr=False)
+    _future: Future[None] | None = field(default=None, repr=False)
+
+    @property
+    def key(self) -> str:
+        """Identifies jobs that would import the same data."""
+        return json.dumps({"params": self.params, "target": self.target}, sort_keys=True)
+
+    @property
+    def target_key(self) -> str:
+        """Identifies jobs that import into the same target, and run one at a time."""
+        return json.dumps(self.target, sort_keys=True)
+
+    def stages(self) -> dict[str, StageStats]:
+        """Stage statistics of the job, so far while it runs."""
+        if self.status == JobStatus.RUNNING:
+            # stages of all imports in the process, so this is only exact with one worker
+            return stage_stats_since(self._stages_at_start)
+        return self.summary.stages if self.summary is not None else {}
+
+
+class JobManager:
+    """Queues imports as jobs and runs them on a bounded pool of worker threads."""
+
+    def __init__(
+        self,
+        run: Callable[[dict[str, Any], ImportProgress], None],
+        workers: int = 1,
+        history: int = 100,
+    ) -> None:
+        """Run jobs with `run(params, progress)` on `workers` threads, keeping `history` finished jobs."""
+        self._run = run
+        self._history = history
+        self._executor = ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix="import")
+        self._jobs: OrderedDict[str, Job] = OrderedDict()
+        self._lock = threading.Lock()
+        # lock of each target with jobs waiting for or running on it, and how many there are
+        self._target_locks: dict[str, tuple[threading.Lock, int]] = {}
+
+    def submit(self, params: dict[str, Any], target: dict[str, Any] | None = None) -> tuple[Job, bool]:
+        """Queue an import into `target`, or return the identical job still queued or running.
+
+        Without a `target`, the params identify what the job imports into. Returns the job
+        and whether it was newly created.
+        """
+        job = Job(id=uuid.uuid4().hex, params=params, target=target if target is not None else params)
+        with self._lock:
+            for existing in self._jobs.values():
+                if existing.status in ACTIVE_STATUSES and existing.key == job.key:
+                    return existing, False
+            self._jobs[job.id] = job
+            self._prune()
+            job._future = self._executor.submit(self._execute, job)
+        logger.info("Queued import job %s", job.id)
+        return job, True
+
+    def get(self, job_id: str) -> Job | None:
+        """Get a job by ID."""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self) -> list[Job]:
+        """Get all known jobs, newest first."""
+        with self._lock:
+            return list(reversed(self._jobs.values()))
+
+    def cancel(self, job_id: str) -> Job | None:
+        """Cancel a queued or running job."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status not in ACTIVE_STATUSES:
+                return job
+            job.progress.cancel()
+            if job._future is not None and job._future.cancel():
+                self._finish(job, JobStatus.CANCELLED)
+        logger.info("Cancelling import job %s", job_id)
+        return job
+
+    def shutdown(self) -> None:
+        """Cancel all jobs and stop the workers."""
+        for job in self.jobs():
+            self.cancel(job.id)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _execute(self, job: Job) -> None:
+        key = job.target_key
+        with self._lock:
+            target_lock, jobs = self._target_locks.get(key, (threading.Lock(), 0))
+            self._target_locks[key] = (target_lock, jobs + 1)
+        try:
+            # the job stays queued while another job imports into its target
+            with target_lock:
+                self._execute_job(job)
+        finally:
+            with self._lock:
+                _, jobs = self._target_locks[key]
+                if jobs > 1:
+                    self._target_locks[key] = (target_lock, jobs - 1)
+                else:
+                    del self._target_locks[key]
+
+    def _execute_job(self, job: Job) -> None:
+        with self._lock:
+            if job.progress.cancelled:
+                self._finish(job, JobStatus.CANCELLED)
+                return
+            job.status = JobStatus.RUNNING
+            job.started = datetime.now(UTC)
+            job._stages_at_start = stage_stats()
+
+        logger.info("Starting import job %s", job.id)
+        try:
+            with track_run() as summary:
+                job.summary = summary
+                self._run(job.params, job.progress)
+        except ImportCancelled:
+            logger.info("Import job %s was cancelled", job.id)
+            status, error = JobStatus.CANCELLED, None
+        except Exception as exc:
+            logger.exception("Import job %s failed", job.id)
+            status, error = JobStatus.FAILED, str(exc) or type(exc).__name__
+        else:
+            logger.info("Import job %s completed", job.id)
+            status, error = JobStatus.SUCCEEDED, None
+
+        with self._lock:
+            self._finish(job, status, error)
+
+    def _finish(self, job: Job, status: JobStatus, error: str | None = None) -> None:
+        job.status = status
+        job.error = error
+        job.finished = datetime.now(UTC)
+
+    def _prune(self) -> None:
+        finished = [job_id for job_id, job in self._jobs.items() if job.status not in ACTIVE_STATUSES]
+        for job_id in finished[: max(len(finished) - self._history, 0)]:
+            del self._jobs[job_id]
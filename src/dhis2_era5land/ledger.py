@@ -0,0 +1,105 @@
+"""Local ledger of data values already sent to DHIS2.
+
+The ledger is a SQLite table with the last value successfully imported for each
+(data element, org unit, period). Before upload, values that are unchanged within a
+tolerance are dropped, so repeated runs only send new days and revised values.
+"""
+
+import logging
+import sqlite3
+from collections.abc import Iterator
+from contextlib import closing, contextmanager
+from datetime import UTC, datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from dhis2_era5land.serialize import DataValueColumns
+
+logger = logging.getLogger(__name__)
+
+# Values closer than this to the ledger value are considered unchanged
+DEFAULT_TOLERANCE = 1e-6
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS data_values (
+    data_element TEXT NOT NULL,
+    org_unit TEXT NOT NULL,
+    period TEXT NOT NULL,
+    value REAL NOT NULL,
+    sent_at TEXT NOT NULL,
+    PRIMARY KEY (data_element, org_unit, period)
+) WITHOUT ROWID
+"""
+
+
+class ValueLedger:
+    """SQLite ledger of the last value sent per (data element, org unit, period)."""
+
+    def __init__(self, path: Path, tolerance: float = DEFAULT_TOLERANCE) -> None:
+        """Open (and create if needed) the ledger at `path`."""
+        self.path = path
+        self.tolerance = tolerance
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(_SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # a connection per operation, so the ledger can be used from any thread
+        with closing(sqlite3.connect(self.path)) as conn, conn:
+            yield conn
+
+    def sent_values(self, data_elements: np.ndarray, periods: np.ndarray) -> pd.DataFrame:
+        """Get the ledger values for the given data elements within the range of `periods`."""
+        if len(periods) == 0:
+            return pd.DataFrame({"data_element": [], "org_unit": [], "period": [], "sent": []})
+        unique_elements = np.unique(data_elements).tolist()
+        unique_periods = np.unique(periods)
+        placeholders = ",".join("?" * len(unique_elements))
+        with self._connect() as conn:
+            return pd.read_sql_query(
+                "SELECT data_element, org_unit, period, value AS sent FROM data_values "
+                f"WHERE data_element IN ({placeholders}) AND period BETWEEN ? AND ?",
+                conn,
+                params=(*unique_elements, str(unique_periods[0]), str(unique_periods[-1])),
+            )
+
+    def changed(self, columns: DataValueColumns) -> np.ndarray:
+        """Return a mask of the values that are new or differ from the ledger."""
+        sent = self.sent_values(columns.data_elements.unique(), columns.periods.unique())
+        if sent.empty:
+            return np.ones(len(columns), dtype=bool)
+
+        keys = ["data_element", "org_unit", "period"]
+        current = pd.DataFrame(
+            {
+                "data_element": columns.data_elements.categorical(),
+                "org_unit": columns.org_units.categorical(),
+                "period": columns.periods.categorical(),
+            }
+        )
+        previous = current.merge(sent, on=keys, how="left")["sent"].to_numpy(dtype=np.float64)
+        values = columns.values
+        changed: np.ndarray = ~(np.abs(values - previous) <= self.tolerance)  # values never sent are NaN here
+        return changed
+
+    def record(self, columns: DataValueColumns) -> None:
+        """Record values as sent."""
+        sent_at = datetime.now(UTC).isoformat()
+        rows = zip(
+            columns.data_elements[:].tolist(),
+            columns.org_units[:].tolist(),
+            columns.periods[:].tolist(),
+            columns.values.tolist(),
+            [sent_at] * len(columns),
+            strict=True,
+        )
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT INTO data_values (data_element, org_unit, period, value, sent_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (data_element, org_unit, period) DO UPDATE "
+                "SET value = excluded.value, sent_at = excluded.sent_at",
+                rows,
+            )
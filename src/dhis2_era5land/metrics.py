@@ -0,0 +1,135 @@
+"""Run summaries and Prometheus metrics.
+
+Each import run is tracked as a `RunSummary` with the per-stage statistics it added.
+The server exposes the cumulative stage statistics and the outcome of past runs in the
+Prometheus text format, and the CLI writes the summary of its run as JSON.
+"""
+
+import threading
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from datetime import UTC, datetime
+from typing import Any
+
+from dhis2_era5land.progress import ImportCancelled
+from dhis2_era5land.timing import StageStats, peak_rss, stage_stats, stage_stats_since
+
+PREFIX = "dhis2_era5land"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+@dataclass
+class RunSummary:
+    """Outcome and per-stage statistics of one import run."""
+
+    started: datetime
+    finished: datetime | None = None
+    status: str = "running"  # running, success, failed or cancelled
+    error: str | None = None
+    stages: dict[str, StageStats] = field(default_factory=dict)
+    peak_rss: int = 0  # Peak resident memory of the process, in bytes
+
+    @property
+    def seconds(self) -> float:
+        """Duration of the run so far."""
+        return ((self.finished or datetime.now(UTC)) - self.started).total_seconds()
+
+    def to_dict(self) -> dict[str, Any]:
+        """Convert to a JSON-serializable dict."""
+        return {
+            "started": self.started.isoformat(),
+            "finished": self.finished.isoformat() if self.finished else None,
+            "status": self.status,
+            "error": self.error,
+            "seconds": round(self.seconds, 3),
+            "peak_rss": self.peak_rss,
+            "stages": {stage: asdict(stats) for stage, stats in sorted(self.stages.items())},
+        }
+
+
+_lock = threading.Lock()
+_runs: dict[str, int] = {}
+_last_run: RunSummary | None = None
+
+
+@contextmanager
+def track_run() -> Iterator[RunSummary]:
+    """Track an import run, recording its outcome and the stage statistics it added."""
+    global _last_run
+
+    snapshot = stage_stats()
+    summary = RunSummary(started=datetime.now(UTC))
+    try:
+        yield summary
+        summary.status = "success"
+    except ImportCancelled:
+        summary.status = "cancelled"
+        raise
+    except BaseException as exc:
+        summary.status = "failed"
+        summary.error = str(exc) or type(exc).__name__
+        raise
+    finally:
+        summary.finished = datetime.now(UTC)
+        summary.stages = stage_stats_since(snapshot)
+        summary.peak_rss = peak_rss()
+        with _lock:
+            _runs[summary.status] = _runs.get(summary.status, 0) + 1
+            _last_run = summary
+
+
+def _metric(lines: list[str], name: str, kind: str, help_text: str, samples: list[tuple[str, float]]) -> None:
+    lines.append(f"# HELP {PREFIX}_{name} {help_text}")
+    lines.append(f"# TYPE {PREFIX}_{name} {kind}")
+    for labels, value in samples:
+        lines.append(f"{PREFIX}_{name}{labels} {value}")
+
+
+def render_prometheus() -> str:
+    """Render the stage statistics and run outcomes in the Prometheus text format."""
+    stats = sorted(stage_stats().items())
+    with _lock:
+        runs = sorted(_runs.items())
+        last_run = _last_run
+
+    lines: list[str] = []
+    stage_metrics: list[tuple[str, str, str, str]] = [
+        ("stage_seconds_total", "counter", "Time spent in each import stage.", "seconds"),
+        ("stage_calls_total", "counter", "Number of times each import stage ran.", "calls"),
+        ("stage_rows_total", "counter", "Rows (hours, cells or values) produced by each import stage.", "rows"),
+        ("stage_bytes_total", "counter", "Bytes produced by each import stage.", "bytes"),
+        ("stage_peak_rss_bytes", "gauge", "Highest peak resident memory at the end of each import stage.", "peak_rss"),
+    ]
+    for name, kind, help_text, attr in stage_metrics:
+        samples = [(f'{{stage="{stage}"}}', getattr(totals, attr)) for stage, totals in stats]
+        _metric(lines, name, kind, help_text, samples)
+
+    run_samples: list[tuple[str, float]] = [(f'{{status="{status}"}}', count) for status, count in runs]
+    _metric(lines, "runs_total", "counter", "Import runs by outcome.", run_samples)
+    _metric(lines, "process_peak_rss_bytes", "gauge", "Peak resident memory of the process.", [("", peak_rss())])
+    if last_run is not None and last_run.finished is not None:
+        _metric(
+            lines,
+            "last_run_timestamp_seconds",
+            "gauge",
+            "When the last import run finished.",
+            [("", last_run.finished.timestamp())],
+        )
+        _metric(lines, "last_run_seconds", "gauge", "Duration of the last import run.", [("", last_run.seconds)])
+        _metric(
+            lines,
+            "last_run_success",
+            "gauge",
+            "Whether the last import run succeeded.",
+            [("", int(last_run.status == "success"))],
+        )
+    return "\n".join(lines) + "\n"
+
+
+def reset_runs() -> None:
+    """Forget past runs."""
+    global _last_run
+    with _lock:
+        _runs.clear()
+        _last_run = None
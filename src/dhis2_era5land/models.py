@@ -1,5 +1,7 @@
 """Pydantic models for API responses."""
 
+from datetime import datetime
+
 from pydantic import BaseModel
 
 from dhis2_era5land import __version__
@@ -17,3 +19,31 @@ class ImportResponse(BaseModel):
 
     status: str
     message: str
+    job_id: str | None = None
+
+
+class StageResponse(BaseModel):
+    """Statistics of one import stage."""
+
+    seconds: float
+    calls: int
+    rows: int
+    bytes: int
+    peak_rss: int
+
+
+class JobResponse(BaseModel):
+    """Import job status and progress."""
+
+    id: str
+    status: str
+    dry_run: bool
+    created: datetime
+    started: datetime | None = None
+    finished: datetime | None = None
+    error: str | None = None
+    windows_total: int = 0
+    windows_done: int = 0
+    values_posted: int = 0
+    current_window: str | None = None
+    stages: dict[str, StageResponse] = {}
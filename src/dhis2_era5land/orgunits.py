@@ -0,0 +1,163 @@
+"""Org unit geometries from DHIS2, cached on disk.
+
+Org units are fetched from the metadata API with their geometries as GeoJSON objects,
+which are turned into shapely geometries directly instead of serializing a GeoJSON
+document and parsing it again. With a cache directory, the org units of each level are
+stored as WKB in a compressed NumPy archive, and later fetches only ask DHIS2 for the org
+units updated since the newest one stored (plus the IDs of the level, to drop deleted
+ones). Geometries can be simplified to a tolerance well below the 0.1° ERA5-Land grid,
+which makes weight computation faster for detailed boundaries without changing results
+noticeably.
+"""
+
+import hashlib
+import logging
+from collections.abc import Sequence
+from pathlib import Path
+from typing import Any
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+from dhis2_client import DHIS2Client
+from shapely.geometry import shape
+
+from dhis2_era5land.settings import org_unit_levels
+
+logger = logging.getLogger(__name__)
+
+ORG_UNIT_FIELDS = "id,name,lastUpdated,geometry"
+
+
+def _get_org_units(client: DHIS2Client, level: int, fields: str, filters: list[str]) -> list[dict[str, Any]]:
+    params = {"fields": fields, "filter": [f"level:eq:{level}", *filters], "paging": "false"}
+    response = client.get("/api/organisationUnits", params=params)
+    return list(response.get("organisationUnits", []))
+
+
+def fetch_org_units(client: DHIS2Client, level: int, updated_since: str | None = None) -> gpd.GeoDataFrame:
+    """Fetch the org units of a level with geometries, optionally only those updated after `updated_since`.
+
+    Org units without a geometry are left out. Org units are sorted by ID, so the same org
+    units give the same weights key.
+    """
+    filters = [f"lastUpdated:gt:{updated_since}"] if updated_since else []
+    return _org_unit_frame(_get_org_units(client, level, ORG_UNIT_FIELDS, filters))
+
+
+def _org_unit_frame(units: list[dict[str, Any]]) -> gpd.GeoDataFrame:
+    units = sorted((unit for unit in units if unit.get("geometry")), key=lambda unit: unit["id"])
+    return gpd.GeoDataFrame(
+        {
+            "id": [unit["id"] for unit in units],
+            "name": [unit.get("name", "") for unit in units],
+            "lastUpdated": [unit.get("lastUpdated", "") for unit in units],
+        },
+        geometry=[shape(unit["geometry"]) for unit in units],
+        crs="EPSG:4326",
+    )
+
+
+def fetch_org_unit_ids(client: DHIS2Client, level: int) -> set[str]:
+    """Fetch the IDs of all org units of a level."""
+    return {unit["id"] for unit in _get_org_units(client, level, "id", [])}
+
+
+def simplify_org_units(org_units: gpd.GeoDataFrame, tolerance: float) -> gpd.GeoDataFrame:
+    """Simplify org unit geometries to a tolerance in degrees, keeping them valid."""
+    if tolerance <= 0:
+        return org_units
+    simplified = org_units.copy()
+    simplified.geometry = shapely.simplify(org_units.geometry.values, tolerance, preserve_topology=True)
+    return simplified
+
+
+class OrgUnitCache:
+    """Org unit geometries of each DHIS2 instance and level, kept on disk and refreshed incrementally."""
+
+    def __init__(self, directory: Path) -> None:
+        """Store org units in `directory`."""
+        self.directory = directory
+
+    def get(self, client: DHIS2Client, level: int) -> gpd.GeoDataFrame:
+        """Get the org units of a level, fetching only the ones changed since they were stored."""
+        path = self._path(client, level)
+        if not path.exists():
+            logger.info("Fetching org units of level %d from DHIS2", level)
+            org_units = fetch_org_units(client, level)
+            self._save(path, org_units)
+            return org_units
+
+        cached = self._load(path)
+        updated_since = str(cached["lastUpdated"].max()) if len(cached) else None
+        # org units updated since, including those whose geometry was removed
+        filters = [f"lastUpdated:gt:{updated_since}"] if updated_since else []
+        records = _get_org_units(client, level, ORG_UNIT_FIELDS, filters)
+        updated = _org_unit_frame(records)
+        ids = fetch_org_unit_ids(client, level)
+        unchanged = cached[~cached["id"].isin([unit["id"] for unit in records]) & cached["id"].isin(ids)]
+        if len(updated) == 0 and len(unchanged) == len(cached):
+            logger.debug("Org units of level %d are unchanged", level)
+            return cached
+
+        logger.info(
+            "Updating %d and removing %d cached org units of level %d",
+            len(updated),
+            len(cached) - len(unchanged) - int(cached["id"].isin(updated["id"]).sum()),
+            level,
+        )
+        org_units = pd.concat([unchanged, updated[updated["id"].isin(ids)]], ignore_index=True)
+        org_units = org_units.sort_values("id", ignore_index=True)
+        self._save(path, org_units)
+        return org_units
+
+    def _path(self, client: DHIS2Client, level: int) -> Path:
+        instance = hashlib.sha256(str(client.base_url).encode()).hexdigest()[:12]
+        return self.directory / f"org-units-{instance}-level-{level}.npz"
+
+    def _save(self, path: Path, org_units: gpd.GeoDataFrame) -> None:
+        wkb = shapely.to_wkb(org_units.geometry.values)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp.npz")
+        np.savez_compressed(
+            tmp_path,
+            ids=np.asarray(org_units["id"], dtype=str),
+            names=np.asarray(org_units["name"], dtype=str),
+            last_updated=np.asarray(org_units["lastUpdated"], dtype=str),
+            wkb=np.frombuffer(b"".join(wkb), dtype=np.uint8),
+            offsets=np.cumsum([0, *(len(geometry) for geometry in wkb)]),
+        )
+        tmp_path.replace(path)
+
+    def _load(self, path: Path) -> gpd.GeoDataFrame:
+        with np.load(path) as npz:
+            data, offsets = npz["wkb"].tobytes(), npz["offsets"]
+            geometries = shapely.from_wkb([data[start:stop] for start, stop in zip(offsets[:-1], offsets[1:])])
+            return gpd.GeoDataFrame(
+                {"id": npz["ids"], "name": npz["names"], "lastUpdated": npz["last_updated"]},
+                geometry=geometries,
+                crs="EPSG:4326",
+            )
+
+
+def get_org_units(
+    client: DHIS2Client,
+    org_unit_level: int | Sequence[int],
+    cache_dir: Path | None = None,
+    simplify: float = 0.0,
+) -> gpd.GeoDataFrame:
+    """Get the org units of one or more levels with their geometries, from DHIS2 or the org unit cache.
+
+    The org units of all levels are returned together, with their level in the `level`
+    column. With `simplify`, geometries are simplified to that tolerance in degrees.
+    """
+    frames = []
+    for level in org_unit_levels(org_unit_level):
+        if cache_dir is not None:
+            org_units = OrgUnitCache(cache_dir).get(client, level)
+        else:
+            org_units = fetch_org_units(client, level)
+        frames.append(org_units.assign(level=level))
+    org_units = frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+    return simplify_org_units(org_units, simplify)
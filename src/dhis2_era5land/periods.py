@@ -0,0 +1,59 @@
+"""DHIS2 period types.
+
+Daily values can be aggregated further to the period type of a data element, so DHIS2
+receives one value per period instead of one per day (see `window` for the vectorized
+period computations).
+
+Weeks follow the ISO rule for each start day: week 1 is the week containing January 4th,
+and a week belongs to the year in which it has at least four days. Bi-weeks are pairs of
+ISO weeks, so in years with 53 weeks the last bi-week has a single week.
+"""
+
+import re
+from datetime import date, timedelta
+from enum import StrEnum
+
+
+class PeriodType(StrEnum):
+    """DHIS2 period types that values can be aggregated to."""
+
+    DAILY = "Daily"
+    WEEKLY = "Weekly"
+    WEEKLY_WEDNESDAY = "WeeklyWednesday"
+    WEEKLY_THURSDAY = "WeeklyThursday"
+    WEEKLY_SATURDAY = "WeeklySaturday"
+    WEEKLY_SUNDAY = "WeeklySunday"
+    BI_WEEKLY = "BiWeekly"
+    MONTHLY = "Monthly"
+
+
+# First day of weekly periods (Monday = 0) and the prefix of their week number in period IDs
+WEEK_STARTS: dict[PeriodType, tuple[int, str]] = {
+    PeriodType.WEEKLY: (0, "W"),
+    PeriodType.WEEKLY_WEDNESDAY: (2, "WedW"),
+    PeriodType.WEEKLY_THURSDAY: (3, "ThuW"),
+    PeriodType.WEEKLY_SATURDAY: (5, "SatW"),
+    PeriodType.WEEKLY_SUNDAY: (6, "SunW"),
+    PeriodType.BI_WEEKLY: (0, "BiW"),
+}
+
+_WEEK_PERIOD = re.compile(r"^(\d{4})(W|WedW|ThuW|SatW|SunW|BiW)(\d{1,2})$")
+
+
+def period_start(period_id: str) -> date:
+    """Get the first day of a DHIS2 daily, weekly, bi-weekly or monthly period."""
+    if len(period_id) == 8 and period_id.isdigit():
+        return date(int(period_id[:4]), int(period_id[4:6]), int(period_id[6:8]))
+    if len(period_id) == 6 and period_id.isdigit():
+        return date(int(period_id[:4]), int(period_id[4:6]), 1)
+    match = _WEEK_PERIOD.match(period_id)
+    if match is None:
+        raise ValueError(f"Unsupported DHIS2 period: {period_id}")
+
+    year, prefix, number = int(match[1]), match[2], int(match[3])
+    period_type = next(t for t, (_, p) in WEEK_STARTS.items() if p == prefix)
+    first_weekday, _ = WEEK_STARTS[period_type]
+    january_4th = date(year, 1, 4)
+    first_week = january_4th - timedelta(days=(january_4th.weekday() - first_weekday) % 7)
+    week = 2 * number - 1 if period_type == PeriodType.BI_WEEKLY else number
+    return first_week + timedelta(weeks=week - 1)
@@ -0,0 +1,143 @@
+"""Staged pipeline overlapping downloads, aggregation and upload.
+
+Items (months) are downloaded on a thread pool, aggregated on a process pool and handed
+to the uploader in their original order. At most `max_pending` items are in flight at
+once, which bounds memory use: a new download only starts when an earlier item has been
+taken by the uploader.
+"""
+
+import logging
+import multiprocessing
+from collections import deque
+from collections.abc import Callable, Iterable
+from concurrent.futures import CancelledError, Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, TypeVar
+
+from dhis2_era5land.timing import add_stage_stats, call_timed
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+D = TypeVar("D")
+R = TypeVar("R")
+
+_DONE = object()
+
+
+def _init_worker(level: int, fmt: str, datefmt: str | None) -> None:
+    """Configure logging in an aggregation process like in the parent process."""
+    logging.basicConfig(level=level, format=fmt, datefmt=datefmt)
+
+
+def _logging_config() -> tuple[int, str, str | None]:
+    root = logging.getLogger()
+    formatter = root.handlers[0].formatter if root.handlers else None
+    if formatter is None or formatter._fmt is None:
+        return root.level, logging.BASIC_FORMAT, None
+    return root.level, formatter._fmt, formatter.datefmt
+
+
+def create_aggregation_pool(workers: int) -> ProcessPoolExecutor:
+    """Create a process pool for aggregation, with logging configured like in this process."""
+    # spawn avoids forking a process that may be running other threads (e.g. the API server)
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=_logging_config(),
+    )
+
+
+def _set_from_timed(target: Future[Any], source: Future[Any]) -> None:
+    """Copy the outcome of a `call_timed` future into another, adding its stage statistics here."""
+    if source.cancelled():
+        target.set_exception(CancelledError())
+        return
+    exc = source.exception()
+    if exc is not None:
+        target.set_exception(exc)
+        return
+    result, stats = source.result()
+    add_stage_stats(stats)
+    target.set_result(result)
+
+
+def run_pipeline(
+    items: Iterable[T],
+    download: Callable[[T], D],
+    aggregate: Callable[[D], R],
+    upload: Callable[[T, R], None],
+    download_workers: int = 1,
+    aggregation_workers: int = 0,
+    max_pending: int = 2,
+    aggregation_pool: Executor | None = None,
+) -> None:
+    """Run download, aggregate and upload for each item, uploading in item order.
+
+    Args:
+        items: Items to process, in the order they should be uploaded.
+        download: Fetches the data for an item. Runs on a thread pool.
+        aggregate: Reduces downloaded data. Runs on a process pool, so it must be picklable.
+        upload: Receives each item with its aggregated result, in order, on the calling thread.
+        download_workers: Number of concurrent downloads.
+        aggregation_workers: Number of aggregation processes. With 0, aggregation runs
+            on the download threads instead.
+        max_pending: Maximum number of items downloaded or aggregated ahead of the uploader.
+        aggregation_pool: Process pool to aggregate on instead of starting one for this run
+            (`aggregation_workers` is then ignored). It is left running when the run ends,
+            so its processes keep their state, such as org unit weights, between runs.
+    """
+    max_pending = max(max_pending, download_workers, 1)
+
+    downloads = ThreadPoolExecutor(max_workers=max(download_workers, 1), thread_name_prefix="download")
+    aggregations: Executor | None = aggregation_pool
+    if aggregation_pool is None and aggregation_workers > 0:
+        aggregations = create_aggregation_pool(aggregation_workers)
+
+    def submit(item: T) -> Future[R]:
+        result: Future[R] = Future()
+
+        def on_downloaded(download_future: Future[D]) -> None:
+            if not result.set_running_or_notify_cancel():
+                return
+            try:
+                data = download_future.result()
+                if aggregations is None:
+                    result.set_result(aggregate(data))
+                else:
+                    future = aggregations.submit(call_timed, aggregate, data)
+                    future.add_done_callback(lambda f: _set_from_timed(result, f))
+            except BaseException as exc:
+                result.set_exception(exc)
+
+        downloads.submit(download, item).add_done_callback(on_downloaded)
+        return result
+
+    remaining = iter(items)
+    pending: deque[tuple[T, Future[R]]] = deque()
+    failed = False
+    try:
+        for item in remaining:
+            pending.append((item, submit(item)))
+            if len(pending) >= max_pending:
+                break
+
+        while pending:
+            item, future = pending.popleft()
+            result = future.result()
+
+            # keep the download stage busy while this item is uploaded
+            next_item = next(remaining, _DONE)
+            if next_item is not _DONE:
+                pending.append((next_item, submit(next_item)))  # type: ignore[arg-type]
+
+            upload(item, result)
+    except BaseException:
+        failed = True
+        for _, future in pending:
+            future.cancel()
+        raise
+    finally:
+        downloads.shutdown(wait=True, cancel_futures=failed)
+        if aggregations is not None and aggregations is not aggregation_pool:
+            aggregations.shutdown(wait=True, cancel_futures=failed)
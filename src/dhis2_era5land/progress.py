@@ -0,0 +1,39 @@
+"""Progress reporting and cancellation of running imports."""
+
+import threading
+from dataclasses import dataclass, field
+
+
+class ImportCancelled(Exception):
+    """Raised inside an import when it has been cancelled."""
+
+
+@dataclass
+class ImportProgress:
+    """Progress of one import, updated by the importer and read from other threads."""
+
+    windows_total: int = 0
+    windows_done: int = 0
+    values_posted: int = 0
+    current: str | None = None  # Window being imported
+    _cancel: threading.Event = field(default_factory=threading.Event, repr=False)
+
+    @property
+    def cancelled(self) -> bool:
+        """Whether cancellation was requested."""
+        return self._cancel.is_set()
+
+    def cancel(self) -> None:
+        """Request cancellation; the import stops at the next window boundary."""
+        self._cancel.set()
+
+    def check_cancelled(self) -> None:
+        """Raise `ImportCancelled` if cancellation was requested."""
+        if self._cancel.is_set():
+            raise ImportCancelled("Import was cancelled")
+
+    def window_done(self, values_posted: int) -> None:
+        """Record that the current window was imported."""
+        self.windows_done += 1
+        self.values_posted += values_posted
+        self.current = None
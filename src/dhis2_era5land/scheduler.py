@@ -0,0 +1,148 @@
+"""In-process scheduler running imports on cron schedules.
+
+The scheduler is a long-lived process: each scheduled import is queued as a job (see
+`jobs`), and the DHIS2 session, org unit geometries, aggregation processes (with their
+org unit weights) and download cache are kept between runs instead of being rebuilt by a
+fresh process on every tick. A tick is skipped while the previous run of the same
+schedule is still queued or running.
+"""
+
+import logging
+import threading
+import time
+from collections.abc import Sequence
+from concurrent.futures import Executor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+
+import geopandas as gpd
+from dhis2_client import DHIS2Client
+
+from dhis2_era5land.cache import DownloadCache
+from dhis2_era5land.cron import CronSchedule
+from dhis2_era5land.importer import ImportOptions, import_era5_land_to_dhis2
+from dhis2_era5land.jobs import Job, JobManager
+from dhis2_era5land.orgunits import get_org_units
+from dhis2_era5land.pipeline import create_aggregation_pool
+from dhis2_era5land.progress import ImportProgress
+from dhis2_era5land.settings import ScheduleSpec, Settings, org_unit_levels
+from dhis2_era5land.upload import DHIS2Connection
+
+logger = logging.getLogger(__name__)
+
+
+class ScheduledImporter:
+    """Runs scheduled imports, keeping state that is expensive to rebuild between runs."""
+
+    def __init__(self, settings: Settings, schedules: Sequence[ScheduleSpec]) -> None:
+        """Connect to DHIS2 and open the download cache and aggregation processes."""
+        self._settings = settings
+        self._schedules = {schedule.name: schedule for schedule in schedules}
+        self._client = DHIS2Client(
+            base_url=settings.base_url,
+            username=settings.username,
+            password=settings.password,
+        )
+        self._connection = DHIS2Connection.from_settings(settings)
+        self._cache = None
+        if settings.cache_dir:
+            self._cache = DownloadCache(Path(settings.cache_dir), settings.cache_max_size_mb * 1024 * 1024)
+        self._pool: Executor | None = None
+        if settings.aggregation_workers > 0:
+            self._pool = create_aggregation_pool(settings.aggregation_workers)
+        self._org_units: dict[tuple[int, ...], tuple[float, gpd.GeoDataFrame]] = {}
+        self._lock = threading.Lock()
+
+    def org_units(self, level: int | Sequence[int]) -> gpd.GeoDataFrame:
+        """Get the org units of one or more levels, refreshing them once they are older than the refresh interval."""
+        levels = tuple(org_unit_levels(level))
+        with self._lock:
+            fetched, org_units = self._org_units.get(levels, (0.0, None))
+            if org_units is None or time.monotonic() - fetched > self._settings.org_unit_refresh_hours * 3600:
+                logger.info("Refreshing org units of level %s", ", ".join(map(str, levels)))
+                org_units_dir = self._cache.directory / "org-units" if self._cache is not None else None
+                org_units = get_org_units(self._client, levels, org_units_dir, self._settings.org_unit_simplify)
+                self._org_units[levels] = (time.monotonic(), org_units)
+            return org_units
+
+    def __call__(self, params: dict[str, Any], progress: ImportProgress) -> None:
+        """Run the scheduled import named in `params` (runs on a job worker thread)."""
+        schedule = self._schedules[params["schedule"]]
+        settings = self._settings
+        org_unit_level = schedule.org_unit_level or settings.org_unit_level
+        run_settings = settings.model_copy(
+            update={
+                "start_date": schedule.start_date or settings.start_date,
+                "end_date": schedule.end_date or settings.end_date,
+                "org_unit_level": org_unit_level,
+            }
+        )
+        options = ImportOptions.from_settings(
+            run_settings,
+            specs=schedule.variables or None,
+            client=self._client,
+            connection=self._connection,
+            cache=self._cache,
+        )
+        try:
+            import_era5_land_to_dhis2(
+                options,
+                progress=progress,
+                org_units=self.org_units(org_unit_level),
+                aggregation_pool=self._pool,
+            )
+        except BrokenProcessPool:
+            # an aggregation process died (e.g. out of memory); start new ones for the next run
+            logger.warning("Aggregation processes failed, restarting them")
+            with self._lock:
+                if self._pool is not None:
+                    self._pool.shutdown(wait=False, cancel_futures=True)
+                    self._pool = create_aggregation_pool(settings.aggregation_workers)
+            raise
+
+    def close(self) -> None:
+        """Stop the aggregation processes."""
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+
+
+class Scheduler:
+    """Queues imports as jobs when their cron schedules are due."""
+
+    def __init__(self, schedules: Sequence[ScheduleSpec], jobs: JobManager) -> None:
+        """Schedule imports, running them with `jobs`. Raises ValueError for invalid cron expressions."""
+        names = [schedule.name for schedule in schedules]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Schedule names must be unique: {', '.join(names)}")
+        self._entries = [(schedule, CronSchedule.parse(schedule.cron)) for schedule in schedules]
+        self._jobs = jobs
+
+    def submit(self, schedule: ScheduleSpec) -> Job | None:
+        """Queue a scheduled import, unless its previous run is still queued or running."""
+        job, created = self._jobs.submit({"schedule": schedule.name})
+        if not created:
+            logger.warning("Skipping scheduled import %s: job %s is still %s", schedule.name, job.id, job.status)
+            return None
+        logger.info("Queued scheduled import %s as job %s", schedule.name, job.id)
+        return job
+
+    def run(self, stop: threading.Event) -> None:
+        """Queue imports when they are due, until `stop` is set."""
+        now = datetime.now()
+        upcoming = {schedule.name: cron.next_after(now) for schedule, cron in self._entries}
+        for schedule, _ in self._entries:
+            logger.info(
+                "Scheduled import %s (%s), next run at %s", schedule.name, schedule.cron, upcoming[schedule.name]
+            )
+
+        while True:
+            wait = (min(upcoming.values()) - datetime.now()).total_seconds()
+            if stop.wait(max(wait, 0)):
+                return
+            now = datetime.now()
+            for schedule, cron in self._entries:
+                if upcoming[schedule.name] <= now:
+                    self.submit(schedule)
+                    upcoming[schedule.name] = cron.next_after(now)
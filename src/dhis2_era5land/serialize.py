@@ -0,0 +1,240 @@
+"""Streaming serialization of data values for the DHIS2 dataValueSets API.
+
+Org unit IDs, data elements and periods are dictionary-encoded, with each distinct string
+formatted once, and values stay floats. Rows are decoded and formatted with vectorized
+NumPy string operations in chunks, and written out as JSON or DHIS2 CSV, optionally
+gzip-compressed. Nothing holds more than one chunk of text at a time, so memory stays flat
+however many values a month has.
+"""
+
+import zlib
+from collections.abc import Callable, Iterable, Iterator
+from dataclasses import dataclass
+from enum import StrEnum
+from typing import Any
+
+import numpy as np
+import pandas as pd
+
+# Rows serialized per chunk of the request body
+CHUNK_ROWS = 10_000
+
+# DHIS2 CSV columns; empty category option combos mean the default combo
+CSV_HEADER = "dataelement,period,orgunit,categoryoptioncombo,attributeoptioncombo,value\n"
+
+
+class PayloadFormat(StrEnum):
+    """Available dataValueSets payload formats."""
+
+    JSON = "json"
+    CSV = "csv"
+
+
+CONTENT_TYPES = {
+    PayloadFormat.JSON: "application/json",
+    PayloadFormat.CSV: "application/csv",
+}
+
+
+def format_values(values: np.ndarray) -> np.ndarray:
+    """Format numbers as plain decimal strings (DHIS2 doesn't accept scientific notation)."""
+    formatted = np.char.mod("%.10f", np.asarray(values, dtype=np.float64))
+    return np.char.rstrip(np.char.rstrip(formatted, "0"), ".")
+
+
+def format_periods(periods: np.ndarray) -> np.ndarray:
+    """Format timestamps as DHIS2 daily periods (YYYYMMDD); strings are passed through."""
+    periods = np.asarray(periods)
+    if np.issubdtype(periods.dtype, np.datetime64):
+        return np.char.replace(np.datetime_as_string(periods, unit="D"), "-", "")
+    return periods.astype(str)
+
+
+def _code_dtype(n: int) -> np.dtype:
+    # smallest signed integer type that can index n labels
+    return np.min_scalar_type(-max(n, 1))
+
+
+@dataclass
+class EncodedColumn:
+    """Strings stored as integer codes into their distinct values (dictionary encoding).
+
+    Org unit IDs, data elements and periods repeat across the values of a month, so each
+    distinct string is formatted and held once, and each value only holds a small code.
+    Rows are decoded to strings a chunk at a time while they are serialized.
+    """
+
+    codes: np.ndarray
+    labels: np.ndarray
+
+    @classmethod
+    def encode(cls, values: Any, format_labels: Callable[[np.ndarray], np.ndarray] | None = None) -> "EncodedColumn":
+        """Dictionary-encode an array or Series, reusing the codes of a pandas Categorical.
+
+        `format_labels` formats the distinct values as strings (default `str`).
+        """
+        values = values.array if isinstance(values, pd.Series) else values
+        if isinstance(values, pd.Categorical):
+            codes, labels = values.codes, np.asarray(values.categories)
+        else:
+            codes, labels = pd.factorize(np.asarray(values))
+        labels = format_labels(labels) if format_labels is not None else labels.astype(str)
+        return cls(codes=codes.astype(_code_dtype(len(labels)), copy=False), labels=np.asarray(labels, dtype=str))
+
+    def __len__(self) -> int:
+        """Number of rows."""
+        return len(self.codes)
+
+    def __getitem__(self, index: Any) -> np.ndarray:
+        """Decode rows to strings."""
+        return np.asarray(self.labels[self.codes[index]])
+
+    def take(self, mask: np.ndarray) -> "EncodedColumn":
+        """Select rows with a boolean mask or index array, keeping the labels."""
+        return EncodedColumn(codes=self.codes[mask], labels=self.labels)
+
+    def unique(self) -> np.ndarray:
+        """Distinct strings of the rows, sorted."""
+        return np.sort(self.labels[np.unique(self.codes)])
+
+    def categorical(self) -> pd.Categorical:
+        """The rows as a pandas Categorical sharing the codes."""
+        return pd.Categorical.from_codes(self.codes, categories=self.labels)
+
+    def str_len(self) -> np.ndarray:
+        """Length of the string of each row."""
+        return np.asarray(np.char.str_len(self.labels)[self.codes])
+
+
+def _encoded(column: EncodedColumn | np.ndarray) -> EncodedColumn:
+    return column if isinstance(column, EncodedColumn) else EncodedColumn.encode(column)
+
+
+@dataclass(init=False)
+class DataValueColumns:
+    """Data values as parallel columns: dictionary-encoded strings and float values.
+
+    Plain arrays passed for the string columns are encoded, and values are formatted as
+    strings only when they are serialized, so a data value takes about a dozen bytes
+    instead of a formatted string per column.
+    """
+
+    data_elements: EncodedColumn
+    org_units: EncodedColumn
+    periods: EncodedColumn
+    values: np.ndarray
+
+    def __init__(
+        self,
+        data_elements: EncodedColumn | np.ndarray,
+        org_units: EncodedColumn | np.ndarray,
+        periods: EncodedColumn | np.ndarray,
+        values: np.ndarray,
+    ) -> None:
+        """Take the columns, encoding string columns given as plain arrays and storing values as floats."""
+        self.data_elements = _encoded(data_elements)
+        self.org_units = _encoded(org_units)
+        self.periods = _encoded(periods)
+        self.values = np.asarray(values).astype(np.float64, copy=False)
+
+    def __len__(self) -> int:
+        """Number of data values."""
+        return len(self.values)
+
+    @classmethod
+    def from_dataframe(
+        cls,
+        df: pd.DataFrame,
+        data_element_col: str,
+        org_unit_col: str,
+        period_col: str,
+        value_col: str,
+    ) -> "DataValueColumns":
+        """Take the data element, org unit, period and value columns of a DataFrame.
+
+        Categorical columns keep their codes, so nothing is copied per row but the values.
+        """
+        return cls(
+            data_elements=EncodedColumn.encode(df[data_element_col]),
+            org_units=EncodedColumn.encode(df[org_unit_col]),
+            periods=EncodedColumn.encode(df[period_col], format_periods),
+            values=df[value_col].to_numpy(dtype=np.float64),
+        )
+
+    def take(self, mask: np.ndarray) -> "DataValueColumns":
+        """Select data values with a boolean mask or index array."""
+        return DataValueColumns(
+            data_elements=self.data_elements.take(mask),
+            org_units=self.org_units.take(mask),
+            periods=self.periods.take(mask),
+            values=self.values[mask],
+        )
+
+    def row_bytes(self) -> np.ndarray:
+        """Approximate serialized size of each data value."""
+        value_lengths = [
+            np.char.str_len(format_values(self.values[start : start + CHUNK_ROWS]))
+            for start in range(0, len(self), CHUNK_ROWS)
+        ]
+        lengths: np.ndarray = (
+            self.data_elements.str_len()
+            + self.org_units.str_len()
+            + self.periods.str_len()
+            + np.concatenate(value_lengths or [np.zeros(0, dtype=np.int64)])
+        )
+        return lengths + 60  # keys, quotes and separators
+
+
+def _json_rows(columns: DataValueColumns, start: int, stop: int) -> str:
+    rows = np.char.add('{"dataElement":"', columns.data_elements[start:stop])
+    rows = np.char.add(rows, '","period":"')
+    rows = np.char.add(rows, columns.periods[start:stop])
+    rows = np.char.add(rows, '","orgUnit":"')
+    rows = np.char.add(rows, columns.org_units[start:stop])
+    rows = np.char.add(rows, '","value":"')
+    rows = np.char.add(rows, format_values(columns.values[start:stop]))
+    rows = np.char.add(rows, '"}')
+    return ",".join(rows.tolist())
+
+
+def _csv_rows(columns: DataValueColumns, start: int, stop: int) -> str:
+    rows = np.char.add(columns.data_elements[start:stop], ",")
+    rows = np.char.add(rows, columns.periods[start:stop])
+    rows = np.char.add(rows, ",")
+    rows = np.char.add(rows, columns.org_units[start:stop])
+    rows = np.char.add(rows, ",,,")
+    rows = np.char.add(rows, format_values(columns.values[start:stop]))
+    return "\n".join(rows.tolist()) + "\n"
+
+
+def iter_payload(
+    columns: DataValueColumns,
+    start: int = 0,
+    stop: int | None = None,
+    payload_format: PayloadFormat = PayloadFormat.JSON,
+    chunk_rows: int = CHUNK_ROWS,
+) -> Iterator[bytes]:
+    """Serialize rows `start:stop` as a dataValueSets payload, one chunk at a time."""
+    stop = len(columns) if stop is None else stop
+    if payload_format == PayloadFormat.CSV:
+        yield CSV_HEADER.encode()
+        for chunk_start in range(start, stop, chunk_rows):
+            yield _csv_rows(columns, chunk_start, min(chunk_start + chunk_rows, stop)).encode()
+        return
+
+    yield b'{"dataValues":['
+    for chunk_start in range(start, stop, chunk_rows):
+        if chunk_start > start:
+            yield b","
+        yield _json_rows(columns, chunk_start, min(chunk_start + chunk_rows, stop)).encode()
+    yield b"]}"
+
+
+def gzip_chunks(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """Gzip-compress a stream of chunks."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
@@ -1,48 +1,29 @@
 """FastAPI server for ERA5-Land to DHIS2 import."""
 
 import logging
-import os
 from collections.abc import AsyncGenerator
 from contextlib import asynccontextmanager
+from typing import Any
 
-from dhis2_client import DHIS2Client
-from fastapi import BackgroundTasks, FastAPI, Query
+from fastapi import FastAPI, HTTPException, Query
+from fastapi.responses import PlainTextResponse
 
-from dhis2_era5land.importer import import_era5_land_to_dhis2
-from dhis2_era5land.models import HealthResponse, ImportResponse
-from dhis2_era5land.settings import cds_settings, settings
-from dhis2_era5land.transforms import get_transform
+from dhis2_era5land.jobs import Job, JobManager
+from dhis2_era5land.metrics import CONTENT_TYPE, render_prometheus
+from dhis2_era5land.models import HealthResponse, ImportResponse, JobResponse, StageResponse
+from dhis2_era5land.progress import ImportProgress
+from dhis2_era5land.settings import settings, validate_settings
 
 logger = logging.getLogger(__name__)
 
 
-def validate_settings() -> None:
-    """Validate required settings at startup."""
-    missing: list[str] = []
-    if not cds_settings.key:
-        missing.append("CDSAPI_KEY")
-    if not settings.base_url:
-        missing.append("DHIS2_BASE_URL")
-    if not settings.username:
-        missing.append("DHIS2_USERNAME")
-    if not settings.password:
-        missing.append("DHIS2_PASSWORD")
-    if not settings.data_element_id:
-        missing.append("DHIS2_DATA_ELEMENT_ID")
-    if missing:
-        raise ValueError(f"Missing required environment variables: {', '.join(missing)}")
-
-    # Export CDS settings to environment for cdsapi library
-    os.environ["CDSAPI_URL"] = cds_settings.url
-    os.environ["CDSAPI_KEY"] = cds_settings.key  # type: ignore[assignment]  # validated above
-
-
 @asynccontextmanager
 async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
-    """Validate settings on startup."""
+    """Validate settings on startup and cancel import jobs on shutdown."""
     validate_settings()
     logger.info("Settings validated, server starting")
     yield
+    jobs.shutdown()
 
 
 app = FastAPI(
@@ -58,42 +39,74 @@ def health() -> HealthResponse:
     return HealthResponse(status="ok")
 
 
-def do_import(dry_run: bool) -> None:
-    """Execute the import (runs in background)."""
-    try:
-        client = DHIS2Client(
-            base_url=settings.base_url,
-            username=settings.username,
-            password=settings.password,
-        )
-
-        value_func = get_transform(settings.value_transform)
-
-        import_era5_land_to_dhis2(
-            client=client,
-            variable=settings.variable,
-            data_element_id=settings.data_element_id,  # type: ignore[arg-type]
-            value_col=settings.value_col,
-            value_func=value_func,
-            temporal_aggregation=settings.temporal_aggregation,
-            spatial_aggregation=settings.spatial_aggregation,
-            start_date=settings.start_date,
-            end_date=settings.end_date,
-            timezone_offset=settings.timezone_offset,
-            org_unit_level=settings.org_unit_level,
-            dry_run=dry_run,
-        )
-        logger.info("Import completed successfully")
-
-    except Exception:
-        logger.exception("Import failed")
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics() -> PlainTextResponse:
+    """Prometheus metrics of import stages and runs."""
+    return PlainTextResponse(render_prometheus(), media_type=CONTENT_TYPE)
+
+
+def do_import(params: dict[str, Any], progress: ImportProgress) -> None:
+    """Run the import with settings from the environment (runs on a job worker thread)."""
+    # imported here so the server starts (and answers /health) without loading the scientific stack
+    from dhis2_era5land.importer import ImportOptions, import_era5_land_to_dhis2
+
+    options = ImportOptions.from_settings(settings, dry_run=bool(params.get("dry_run", False)))
+    import_era5_land_to_dhis2(options, progress=progress)
+
+
+jobs = JobManager(do_import, workers=settings.job_workers, history=settings.job_history)
+
+
+def import_target() -> dict[str, Any]:
+    """The settings an import job runs with, identifying what it imports and where."""
+    return settings.model_dump(mode="json", exclude={"password"})
+
+
+def _job_response(job: Job) -> JobResponse:
+    return JobResponse(
+        id=job.id,
+        status=job.status,
+        dry_run=bool(job.params.get("dry_run", False)),
+        created=job.created,
+        started=job.started,
+        finished=job.finished,
+        error=job.error,
+        windows_total=job.progress.windows_total,
+        windows_done=job.progress.windows_done,
+        values_posted=job.progress.values_posted,
+        current_window=job.progress.current,
+        stages={stage: StageResponse(**vars(stats)) for stage, stats in job.stages().items()},
+    )
 
 
 @app.post("/$import", response_model=ImportResponse)
-def run_import(
-    background_tasks: BackgroundTasks,
-    dryRun: bool = Query(default=False),
-) -> ImportResponse:
-    """Start an import in the background. All config from environment."""
-    background_tasks.add_task(do_import, dryRun)
-    return ImportResponse(status="started", message="Import started in background")
+def run_import(dryRun: bool = Query(default=False)) -> ImportResponse:
+    """Queue an import job. All config from environment."""
+    job, created = jobs.submit({"dry_run": dryRun}, import_target())
+    if not created:
+        return ImportResponse(status="duplicate", message="Identical import already queued or running", job_id=job.id)
+    return ImportResponse(status="started", message="Import started in background", job_id=job.id)
+
+
+@app.get("/jobs", response_model=list[JobResponse])
+def list_jobs() -> list[JobResponse]:
+    """List import jobs, newest first."""
+    return [_job_response(job) for job in jobs.jobs()]
+
+
+@app.get("/jobs/{job_id}", response_model=JobResponse)
+def get_job(job_id: str) -> JobResponse:
+    """Get the status and progress of an import job."""
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return _job_response(job)
+
+
+@app.delete("/jobs/{job_id}", response_model=JobResponse)
+def cancel_job(job_id: str) -> JobResponse:
+    """Cancel a queued or running import job."""
+    job = jobs.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return _job_response(job)
@@ -1,8 +1,14 @@
 """Configuration for ERA5-Land to DHIS2 import."""
 
+import os
+from collections.abc import Callable, Sequence
+from typing import Any, Literal
+
+from pydantic import BaseModel
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
-from dhis2_era5land.transforms import Transform
+from dhis2_era5land.periods import PeriodType
+from dhis2_era5land.transforms import Transform, get_transform
 
 
 class CDSSettings(BaseSettings):
@@ -17,6 +23,64 @@ class CDSSettings(BaseSettings):
     key: str | None = None
 
 
+class VariableSpec(BaseModel):
+    """One ERA5-Land variable imported into one DHIS2 data element."""
+
+    variable: str
+    data_element_id: str
+    value_col: str
+    value_transform: Transform = Transform.IDENTITY
+    value_scale: float = 1.0
+    value_offset: float = 0.0
+    temporal_aggregation: str = "mean"
+    spatial_aggregation: str = "mean"
+    period_type: PeriodType = PeriodType.DAILY  # DHIS2 period type of the data element
+
+    def value_func(self) -> Callable[[Any], Any]:
+        """Get the transform function for the values of this variable."""
+        return get_transform(self.value_transform, scale=self.value_scale, offset=self.value_offset)
+
+
+class ScheduleSpec(BaseModel):
+    """An import run by the scheduler on its own cron schedule.
+
+    Unset fields default to the corresponding settings.
+    """
+
+    name: str
+    cron: str
+    variables: list[VariableSpec] = []
+    org_unit_level: int | list[int] | None = None
+    start_date: str | None = None
+    end_date: str | None = None
+
+
+class InstanceSpec(BaseModel):
+    """A DHIS2 instance imported by the fan-out command.
+
+    The password is read from the environment variable named in `password_env`, so
+    instance lists hold no secrets. Unset fields default to the corresponding settings;
+    the ledger and the value store are only used when set for the instance.
+    """
+
+    name: str
+    base_url: str
+    username: str
+    password_env: str
+    variables: list[VariableSpec] = []
+    org_unit_level: int | list[int] | None = None
+    timezone_offset: int | None = None
+    ledger_path: str | None = None
+    store_dir: str | None = None
+
+    def password(self) -> str:
+        """Get the password from the environment. Raises ValueError if it is not set."""
+        password = os.environ.get(self.password_env)
+        if not password:
+            raise ValueError(f"{self.password_env} environment variable is required for instance {self.name}")
+        return password
+
+
 class Settings(BaseSettings):
     """Settings for ERA5-Land to DHIS2 import.
 
@@ -36,10 +100,16 @@ class Settings(BaseSettings):
     data_element_id: str | None = None  # Required at runtime
     value_col: str = "tp"
     value_transform: Transform = Transform.METERS_TO_MILLIMETERS
+    value_scale: float = 1.0  # Applied after value_transform
+    value_offset: float = 0.0  # Applied after value_scale
+
+    # Several variables in one import, as a JSON list of variable specs (replaces the settings above)
+    variables: list[VariableSpec] = []
 
     # Aggregation settings
     temporal_aggregation: str = "sum"
     spatial_aggregation: str = "mean"
+    period_type: PeriodType = PeriodType.DAILY  # DHIS2 period type of the data element
 
     # Date range
     start_date: str = "2025-01-01"
@@ -47,12 +117,119 @@ class Settings(BaseSettings):
 
     # Other settings
     timezone_offset: int = 0
-    org_unit_level: int = 2
+    org_unit_level: int | list[int] = 2  # One level, or a JSON list of levels imported together
+    org_unit_simplify: float = 0.0  # Simplify org unit geometries to this tolerance in degrees (0 = keep)
+
+    # Download cache (disabled when cache_dir is not set)
+    cache_dir: str | None = None
+    cache_max_size_mb: int = 10_000
+
+    # Ledger of values sent to DHIS2, to skip unchanged values (disabled when not set)
+    ledger_path: str | None = None
+    ledger_tolerance: float = 1e-6
+
+    # Store of aggregated values, as Parquet or Arrow IPC files (disabled when store_dir is not set)
+    store_dir: str | None = None
+    store_format: Literal["parquet", "arrow"] = "parquet"
+    store_only: bool = False  # Only store values, without posting them to DHIS2
+
+    # Pipeline concurrency
+    download_concurrency: int = 2  # Concurrent CDS requests
+    download_tiles: int = 0  # Download up to this many tiles around the org units (0 = one bbox)
+    aggregation_workers: int = 1  # Aggregation processes (0 = aggregate on download threads)
+    max_pending_months: int = 3  # Months downloaded/aggregated ahead of the upload
+
+    # Out-of-core aggregation with dask (disabled when chunk_hours is 0)
+    chunk_hours: int = 0  # Hours per chunk
+    chunk_cells: int = 256  # Grid cells per chunk along latitude and longitude
+    chunk_threads: int = 0  # Threads computing chunks (0 = one per core)
+
+    # Upload to DHIS2
+    upload_batch_size: int = 50_000  # Max data values per request
+    upload_batch_bytes: int = 0  # Max estimated payload bytes per request (0 = no limit)
+    upload_concurrency: int = 2  # Batches posted at the same time
+    upload_async: bool = False  # Use DHIS2 async import jobs
+    upload_max_retries: int = 3  # Retries per failed batch
+    upload_timeout: float = 600.0  # Seconds to wait for DHIS2 to respond to a batch
+    upload_format: Literal["json", "csv"] = "json"  # dataValueSets payload format
+    upload_gzip: bool = False  # Gzip request bodies
+    upload_connections: int = 0  # Connections shared by batches posted with asyncio (0 = a thread per batch)
+    upload_http2: bool = False  # Post with asyncio over HTTP/2 (needs the h2 package)
+
+    # Fan-out to several DHIS2 instances sharing downloads
+    instances: list[InstanceSpec] = []  # JSON list of instances
+    cds_concurrency: int = 2  # CDS requests in flight across all instances
+
+    # API server import jobs
+    job_workers: int = 1  # Imports run at the same time (more jobs are queued)
+    job_history: int = 100  # Finished jobs kept for GET /jobs
+
+    # Checkpoint of the backfill command, recording the windows already imported
+    backfill_checkpoint: str = "backfill-checkpoint.json"
+
+    # JSON summary of each CLI run, with per-stage statistics (not written when not set)
+    run_summary: str | None = None
 
     # Scheduler
     cron: str = "0 1 * * *"  # Daily at 1am
+    schedules: list[ScheduleSpec] = []  # Several imports on their own schedules (replaces cron)
+    org_unit_refresh_hours: float = 24  # Org units are fetched again from DHIS2 after this long
+
+    def variable_specs(self) -> list[VariableSpec]:
+        """Get the variables to import, from `variables` or the single variable settings."""
+        if self.variables:
+            return self.variables
+        if not self.data_element_id:
+            raise ValueError("DHIS2_DATA_ELEMENT_ID or DHIS2_VARIABLES is required")
+        return [
+            VariableSpec(
+                variable=self.variable,
+                data_element_id=self.data_element_id,
+                value_col=self.value_col,
+                value_transform=self.value_transform,
+                value_scale=self.value_scale,
+                value_offset=self.value_offset,
+                temporal_aggregation=self.temporal_aggregation,
+                spatial_aggregation=self.spatial_aggregation,
+                period_type=self.period_type,
+            )
+        ]
+
+    def schedule_specs(self) -> list[ScheduleSpec]:
+        """Get the scheduled imports, from `schedules` or `cron` with the import settings."""
+        return self.schedules or [ScheduleSpec(name="default", cron=self.cron)]
+
+
+def org_unit_levels(org_unit_level: int | Sequence[int]) -> list[int]:
+    """Get the org unit levels to import, from one level or several."""
+    return [org_unit_level] if isinstance(org_unit_level, int) else list(org_unit_level)
 
 
 # Default settings instances
 cds_settings = CDSSettings()
 settings = Settings()
+
+
+def validate_settings(require_variables: bool = True) -> None:
+    """Validate the settings required to run imports, and export the CDS settings for cdsapi.
+
+    Pass `require_variables=False` when the variables to import are given otherwise.
+    """
+    missing: list[str] = []
+    if not cds_settings.key:
+        missing.append("CDSAPI_KEY")
+    if not settings.base_url:
+        missing.append("DHIS2_BASE_URL")
+    if not settings.username:
+        missing.append("DHIS2_USERNAME")
+    if not settings.password:
+        missing.append("DHIS2_PASSWORD")
+    scheduled_variables = bool(settings.schedules) and all(spec.variables for spec in settings.schedules)
+    if require_variables and not settings.data_element_id and not settings.variables and not scheduled_variables:
+        missing.append("DHIS2_DATA_ELEMENT_ID (or DHIS2_VARIABLES)")
+    if missing:
+        raise ValueError(f"Missing required environment variables: {', '.join(missing)}")
+
+    # Export CDS settings to environment for cdsapi library
+    os.environ["CDSAPI_URL"] = cds_settings.url
+    os.environ["CDSAPI_KEY"] = cds_settings.key  # type: ignore[assignment]  # validated above
@@ -0,0 +1,281 @@
+"""Outputs of aggregated values: DHIS2 and a columnar store on disk.
+
+The values of each window are written to every sink of an import, one org unit level at a
+time. The DHIS2 sink posts them as data value sets. The store sink writes them as Parquet or
+Arrow IPC files partitioned by data element and month, with org unit IDs and periods
+dictionary-encoded, so values can be checked, or imported into another DHIS2 instance with
+`import_from_store`, without downloading and aggregating them again. Reading the store
+needs neither CDS nor geopandas.
+
+Parquet and Arrow IPC files are written with pyarrow, which has to be installed separately.
+"""
+
+import logging
+import re
+from collections.abc import Sequence
+from datetime import date
+from pathlib import Path
+from typing import Any, Protocol
+
+import numpy as np
+import pandas as pd
+
+from dhis2_era5land.ledger import ValueLedger
+from dhis2_era5land.progress import ImportProgress
+from dhis2_era5land.serialize import DataValueColumns
+from dhis2_era5land.timing import timed
+from dhis2_era5land.upload import DHIS2Connection, UploadOptions, post_data_values, require_http2
+
+logger = logging.getLogger(__name__)
+
+# File suffix of each store format
+STORE_SUFFIXES: dict[str, str] = {"parquet": ".parquet", "arrow": ".arrow"}
+
+# Columns of stored values (the data element is part of the partition path)
+STORE_COLUMNS = ["id", "period", "valid_time", "value"]
+
+_PARTITION = re.compile(r"data_element=(?P<data_element>[^/]+)/month=(?P<month>\d{4}-\d{2})/level-(?P<level>\d+)\.")
+
+
+class Sink(Protocol):
+    """Receives the aggregated values of each window."""
+
+    def write(self, values: pd.DataFrame, month: date, level: int) -> int:
+        """Write the values of one window and org unit level, returning how many were written."""
+        ...
+
+
+def post_month(
+    connection: DHIS2Connection,
+    agg_df: pd.DataFrame,
+    dry_run: bool = False,
+    upload_options: UploadOptions | None = None,
+    ledger: ValueLedger | None = None,
+) -> int:
+    """Format one month of values and stream them to DHIS2 in batches.
+
+    With a ledger, only values that are new or changed since they were last sent are
+    posted, and they are recorded in the ledger once DHIS2 has accepted them. Batches with
+    values DHIS2 ignored (e.g. in locked periods) are not recorded, so they are sent again
+    by the next import. Returns the number of values posted.
+    """
+    # format columns once; payloads are serialized from them as they are sent
+    logger.info("Creating payload with %d values...", len(agg_df))
+    with timed("serialize") as span:
+        columns = DataValueColumns.from_dataframe(
+            agg_df,
+            data_element_col="data_element",
+            org_unit_col="id",
+            period_col="period",
+            value_col="value",
+        )
+        span.rows = len(columns)
+
+    # skip values that were already sent
+    if ledger is not None:
+        columns = columns.take(ledger.changed(columns))
+        logger.info("%d of %d values are new or changed", len(columns), len(agg_df))
+        if len(columns) == 0:
+            return 0
+
+    # import to dhis2
+    logger.info("Importing...")
+    accepted: list[tuple[int, int]] = []
+    with timed("post") as span:
+        import_count = post_data_values(
+            connection, columns, dry_run=dry_run, options=upload_options, on_accepted=accepted.append
+        )
+        span.rows = len(columns)
+    logger.info("Import results: %s", import_count)
+
+    if ledger is not None and not dry_run:
+        rows = np.concatenate([np.arange(start, stop) for start, stop in sorted(accepted)] or [np.arange(0)])
+        if len(rows) < len(columns):
+            logger.warning(
+                "DHIS2 ignored values in batches of %d values; they are not recorded and will be sent again",
+                len(columns) - len(rows),
+            )
+        ledger.record(columns.take(rows))
+    return len(columns)
+
+
+class DHIS2Sink:
+    """Posts values to DHIS2."""
+
+    def __init__(
+        self,
+        connection: DHIS2Connection,
+        dry_run: bool = False,
+        upload_options: UploadOptions | None = None,
+        ledger: ValueLedger | None = None,
+    ) -> None:
+        """Post over `connection`, skipping values unchanged since they were recorded in `ledger`."""
+        self.connection = connection
+        self.dry_run = dry_run
+        self.upload_options = upload_options
+        self.ledger = ledger
+
+    def write(self, values: pd.DataFrame, month: date, level: int) -> int:
+        """Post values to DHIS2 in batches."""
+        return post_month(self.connection, values, self.dry_run, self.upload_options, self.ledger)
+
+
+def _pyarrow() -> Any:
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError as exc:
+        raise ImportError("The value store needs pyarrow (pip install 'dhis2-era5land[store]')") from exc
+    return pyarrow
+
+
+def read_partition(path: Path) -> pd.DataFrame:
+    """Read the values of one store partition, with their data element from the path.
+
+    Raises ValueError if the path isn't laid out like a partition (see `StoreSink.path`).
+    """
+    match = _PARTITION.search(path.as_posix())
+    if match is None:
+        raise ValueError(f"Not a store partition: {path} (expected data_element=<id>/month=<YYYY-MM>/level-<n>)")
+    pa = _pyarrow()
+    if path.suffix == STORE_SUFFIXES["parquet"]:
+        table = pa.parquet.read_table(path)
+    else:
+        with pa.ipc.open_file(path) as reader:
+            table = reader.read_all()
+    values: pd.DataFrame = table.to_pandas()
+    data_element = pd.Categorical.from_codes(np.zeros(len(values), np.int8), [match["data_element"]])
+    values.insert(0, "data_element", data_element)
+    return values
+
+
+class StoreSink:
+    """Writes values to Parquet or Arrow IPC files partitioned by data element and month."""
+
+    def __init__(self, directory: Path, format: str = "parquet", dry_run: bool = False) -> None:
+        """Write partitions below `directory` in `format` (`parquet` or `arrow`), unless `dry_run`."""
+        if format not in STORE_SUFFIXES:
+            raise ValueError(f"Unsupported store format: {format}")
+        self.directory = directory
+        self.format = format
+        self.dry_run = dry_run
+        _pyarrow()
+
+    def path(self, data_element: str, month: date, level: int) -> Path:
+        """Path of the partition with the values of a data element, month and org unit level."""
+        suffix = STORE_SUFFIXES[self.format]
+        return self.directory / f"data_element={data_element}" / f"month={month:%Y-%m}" / f"level-{level}{suffix}"
+
+    def write(self, values: pd.DataFrame, month: date, level: int) -> int:
+        """Write values, replacing stored values of the same org unit and period."""
+        if self.dry_run:
+            logger.info("Dry run: not storing %d values for %s", len(values), f"{month:%Y-%m}")
+            return len(values)
+        with timed("store") as span:
+            for data_element, element_values in values.groupby("data_element", sort=False, observed=True):
+                path = self.path(str(data_element), month, level)
+                element_values = element_values[STORE_COLUMNS]
+                if path.exists():
+                    stored = read_partition(path)[STORE_COLUMNS]
+                    element_values = pd.concat([stored, element_values], ignore_index=True)
+                    element_values = element_values.drop_duplicates(["id", "period"], keep="last")
+                self._write(path, element_values.sort_values(["period", "id"], ignore_index=True))
+            span.rows = len(values)
+        logger.info("Stored %d values for %s", len(values), f"{month:%Y-%m}")
+        return len(values)
+
+    def _write(self, path: Path, values: pd.DataFrame) -> None:
+        pa = _pyarrow()
+        table = pa.table(
+            {
+                "id": pa.array(values["id"].astype("category")),
+                "period": pa.array(values["period"].astype("category")),
+                "valid_time": pa.array(values["valid_time"]),
+                "value": pa.array(values["value"], type=pa.float64()),
+            }
+        )
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.tmp")
+        if self.format == "parquet":
+            pa.parquet.write_table(table, tmp_path)
+        else:
+            with pa.ipc.new_file(tmp_path, table.schema) as writer:
+                writer.write_table(table)
+        tmp_path.replace(path)
+
+
+def create_sinks(
+    connection: DHIS2Connection,
+    dry_run: bool = False,
+    upload_options: UploadOptions | None = None,
+    ledger: ValueLedger | None = None,
+    store_dir: str | None = None,
+    store_format: str = "parquet",
+    store_only: bool = False,
+) -> list[Sink]:
+    """Create the sinks of an import: DHIS2 (unless `store_only`) and a store, if `store_dir` is set."""
+    sinks: list[Sink] = []
+    if upload_options is not None and upload_options.http2 and not store_only:
+        require_http2()
+    if not store_only:
+        sinks.append(DHIS2Sink(connection, dry_run=dry_run, upload_options=upload_options, ledger=ledger))
+    if store_dir:
+        sinks.append(StoreSink(Path(store_dir), store_format, dry_run=dry_run))
+    if not sinks:
+        raise ValueError("Storing values only requires a store directory")
+    return sinks
+
+
+def store_partitions(
+    directory: Path,
+    data_elements: Sequence[str] = (),
+    start_month: str | None = None,
+    end_month: str | None = None,
+    levels: Sequence[int] = (),
+) -> list[Path]:
+    """List store partitions in month order, optionally only of some data elements, months (YYYY-MM) and levels."""
+    partitions = []
+    for path in directory.glob("data_element=*/month=*/level-*.*"):
+        match = _PARTITION.search(path.as_posix())
+        if match is None or path.suffix not in STORE_SUFFIXES.values():
+            continue
+        if data_elements and match["data_element"] not in data_elements:
+            continue
+        if (start_month and match["month"] < start_month) or (end_month and match["month"] > end_month):
+            continue
+        if levels and int(match["level"]) not in levels:
+            continue
+        partitions.append((match["month"], match["data_element"], int(match["level"]), path))
+    return [path for *_, path in sorted(partitions)]
+
+
+def import_from_store(
+    connection: DHIS2Connection,
+    directory: Path,
+    data_elements: Sequence[str] = (),
+    start_month: str | None = None,
+    end_month: str | None = None,
+    levels: Sequence[int] = (),
+    dry_run: bool = False,
+    upload_options: UploadOptions | None = None,
+    ledger: ValueLedger | None = None,
+    progress: ImportProgress | None = None,
+) -> int:
+    """Post stored values to DHIS2, one partition at a time in month order. Returns the number of values posted."""
+    progress = progress if progress is not None else ImportProgress()
+    partitions = store_partitions(directory, data_elements, start_month, end_month, levels)
+    progress.windows_total = len(partitions)
+    logger.info("Importing %d partitions from %s", len(partitions), directory)
+
+    posted = 0
+    for path in partitions:
+        progress.check_cancelled()
+        progress.current = str(path.relative_to(directory))
+        with timed("read") as span:
+            values = read_partition(path)
+            span.rows = len(values)
+        count = post_month(connection, values, dry_run=dry_run, upload_options=upload_options, ledger=ledger)
+        posted += count
+        progress.window_done(count)
+    return posted
@@ -0,0 +1,187 @@
+"""Grid-aligned tiles covering only the grid cells of org units.
+
+A single bbox around all org units downloads every cell of the rectangle, which for
+countries with islands, long coastlines or diagonal shapes is mostly cells outside all
+org units. Tiles cover the ERA5-Land grid cells that intersect an org unit more tightly:
+starting from the bbox of those cells, the tile whose best split (by rows or columns,
+each part shrunk to its cells) saves most cells is split, as long as a split saves at
+least `min_saving` of its tile, up to `max_tiles` tiles. Tiles are downloaded as separate
+CDS requests and merged into one cube, with the cells between tiles missing (NaN).
+"""
+
+import heapq
+import math
+from dataclasses import dataclass
+
+import geopandas as gpd
+import numpy as np
+import shapely
+import xarray as xr
+
+from dhis2_era5land.cache import GRID_RESOLUTION, BBox
+
+# Grid cells per degree
+_CELLS_PER_DEGREE = round(1 / GRID_RESOLUTION)
+
+# A tile as a half-open range of rows and columns of the grid mask
+_Rect = tuple[int, int, int, int]
+
+
+def snap_bbox(bbox: BBox) -> BBox:
+    """Extend a bbox outwards to the ERA5-Land grid."""
+    xmin, ymin, xmax, ymax = bbox
+    return (
+        math.floor(round(xmin * _CELLS_PER_DEGREE, 6)) / _CELLS_PER_DEGREE,
+        math.floor(round(ymin * _CELLS_PER_DEGREE, 6)) / _CELLS_PER_DEGREE,
+        math.ceil(round(xmax * _CELLS_PER_DEGREE, 6)) / _CELLS_PER_DEGREE,
+        math.ceil(round(ymax * _CELLS_PER_DEGREE, 6)) / _CELLS_PER_DEGREE,
+    )
+
+
+def grid_cells(bbox: BBox) -> int:
+    """Number of ERA5-Land grid cells in a bbox snapped to the grid."""
+    xmin, ymin, xmax, ymax = snap_bbox(bbox)
+    return (round((xmax - xmin) / GRID_RESOLUTION) + 1) * (round((ymax - ymin) / GRID_RESOLUTION) + 1)
+
+
+@dataclass
+class TilePlan:
+    """Tiles to download instead of one bbox."""
+
+    tiles: list[BBox]
+    cells: int  # grid cells in the tiles
+    bbox_cells: int  # grid cells in the bbox of all org units
+
+    @property
+    def saved_cells(self) -> int:
+        """Grid cells per hour and variable not downloaded, compared with the bbox."""
+        return self.bbox_cells - self.cells
+
+
+def covered_cells(org_units: gpd.GeoDataFrame) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Find the grid cells intersecting an org unit, within the grid-aligned bbox of all org units.
+
+    Returns a (latitude, longitude) mask with latitudes in ascending order, and the
+    latitudes and longitudes of the grid points.
+    """
+    xmin, ymin, xmax, ymax = snap_bbox(tuple(float(v) for v in org_units.total_bounds))  # type: ignore[arg-type]
+    lat = np.arange(round(ymin * _CELLS_PER_DEGREE), round(ymax * _CELLS_PER_DEGREE) + 1) / _CELLS_PER_DEGREE
+    lon = np.arange(round(xmin * _CELLS_PER_DEGREE), round(xmax * _CELLS_PER_DEGREE) + 1) / _CELLS_PER_DEGREE
+
+    # cells centred on the grid points, like the cells of the weight matrices
+    lat2d, lon2d = np.meshgrid(lat, lon, indexing="ij")
+    half = GRID_RESOLUTION / 2
+    cells = shapely.box(lon2d.ravel() - half, lat2d.ravel() - half, lon2d.ravel() + half, lat2d.ravel() + half)
+    cell_idx, _ = shapely.STRtree(org_units.geometry.values).query(cells, predicate="intersects")
+    mask = np.zeros(len(cells), dtype=bool)
+    mask[cell_idx] = True
+    return mask.reshape(lat2d.shape), lat, lon
+
+
+def _shrink(mask: np.ndarray, rect: _Rect) -> _Rect | None:
+    r0, r1, c0, c1 = rect
+    rows = np.flatnonzero(mask[r0:r1, c0:c1].any(axis=1))
+    cols = np.flatnonzero(mask[r0:r1, c0:c1].any(axis=0))
+    if len(rows) == 0:
+        return None
+    return r0 + rows[0], r0 + rows[-1] + 1, c0 + cols[0], c0 + cols[-1] + 1
+
+
+def _area(rect: _Rect) -> int:
+    r0, r1, c0, c1 = rect
+    return (r1 - r0) * (c1 - c0)
+
+
+def _split_areas(sub: np.ndarray) -> np.ndarray:
+    """Areas of both parts, shrunk to their cells, of splitting before each row 1..n-1."""
+    n, width = sub.shape
+    has = sub.any(axis=1)
+    rows = np.arange(n)
+    first_col = np.where(has, sub.argmax(axis=1), width)
+    last_col = np.where(has, width - 1 - sub[:, ::-1].argmax(axis=1), -1)
+
+    def part_areas(rows: np.ndarray, has: np.ndarray, first_col: np.ndarray, last_col: np.ndarray) -> np.ndarray:
+        # areas of the parts made of the first 1..n rows
+        first_row = np.minimum.accumulate(np.where(has, rows, n))
+        last_row = np.maximum.accumulate(np.where(has, rows, -1))
+        lo, hi = np.minimum.accumulate(first_col), np.maximum.accumulate(last_col)
+        return np.where(last_row >= 0, (last_row - first_row + 1) * (hi - lo + 1), 0)
+
+    top = part_areas(rows, has, first_col, last_col)
+    bottom = part_areas(rows, has[::-1], first_col[::-1], last_col[::-1])[::-1]
+    return np.asarray(top[:-1] + bottom[1:])
+
+
+def _best_split(mask: np.ndarray, rect: _Rect) -> tuple[int, _Rect, _Rect] | None:
+    """Find the split of a tile into two tiles that saves most cells."""
+    r0, r1, c0, c1 = rect
+    sub = mask[r0:r1, c0:c1]
+    best = None
+    for axis, part in ((0, sub), (1, sub.T)):
+        if part.shape[0] < 2:
+            continue
+        areas = _split_areas(part)
+        k = int(areas.argmin()) + 1
+        saved = _area(rect) - int(areas[k - 1])
+        if best is None or saved > best[0]:
+            if axis == 0:
+                first, second = (r0, r0 + k, c0, c1), (r0 + k, r1, c0, c1)
+            else:
+                first, second = (r0, r1, c0, c0 + k), (r0, r1, c0 + k, c1)
+            best = (saved, first, second)
+    if best is None:
+        return None
+    saved, first, second = best
+    first_tile, second_tile = _shrink(mask, first), _shrink(mask, second)
+    if first_tile is None or second_tile is None:
+        return None
+    return saved, first_tile, second_tile
+
+
+def plan_tiles(org_units: gpd.GeoDataFrame, max_tiles: int, min_saving: float = 0.1) -> TilePlan:
+    """Plan up to `max_tiles` grid-aligned tiles covering the grid cells of the org units.
+
+    A tile is only split if that saves at least `min_saving` of its cells, since each tile
+    is a CDS request of its own.
+    """
+    mask, lat, lon = covered_cells(org_units)
+    bbox_cells = mask.size
+    start = _shrink(mask, (0, mask.shape[0], 0, mask.shape[1]))
+    if start is None:
+        return TilePlan(tiles=[], cells=0, bbox_cells=bbox_cells)
+
+    # split the tile with the largest saving first (heap of negative savings)
+    tiles: list[_Rect] = []
+    candidates: list[tuple[int, _Rect, _Rect, _Rect]] = []
+
+    def consider(rect: _Rect) -> None:
+        split = _best_split(mask, rect)
+        if split is not None and split[0] >= min_saving * _area(rect):
+            heapq.heappush(candidates, (-split[0], rect, split[1], split[2]))
+        else:
+            tiles.append(rect)
+
+    consider(start)
+    while candidates and len(tiles) + len(candidates) < max_tiles:
+        _, _, first, second = heapq.heappop(candidates)
+        consider(first)
+        consider(second)
+    tiles.extend(rect for _, rect, _, _ in candidates)
+
+    return TilePlan(
+        tiles=[(float(lon[c0]), float(lat[r0]), float(lon[c1 - 1]), float(lat[r1 - 1])) for r0, r1, c0, c1 in tiles],
+        cells=sum(_area(rect) for rect in tiles),
+        bbox_cells=bbox_cells,
+    )
+
+
+def merge_tiles(tiles: list[xr.Dataset]) -> xr.Dataset:
+    """Merge tile cubes into one cube on the union of their grid points, with NaN between tiles."""
+    merged = tiles[0]
+    for tile in tiles[1:]:
+        merged = merged.combine_first(tile)
+    # keep the latitude order of the downloads (north to south for ERA5-Land)
+    latitude = tiles[0]["latitude"].values
+    if len(latitude) > 1 and latitude[0] > latitude[-1]:
+        merged = merged.sortby("latitude", ascending=False)
+    return merged
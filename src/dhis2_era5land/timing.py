@@ -0,0 +1,146 @@
+"""Per-stage statistics of imports.
+
+Each stage (download, temporal, spatial, ...) runs in spans that add their duration, the
+rows and bytes they produced and the peak memory of the process to per-process totals.
+Aggregation worker processes return their totals with each result, so the totals of the
+main process cover the whole import. Stages run concurrently, so their durations can add
+up to more than the wall time.
+"""
+
+import logging
+import resource
+import sys
+import threading
+import time
+from collections.abc import Callable, Iterable, Iterator, Mapping
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+@dataclass
+class StageStats:
+    """Totals of all spans of one stage."""
+
+    seconds: float = 0.0
+    calls: int = 0
+    rows: int = 0
+    bytes: int = 0
+    peak_rss: int = 0  # Peak resident memory of the process when a span ended, in bytes
+
+    def add(self, other: "StageStats") -> None:
+        """Add the totals of another set of spans."""
+        self.seconds += other.seconds
+        self.calls += other.calls
+        self.rows += other.rows
+        self.bytes += other.bytes
+        self.peak_rss = max(self.peak_rss, other.peak_rss)
+
+    def since(self, earlier: "StageStats") -> "StageStats":
+        """Get the totals added since an earlier snapshot (the peak memory is kept)."""
+        return StageStats(
+            seconds=self.seconds - earlier.seconds,
+            calls=self.calls - earlier.calls,
+            rows=self.rows - earlier.rows,
+            bytes=self.bytes - earlier.bytes,
+            peak_rss=self.peak_rss,
+        )
+
+
+@dataclass
+class Span:
+    """One timed run of a stage; set `rows` and `bytes` to record how much it processed."""
+
+    stage: str
+    rows: int = 0
+    bytes: int = 0
+
+
+_lock = threading.Lock()
+_stats: dict[str, StageStats] = {}
+
+
+def peak_rss() -> int:
+    """Peak resident memory of this process, in bytes."""
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return usage if sys.platform == "darwin" else usage * 1024
+
+
+def add_stage_stats(stats: Mapping[str, StageStats]) -> None:
+    """Add statistics to the totals of stages."""
+    with _lock:
+        for stage, stage_stats in stats.items():
+            _stats.setdefault(stage, StageStats()).add(stage_stats)
+
+
+def stage_stats() -> dict[str, StageStats]:
+    """Get a snapshot of the totals per stage."""
+    with _lock:
+        return {stage: StageStats(**vars(stats)) for stage, stats in _stats.items()}
+
+
+def stage_stats_since(snapshot: Mapping[str, StageStats]) -> dict[str, StageStats]:
+    """Get the totals per stage added since an earlier snapshot."""
+    return {
+        stage: stats.since(snapshot.get(stage, StageStats()))
+        for stage, stats in stage_stats().items()
+        if stats.calls > snapshot.get(stage, StageStats()).calls
+    }
+
+
+def reset_stage_stats() -> None:
+    """Clear the stage totals."""
+    with _lock:
+        _stats.clear()
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[Span]:
+    """Record a span of a stage around a block."""
+    span = Span(stage)
+    start = time.perf_counter()
+    try:
+        yield span
+    finally:
+        seconds = time.perf_counter() - start
+        rss = peak_rss()
+        add_stage_stats({stage: StageStats(seconds, 1, span.rows, span.bytes, rss)})
+        logger.debug(
+            "Stage %s took %.3fs (%d rows, %d bytes, peak RSS %.0f MB)",
+            stage,
+            seconds,
+            span.rows,
+            span.bytes,
+            rss / 1024 / 1024,
+        )
+
+
+def timed_iter(stage: str, chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """Record the time spent producing chunks, and their size, as a span of a stage."""
+    iterator = iter(chunks)
+    seconds = 0.0
+    size = 0
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                seconds += time.perf_counter() - start
+            size += len(chunk)
+            yield chunk
+    finally:
+        add_stage_stats({stage: StageStats(seconds, 1, 0, size, peak_rss())})
+
+
+def call_timed(func: Callable[..., T], *args: Any) -> tuple[T, dict[str, StageStats]]:
+    """Call a function in a worker process and return its result with the stage statistics it added."""
+    reset_stage_stats()
+    return func(*args), stage_stats()
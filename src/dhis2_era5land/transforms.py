@@ -1,8 +1,21 @@
-"""Value transformation functions for ERA5-Land data."""
+"""Value transformation functions for ERA5-Land data.
+
+Transforms are plain arithmetic, so they work element-wise on scalars, NumPy arrays
+and xarray objects alike. The importer applies them to the aggregated DataArray in
+one vectorized operation rather than once per row.
+"""
 
 from collections.abc import Callable
+from dataclasses import dataclass
 from enum import StrEnum
-from typing import Any
+from typing import TYPE_CHECKING, Any, TypeVar
+
+if TYPE_CHECKING:
+    import numpy as np
+    import xarray as xr
+    from numpy.typing import NDArray
+
+Value = TypeVar("Value", float, "NDArray[np.floating[Any]]", "xr.DataArray")
 
 
 class Transform(StrEnum):
@@ -15,31 +28,66 @@ class Transform(StrEnum):
     IDENTITY = "identity"
 
 
-def meters_to_millimeters(value: float) -> float:
+def meters_to_millimeters(value: Value) -> Value:
     """Convert precipitation from meters to millimeters."""
     return value * 1000
 
 
-def meters_to_centimeters(value: float) -> float:
+def meters_to_centimeters(value: Value) -> Value:
     """Convert from meters to centimeters."""
     return value * 100
 
 
-def kelvin_to_celsius(value: float) -> float:
+def kelvin_to_celsius(value: Value) -> Value:
     """Convert temperature from Kelvin to Celsius."""
     return value - 273.15
 
 
-def kelvin_to_fahrenheit(value: float) -> float:
+def kelvin_to_fahrenheit(value: Value) -> Value:
     """Convert temperature from Kelvin to Fahrenheit."""
     return (value - 273.15) * 9 / 5 + 32
 
 
-def identity(value: float) -> float:
+def identity(value: Value) -> Value:
     """Return value unchanged."""
     return value
 
 
+@dataclass(frozen=True)
+class ScaleOffset:
+    """Linear transform computing `value * scale + offset`."""
+
+    scale: float = 1.0
+    offset: float = 0.0
+
+    def __call__(self, value: Value) -> Value:
+        """Apply the scale and offset."""
+        return value * self.scale + self.offset
+
+
+@dataclass(frozen=True)
+class Composite:
+    """Chain of transforms applied left to right."""
+
+    funcs: tuple[Callable[[Any], Any], ...]
+
+    def __call__(self, value: Any) -> Any:
+        """Apply each transform in turn."""
+        for func in self.funcs:
+            value = func(value)
+        return value
+
+
+def compose(*funcs: Callable[[Any], Any]) -> Callable[[Any], Any]:
+    """Combine transforms into one, applied left to right."""
+    funcs = tuple(func for func in funcs if func is not identity)
+    if not funcs:
+        return identity
+    if len(funcs) == 1:
+        return funcs[0]
+    return Composite(funcs)
+
+
 # Map of transform names to functions
 TRANSFORMS: dict[Transform, Callable[[Any], Any]] = {
     Transform.METERS_TO_MILLIMETERS: meters_to_millimeters,
@@ -50,6 +98,9 @@ TRANSFORMS: dict[Transform, Callable[[Any], Any]] = {
 }
 
 
-def get_transform(name: Transform) -> Callable[[Any], Any]:
-    """Get a transform function by name."""
-    return TRANSFORMS[name]
+def get_transform(name: Transform, scale: float = 1.0, offset: float = 0.0) -> Callable[[Any], Any]:
+    """Get a transform function by name, optionally followed by a scale and offset."""
+    func = TRANSFORMS[name]
+    if scale == 1.0 and offset == 0.0:
+        return func
+    return compose(func, ScaleOffset(scale=scale, offset=offset))
@@ -0,0 +1,402 @@
+"""Batched upload of data values to DHIS2.
+
+Data values are split into batches by value count and estimated payload size, posted
+concurrently, and retried with exponential backoff. Each batch is streamed to DHIS2 as
+it is serialized (JSON or CSV, optionally gzip-compressed). With `async_import`, DHIS2
+runs each batch as a background import job which is polled until it completes.
+
+Batches are posted from a thread each, over a connection pool of their own (see
+`DHIS2Connection`), or with `connections` set, from asyncio tasks sharing that many
+keep-alive connections, optionally over HTTP/2 so that many batches are in flight on one
+connection.
+"""
+
+import asyncio
+import importlib.util
+import logging
+import random
+import time
+from collections.abc import AsyncIterator, Callable, Iterable, Iterator, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any
+
+import httpx
+import numpy as np
+
+from dhis2_era5land.serialize import CONTENT_TYPES, DataValueColumns, PayloadFormat, gzip_chunks, iter_payload
+from dhis2_era5land.timing import timed_iter
+
+if TYPE_CHECKING:
+    from dhis2_era5land.settings import Settings
+
+logger = logging.getLogger(__name__)
+
+IMPORT_COUNT_KEYS = ("imported", "updated", "ignored", "deleted")
+
+# Seconds to wait for a connection to DHIS2
+CONNECT_TIMEOUT = 30.0
+
+
+@dataclass(frozen=True)
+class UploadOptions:
+    """How data values are batched and posted to DHIS2."""
+
+    batch_size: int = 50_000  # Max data values per request
+    batch_bytes: int = 0  # Max estimated payload bytes per request (0 = no limit)
+    concurrency: int = 2  # Batches posted at the same time
+    async_import: bool = False  # Use DHIS2 async import jobs
+    max_retries: int = 3  # Retries per batch after the first attempt
+    retry_backoff: float = 2.0  # Initial retry delay in seconds, doubled per retry
+    max_backoff: float = 60.0
+    poll_interval: float = 2.0  # Seconds between async job status checks
+    poll_timeout: float = 3600.0  # Max seconds to wait for an async job
+    payload_format: PayloadFormat = PayloadFormat.JSON
+    gzip: bool = False  # Gzip request bodies (DHIS2 detects compressed imports)
+    connections: int = 0  # Connections shared by batches posted with asyncio (0 = a thread per batch)
+    http2: bool = False  # Post with asyncio over HTTP/2 (needs the h2 package)
+
+    @classmethod
+    def from_settings(cls, settings: "Settings") -> "UploadOptions":
+        """Build upload options from settings."""
+        return cls(
+            batch_size=settings.upload_batch_size,
+            batch_bytes=settings.upload_batch_bytes,
+            concurrency=settings.upload_concurrency,
+            async_import=settings.upload_async,
+            max_retries=settings.upload_max_retries,
+            payload_format=PayloadFormat(settings.upload_format),
+            gzip=settings.upload_gzip,
+            connections=settings.upload_connections,
+            http2=settings.upload_http2,
+        )
+
+
+def require_http2() -> None:
+    """Check that HTTP/2 can be used. Raises ImportError if the h2 package is not installed."""
+    if importlib.util.find_spec("h2") is None:
+        raise ImportError("HTTP/2 uploads need the h2 package (pip install 'httpx[http2]')")
+
+
+@dataclass(frozen=True)
+class DHIS2Connection:
+    """Base URL and credentials of the DHIS2 instance that data values are posted to.
+
+    The DHIS2 client can't stream request bodies, so batches are posted over HTTP clients
+    opened from the same settings. DHIS2 only responds to a batch posted without
+    `async_import` once it has imported it, so `timeout` allows for that; a batch that
+    times out is retried, posting it again.
+    """
+
+    base_url: str
+    username: str | None = None
+    password: str | None = field(default=None, repr=False)
+    timeout: float = 600.0  # Seconds to wait for DHIS2 to respond, e.g. while it imports a batch
+    transport: httpx.MockTransport | None = field(default=None, repr=False, compare=False)  # For tests and benchmarks
+
+    @classmethod
+    def from_settings(cls, settings: "Settings") -> "DHIS2Connection":
+        """Connect to the DHIS2 instance of the settings."""
+        if not settings.base_url:
+            raise ValueError("DHIS2_BASE_URL is required")
+        return cls(
+            base_url=settings.base_url,
+            username=settings.username,
+            password=settings.password,
+            timeout=settings.upload_timeout,
+        )
+
+    def _client_options(self) -> dict[str, Any]:
+        return {
+            "base_url": self.base_url.rstrip("/"),
+            "auth": (self.username, self.password) if self.username and self.password else None,
+            "timeout": httpx.Timeout(self.timeout, connect=min(CONNECT_TIMEOUT, self.timeout)),
+            "transport": self.transport,
+        }
+
+    def open(self) -> httpx.Client:
+        """Open an HTTP client for DHIS2."""
+        return httpx.Client(**self._client_options())
+
+    def open_async(self, options: UploadOptions) -> httpx.AsyncClient:
+        """Open an asyncio HTTP client for DHIS2 with a pool of `options.connections` keep-alive connections.
+
+        The client uses HTTP/2 with `options.http2`.
+        """
+        if options.http2:
+            require_http2()
+        connections = max(options.connections, 1)
+        return httpx.AsyncClient(
+            http2=options.http2,
+            limits=httpx.Limits(max_connections=connections, max_keepalive_connections=connections),
+            **self._client_options(),
+        )
+
+
+def split_batches(columns: DataValueColumns, batch_size: int, batch_bytes: int = 0) -> Iterator[tuple[int, int]]:
+    """Split data values into `(start, stop)` row ranges limited by count and (optionally) estimated size."""
+    total = len(columns)
+    if batch_bytes <= 0:
+        for start in range(0, total, batch_size):
+            yield start, min(start + batch_size, total)
+        return
+
+    cumulative = np.cumsum(columns.row_bytes())
+    start = 0
+    while start < total:
+        offset = int(cumulative[start - 1]) if start > 0 else 0
+        # first row that would take the batch over the byte limit (always take at least one row)
+        stop = int(np.searchsorted(cumulative, offset + batch_bytes, side="right"))
+        stop = min(max(stop, start + 1), start + batch_size, total)
+        yield start, stop
+        start = stop
+
+
+def sum_import_counts(counts: Sequence[dict[str, int]]) -> dict[str, int]:
+    """Add up DHIS2 import counts from several batches."""
+    return {key: sum(count.get(key, 0) for count in counts) for key in IMPORT_COUNT_KEYS}
+
+
+def _report_accepted(
+    batch: tuple[int, int], counts: dict[str, int], on_accepted: Callable[[tuple[int, int]], None] | None
+) -> dict[str, int]:
+    """Report a batch whose values DHIS2 all accepted, none ignored (e.g. locked periods or conflicts)."""
+    if on_accepted is not None and not counts.get("ignored"):
+        on_accepted(batch)
+    return counts
+
+
+def _json_response(resp: httpx.Response) -> Any:
+    """Get the JSON body of a DHIS2 response, raising DHIS2HTTPError for errors."""
+    from dhis2_client.errors import DHIS2HTTPError
+
+    if resp.status_code // 100 != 2:
+        try:
+            payload = resp.json()
+        except ValueError:
+            payload = {"message": resp.text}
+        raise DHIS2HTTPError(resp.status_code, resp.request.url.path, payload)
+    return resp.json()
+
+
+def _job_paths(job: dict[str, Any]) -> tuple[str, str, str]:
+    job_type = job.get("jobType", "DATAVALUE_IMPORT")
+    job_id = job["id"]
+    return job_id, f"/api/system/tasks/{job_type}/{job_id}", f"/api/system/taskSummaries/{job_type}/{job_id}"
+
+
+def _job_completed(notifications: Any) -> bool:
+    # the tasks endpoint returns a list of notifications, newest first
+    return any(notification.get("completed") for notification in notifications or [])
+
+
+def _job_counts(job_id: str, summary: dict[str, Any]) -> dict[str, int]:
+    if summary.get("status") == "ERROR":
+        raise RuntimeError(f"Import job {job_id} failed: {summary.get('description')}")
+    counts: dict[str, int] = summary["importCount"]
+    return counts
+
+
+def _wait_for_job(http: httpx.Client, job: dict[str, Any], options: UploadOptions) -> dict[str, int]:
+    """Poll an async import job until it completes and return its import counts."""
+    job_id, tasks_path, summary_path = _job_paths(job)
+    deadline = time.monotonic() + options.poll_timeout
+    while not _job_completed(_json_response(http.get(tasks_path))):
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Import job {job_id} did not complete within {options.poll_timeout:.0f}s")
+        time.sleep(options.poll_interval)
+    return _job_counts(job_id, _json_response(http.get(summary_path)))
+
+
+async def _wait_for_job_async(http: httpx.AsyncClient, job: dict[str, Any], options: UploadOptions) -> dict[str, int]:
+    """Poll an async import job from an asyncio task until it completes and return its import counts."""
+    job_id, tasks_path, summary_path = _job_paths(job)
+    deadline = time.monotonic() + options.poll_timeout
+    while not _job_completed(_json_response(await http.get(tasks_path))):
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Import job {job_id} did not complete within {options.poll_timeout:.0f}s")
+        await asyncio.sleep(options.poll_interval)
+    return _job_counts(job_id, _json_response(await http.get(summary_path)))
+
+
+def _payload(columns: DataValueColumns, batch: tuple[int, int], options: UploadOptions) -> Iterator[bytes]:
+    body = iter_payload(columns, *batch, payload_format=options.payload_format)
+    if options.gzip:
+        body = gzip_chunks(body)
+    return timed_iter("serialize", body)
+
+
+def _is_retryable(exc: Exception) -> bool:
+    """Retry network errors, server errors and rate limiting, but not rejected payloads or other errors."""
+    if isinstance(exc, httpx.TransportError):
+        return True
+    status_code = getattr(exc, "status_code", None)
+    return status_code is not None and (status_code >= 500 or status_code == 429)
+
+
+def _retry_delay(exc: Exception, attempt: int, size: int, options: UploadOptions) -> float | None:
+    """Get the delay before retrying a failed batch, or `None` if it is not retried."""
+    if attempt >= options.max_retries or not _is_retryable(exc):
+        return None
+    delay: float = min(options.retry_backoff * 2**attempt, options.max_backoff)
+    delay *= random.uniform(0.5, 1.0)  # jitter, so concurrent batches don't retry in lockstep
+    logger.warning(
+        "Batch of %d values failed (%s), retry %d/%d in %.1fs",
+        size,
+        exc,
+        attempt + 1,
+        options.max_retries,
+        delay,
+    )
+    return delay
+
+
+def _params(dry_run: bool, options: UploadOptions) -> dict[str, str]:
+    params = {"dryRun": str(dry_run).lower()}
+    if options.async_import:
+        params["async"] = "true"
+    return params
+
+
+def _post_batch(
+    http: httpx.Client,
+    columns: DataValueColumns,
+    batch: tuple[int, int],
+    dry_run: bool,
+    options: UploadOptions,
+) -> dict[str, int]:
+    """Stream one batch to /api/dataValueSets, retrying with exponential backoff."""
+    size = batch[1] - batch[0]
+    attempt = 0
+    while True:
+        try:
+            resp = http.post(
+                "/api/dataValueSets",
+                content=_payload(columns, batch, options),
+                params=_params(dry_run, options),
+                headers={"Content-Type": CONTENT_TYPES[options.payload_format]},
+            )
+            res = _json_response(resp)
+            break
+        except Exception as exc:
+            delay = _retry_delay(exc, attempt, size, options)
+            if delay is None:
+                raise
+            attempt += 1
+            time.sleep(delay)
+
+    # a job that fails or times out is not posted again, DHIS2 may still be importing it
+    if options.async_import:
+        return _wait_for_job(http, res["response"], options)
+    counts: dict[str, int] = res["response"]["importCount"]
+    return counts
+
+
+async def _async_chunks(chunks: Iterable[bytes]) -> AsyncIterator[bytes]:
+    for chunk in chunks:
+        yield chunk
+
+
+async def _post_batch_async(
+    http: httpx.AsyncClient,
+    columns: DataValueColumns,
+    batch: tuple[int, int],
+    dry_run: bool,
+    options: UploadOptions,
+) -> dict[str, int]:
+    """Stream one batch from an asyncio task, retrying with exponential backoff."""
+    size = batch[1] - batch[0]
+    attempt = 0
+    while True:
+        try:
+            resp = await http.post(
+                "/api/dataValueSets",
+                content=_async_chunks(_payload(columns, batch, options)),
+                params=_params(dry_run, options),
+                headers={"Content-Type": CONTENT_TYPES[options.payload_format]},
+            )
+            res = _json_response(resp)
+            break
+        except Exception as exc:
+            delay = _retry_delay(exc, attempt, size, options)
+            if delay is None:
+                raise
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    if options.async_import:
+        return await _wait_for_job_async(http, res["response"], options)
+    counts: dict[str, int] = res["response"]["importCount"]
+    return counts
+
+
+async def post_data_values_async(
+    connection: DHIS2Connection,
+    columns: DataValueColumns,
+    dry_run: bool = False,
+    options: UploadOptions | None = None,
+    http: httpx.AsyncClient | None = None,
+    on_accepted: Callable[[tuple[int, int]], None] | None = None,
+) -> dict[str, int]:
+    """Post data values to DHIS2 in batches from asyncio tasks and return the combined import counts.
+
+    Up to `options.concurrency` batches are in flight at once, over `http` or the
+    connections of a client opened for this call (see `DHIS2Connection.open_async`).
+    `on_accepted` is called with the row range of each batch DHIS2 accepted in full.
+    """
+    options = options or UploadOptions()
+    batches = list(split_batches(columns, options.batch_size, options.batch_bytes))
+    if not batches:
+        return sum_import_counts([])
+    logger.info(
+        "Importing %d values in %d batch(es) over %d connection(s)...",
+        len(columns),
+        len(batches),
+        max(options.connections, 1),
+    )
+
+    slots = asyncio.Semaphore(max(options.concurrency, 1))
+
+    async def post(http: httpx.AsyncClient, batch: tuple[int, int]) -> dict[str, int]:
+        async with slots:
+            counts = await _post_batch_async(http, columns, batch, dry_run, options)
+            return _report_accepted(batch, counts, on_accepted)
+
+    async with nullcontext(http) if http is not None else connection.open_async(options) as http:
+        counts = await asyncio.gather(*(post(http, batch) for batch in batches))
+    return sum_import_counts(counts)
+
+
+def post_data_values(
+    connection: DHIS2Connection,
+    columns: DataValueColumns,
+    dry_run: bool = False,
+    options: UploadOptions | None = None,
+    on_accepted: Callable[[tuple[int, int]], None] | None = None,
+) -> dict[str, int]:
+    """Post data values to DHIS2 in batches and return the combined import counts.
+
+    `on_accepted` is called with the row range of each batch DHIS2 accepted in full, from
+    the thread that posted it. With `options.connections` or `options.http2`, batches are
+    posted with asyncio (see `post_data_values_async`).
+    """
+    options = options or UploadOptions()
+    if options.connections > 0 or options.http2:
+        return asyncio.run(post_data_values_async(connection, columns, dry_run, options, on_accepted=on_accepted))
+    batches = list(split_batches(columns, options.batch_size, options.batch_bytes))
+    if not batches:
+        return sum_import_counts([])
+    logger.info("Importing %d values in %d batch(es)...", len(columns), len(batches))
+
+    with connection.open() as http:
+
+        def post(batch: tuple[int, int]) -> dict[str, int]:
+            return _report_accepted(batch, _post_batch(http, columns, batch, dry_run, options), on_accepted)
+
+        if len(batches) == 1 or options.concurrency <= 1:
+            counts = [post(batch) for batch in batches]
+        else:
+            with ThreadPoolExecutor(max_workers=options.concurrency, thread_name_prefix="upload") as executor:
+                counts = list(executor.map(post, batches))
+    return sum_import_counts(counts)
@@ -0,0 +1,270 @@
+"""Precomputed org unit weight matrices for spatial aggregation.
+
+Each org unit gets a sparse row of weights over the grid cells of the downloaded cube:
+the fraction of each cell covered by the org unit polygon. Means are additionally weighted
+by cos(latitude), so cells nearer the poles count for their true, smaller area. Spatial
+reduction of a whole month is then a single sparse matrix product over all days at once.
+
+Matrices are keyed by a hash of the org unit geometries plus the grid definition, kept in
+memory per process and optionally stored on disk, so they are only rebuilt when the DHIS2
+geometries or the grid change. Org units that don't cover any grid cell are reported when
+their matrix is built or loaded, and left out of the reduction. So are org units that only
+cover cells without data, such as sea cells outside the ERA5-Land land mask; they are
+found once per land mask and matrix.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import geopandas as gpd
+import numpy as np
+import scipy.sparse
+import shapely
+import xarray as xr
+
+from dhis2_era5land.cache import GRID_RESOLUTION
+
+logger = logging.getLogger(__name__)
+
+# Spatial aggregations computed with weight matrices (others fall back to earthkit masks)
+WEIGHTED_AGGREGATIONS = ("mean", "sum")
+
+# Org units listed when reporting org units without grid cells or data
+_MAX_EMPTY_SAMPLE = 10
+
+# Matrices kept in memory per process, shared by its threads
+_MAX_MEMORY_ENTRIES = 8
+_memory: dict[str, "WeightMatrix"] = {}
+_memory_lock = threading.Lock()
+
+
+@dataclass
+class WeightMatrix:
+    """Sparse (org unit x grid cell) weights for one set of geometries on one grid."""
+
+    ids: np.ndarray
+    matrix: scipy.sparse.csr_matrix
+    shape: tuple[int, int]  # grid shape (latitude, longitude)
+    _excluded: dict[str, np.ndarray] = field(default_factory=dict, repr=False, compare=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    @property
+    def empty(self) -> np.ndarray:
+        """Mask of org units that don't cover any grid cell."""
+        return np.asarray(np.diff(self.matrix.indptr) == 0)
+
+    def excluded(self, land: np.ndarray | None = None) -> np.ndarray:
+        """Mask of org units to leave out of a reduction.
+
+        These are the org units that don't cover any grid cell and, given the `land` mask of
+        grid cells with data (see `land_cells`), those whose cells all lack data. The mask
+        is computed and reported once per land mask.
+        """
+        if land is None:
+            return self.empty
+        land = np.asarray(land, dtype=bool).ravel()
+        key = hashlib.sha256(np.packbits(land)).hexdigest()
+        with self._lock:
+            if key not in self._excluded:
+                no_data = ~self.empty & (np.asarray(self.matrix @ land.astype(np.float64)) == 0)
+                _report(self.ids[no_data], "only cover grid cells without data")
+                self._excluded[key] = self.empty | no_data
+            return self._excluded[key]
+
+
+def land_cells(data: xr.DataArray) -> np.ndarray:
+    """Mask of the (latitude, longitude) grid cells with data at any time."""
+    time_dims = [dim for dim in data.dims if dim not in ("latitude", "longitude")]
+    return np.asarray(data.notnull().any(time_dims).transpose("latitude", "longitude").values)
+
+
+def _report(ids: np.ndarray, reason: str) -> None:
+    if len(ids):
+        logger.warning(
+            "%d org units %s and get no values: %s",
+            len(ids),
+            reason,
+            ", ".join(ids[:_MAX_EMPTY_SAMPLE]) + (", ..." if len(ids) > _MAX_EMPTY_SAMPLE else ""),
+        )
+
+
+def _resolution(coords: np.ndarray) -> float:
+    if len(coords) < 2:
+        return GRID_RESOLUTION
+    return float(np.abs(np.diff(coords)).min())
+
+
+def org_units_key(org_units: gpd.GeoDataFrame, id_col: str = "id") -> str:
+    """Hash the org unit IDs and geometries."""
+    digest = hashlib.sha256()
+    for uid, wkb in zip(org_units[id_col], shapely.to_wkb(org_units.geometry.values), strict=True):
+        digest.update(str(uid).encode())
+        digest.update(wkb)
+    return digest.hexdigest()
+
+
+def weights_key(
+    org_units: gpd.GeoDataFrame,
+    lat: np.ndarray,
+    lon: np.ndarray,
+    id_col: str = "id",
+    geometries_key: str | None = None,
+) -> str:
+    """Hash the org unit geometries (or their `org_units_key`, if given) and the grid definition."""
+    digest = hashlib.sha256()
+    digest.update((geometries_key or org_units_key(org_units, id_col)).encode())
+    digest.update(np.round(np.asarray(lat, dtype=np.float64), 6).tobytes())
+    digest.update(np.round(np.asarray(lon, dtype=np.float64), 6).tobytes())
+    return digest.hexdigest()[:32]
+
+
+def compute_weights(
+    org_units: gpd.GeoDataFrame,
+    lat: np.ndarray,
+    lon: np.ndarray,
+    id_col: str = "id",
+) -> WeightMatrix:
+    """Compute the fraction of each grid cell covered by each org unit."""
+    lat_res = _resolution(lat)
+    lon_res = _resolution(lon)
+
+    # cell polygons in the same (latitude, longitude) order as the flattened data
+    lat2d, lon2d = np.meshgrid(lat, lon, indexing="ij")
+    cell_lat = lat2d.ravel()
+    cell_lon = lon2d.ravel()
+    cells = shapely.box(
+        cell_lon - lon_res / 2,
+        cell_lat - lat_res / 2,
+        cell_lon + lon_res / 2,
+        cell_lat + lat_res / 2,
+    )
+
+    # find all (org unit, cell) pairs that intersect, then compute the covered areas at once
+    geometries = org_units.geometry.values
+    tree = shapely.STRtree(cells)
+    unit_idx, cell_idx = tree.query(geometries, predicate="intersects")
+    covered = shapely.area(shapely.intersection(geometries[unit_idx], cells[cell_idx]))
+    weights = np.minimum(covered / (lat_res * lon_res), 1.0)
+
+    keep = weights > 0
+    matrix = scipy.sparse.csr_matrix(
+        (weights[keep], (unit_idx[keep], cell_idx[keep])),
+        shape=(len(org_units), len(cells)),
+    )
+    return WeightMatrix(
+        ids=np.asarray(org_units[id_col].astype(str), dtype=str),
+        matrix=matrix,
+        shape=(len(lat), len(lon)),
+    )
+
+
+def _save(path: Path, weights: WeightMatrix) -> None:
+    # a temporary file of its own, as other aggregation processes may store the same matrix
+    tmp_path = path.with_name(f"{path.stem}.{os.getpid()}-{threading.get_ident()}.tmp.npz")
+    np.savez_compressed(
+        tmp_path,
+        ids=weights.ids,
+        data=weights.matrix.data,
+        indices=weights.matrix.indices,
+        indptr=weights.matrix.indptr,
+        matrix_shape=np.array(weights.matrix.shape),
+        grid_shape=np.array(weights.shape),
+    )
+    tmp_path.replace(path)
+
+
+def _load(path: Path) -> WeightMatrix:
+    with np.load(path) as npz:
+        matrix = scipy.sparse.csr_matrix(
+            (npz["data"], npz["indices"], npz["indptr"]),
+            shape=tuple(npz["matrix_shape"]),
+        )
+        grid_shape = npz["grid_shape"]
+        return WeightMatrix(ids=npz["ids"], matrix=matrix, shape=(int(grid_shape[0]), int(grid_shape[1])))
+
+
+def get_weights(
+    org_units: gpd.GeoDataFrame,
+    lat: np.ndarray,
+    lon: np.ndarray,
+    directory: Path | None = None,
+    id_col: str = "id",
+    geometries_key: str | None = None,
+) -> WeightMatrix:
+    """Get the weight matrix for org units on a grid, from memory, disk or by computing it.
+
+    Callers aggregating the same org units again can pass their `org_units_key` as
+    `geometries_key`, instead of hashing the geometries for every lookup.
+    """
+    key = weights_key(org_units, lat, lon, id_col=id_col, geometries_key=geometries_key)
+    with _memory_lock:
+        if key in _memory:
+            return _memory[key]
+
+    path = directory / f"weights-{key}.npz" if directory is not None else None
+    if path is not None and path.exists():
+        logger.debug("Loading org unit weights from %s", path)
+        weights = _load(path)
+    else:
+        logger.info("Computing org unit weights for %d org units...", len(org_units))
+        weights = compute_weights(org_units, lat, lon, id_col=id_col)
+        if path is not None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            _save(path, weights)
+
+    _report(weights.ids[weights.empty], "don't cover any grid cell")
+
+    with _memory_lock:
+        if len(_memory) >= _MAX_MEMORY_ENTRIES:
+            _memory.pop(next(iter(_memory)))
+        _memory[key] = weights
+    return weights
+
+
+def weighted_reduce(
+    data: xr.DataArray,
+    weights: WeightMatrix,
+    how: str = "mean",
+    mask_dim: str = "id",
+) -> xr.DataArray:
+    """Reduce a (time, latitude, longitude) array to (org unit, time) with a weight matrix.
+
+    `mean` is the area-weighted mean over covered cells, `sum` the sum of cell values
+    weighted by their covered fraction. Missing cells are left out, and org units without
+    any covered cell with data at some time get NaN then. Org units that don't cover any
+    grid cell, or only cells without data at any time, are left out of the result (see
+    `WeightMatrix.excluded`).
+    """
+    time_dim = next(dim for dim in data.dims if dim not in ("latitude", "longitude"))
+    values = data.transpose(time_dim, "latitude", "longitude").values.reshape(data.sizes[time_dim], -1)
+    valid = ~np.isnan(values)
+    filled = np.where(valid, values, 0.0).T
+
+    ids, matrix = weights.ids, weights.matrix
+    excluded = weights.excluded(valid.any(axis=0))
+    if excluded.any():
+        ids, matrix = ids[~excluded], matrix[~excluded]
+
+    if how == "mean":
+        cell_area = np.repeat(np.cos(np.deg2rad(data["latitude"].values)), data.sizes["longitude"])
+        matrix = scipy.sparse.csr_matrix(matrix.multiply(cell_area))
+        totals = np.asarray(matrix @ filled)
+        coverage = np.asarray(matrix @ valid.T.astype(np.float64))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            reduced = np.where(coverage > 0, totals / coverage, np.nan)
+    elif how == "sum":
+        coverage = np.asarray(matrix @ valid.T.astype(np.float64))
+        reduced = np.where(coverage > 0, np.asarray(matrix @ filled), np.nan)
+    else:
+        raise ValueError(f"Unsupported weighted aggregation: {how}")
+
+    return xr.DataArray(
+        reduced,
+        dims=(mask_dim, time_dim),
+        coords={mask_dim: ids, time_dim: data[time_dim].values},
+        name=data.name,
+    )
@@ -0,0 +1,182 @@
+"""Day windows and periods for incremental imports.
+
+The days to import are worked out from the last period imported into DHIS2 and split into
+windows of at most one calendar month. Each window covers whole local days, so the hours
+it needs from the (UTC) ERA5-Land data are shifted by the timezone offset and may reach
+into the neighbouring month. When values are aggregated to periods longer than a day, a
+window imports the periods starting in its month and reaches past the end of the month to
+the end of the last one, so every period is imported whole by exactly one window. Period
+start days and DHIS2 period IDs are computed with NumPy for all days at once.
+"""
+
+from collections.abc import Sequence
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+
+import numpy as np
+import xarray as xr
+
+from dhis2_era5land.periods import WEEK_STARTS, PeriodType, period_start
+
+
+@dataclass(frozen=True)
+class DayWindow:
+    """A range of local days to import, `start` and `end` included.
+
+    The window imports the periods starting from `start` to `end`; their days can continue
+    up to `until`.
+    """
+
+    start: date
+    end: date
+    until: date | None = None
+
+    @property
+    def last_day(self) -> date:
+        """Last day of data the window needs."""
+        return self.until or self.end
+
+    def __str__(self) -> str:
+        """Format as a DHIS2 day period range, e.g. `20240101-20240131`."""
+        return f"{self.start:%Y%m%d}-{self.end:%Y%m%d}"
+
+    def utc_range(self, timezone_offset: int) -> tuple[datetime, datetime]:
+        """UTC hours covered by the window, as a `[start, stop)` range."""
+        shift = timedelta(hours=timezone_offset)
+        start = datetime.combine(self.start, time()) - shift
+        stop = datetime.combine(self.last_day + timedelta(days=1), time()) - shift
+        return start, stop
+
+    def months(self, timezone_offset: int) -> list[tuple[int, int]]:
+        """Calendar months (year, month) with UTC hours in the window."""
+        start, stop = self.utc_range(timezone_offset)
+        last = stop - timedelta(hours=1)
+        months = []
+        year, month = start.year, start.month
+        while (year, month) <= (last.year, last.month):
+            months.append((year, month))
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+        return months
+
+
+def _weekday(days: np.ndarray) -> np.ndarray:
+    # 1970-01-01 was a Thursday
+    return (days.astype("datetime64[D]").astype(np.int64) + 3) % 7
+
+
+def _week_numbers(week_starts: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Get the year and week number of weeks, from the 4th day of each week."""
+    middle = week_starts + np.timedelta64(3, "D")
+    years = middle.astype("datetime64[Y]")
+    weeks = (middle - years.astype("datetime64[D]")).astype(np.int64) // 7 + 1
+    return years.astype(np.int64) + 1970, weeks
+
+
+def period_starts(days: np.ndarray, period_type: PeriodType) -> np.ndarray:
+    """Get the first day of the period containing each day."""
+    days = np.asarray(days).astype("datetime64[D]")
+    if period_type == PeriodType.DAILY:
+        return days
+    if period_type == PeriodType.MONTHLY:
+        return days.astype("datetime64[M]").astype("datetime64[D]")
+
+    first_weekday, _ = WEEK_STARTS[period_type]
+    starts = days - ((_weekday(days) - first_weekday) % 7).astype("timedelta64[D]")
+    if period_type == PeriodType.BI_WEEKLY:
+        # the second week of a pair starts a week after the first
+        _, weeks = _week_numbers(starts)
+        starts = starts - np.where(weeks % 2 == 0, 7, 0).astype("timedelta64[D]")
+    return np.asarray(starts)
+
+
+def reduce_periods(
+    data: xr.DataArray,
+    period_type: PeriodType,
+    how: str = "mean",
+    time_dim: str = "valid_time",
+) -> xr.DataArray:
+    """Reduce daily values to periods, labelled with the first day of each period.
+
+    Sums of periods without any value are NaN, like their means.
+    """
+    times = data[time_dim].values
+    starts = xr.DataArray(period_starts(times, period_type).astype(times.dtype), dims=time_dim, name="period_start")
+    grouped = data.groupby(starts)
+    reduced = grouped.sum(min_count=1) if how == "sum" else getattr(grouped, how)()
+    return reduced.rename({"period_start": time_dim}).transpose(time_dim, ...)
+
+
+def period_ids(starts: np.ndarray, period_type: PeriodType) -> np.ndarray:
+    """Format period start days as DHIS2 period IDs, e.g. `20240105`, `2024W1` or `202401`."""
+    unique, inverse = np.unique(np.asarray(starts).astype("datetime64[D]"), return_inverse=True)
+    if period_type == PeriodType.DAILY:
+        ids = np.char.replace(np.datetime_as_string(unique, unit="D"), "-", "")
+    elif period_type == PeriodType.MONTHLY:
+        ids = np.char.replace(np.datetime_as_string(unique, unit="M"), "-", "")
+    else:
+        years, weeks = _week_numbers(unique)
+        _, prefix = WEEK_STARTS[period_type]
+        numbers = (weeks + 1) // 2 if period_type == PeriodType.BI_WEEKLY else weeks
+        ids = np.char.add(np.char.add(years.astype(str), prefix), numbers.astype(str))
+    return ids[inverse.reshape(-1)].astype(str)
+
+
+def period_bounds(day: date, period_type: PeriodType) -> tuple[date, date]:
+    """Get the first and last day of the period containing a day."""
+    days = np.datetime64(day, "D") + np.arange(-31, 32).astype("timedelta64[D]")
+    starts = period_starts(days, period_type)
+    in_period = days[starts == starts[31]]
+    return in_period[0].item(), in_period[-1].item()
+
+
+def parse_period_day(period_id: str) -> date:
+    """Get the first day of a DHIS2 daily, weekly, bi-weekly or monthly period."""
+    return period_start(period_id)
+
+
+def plan_windows(
+    start: date,
+    end: date,
+    resume_from: date | None = None,
+    period_types: Sequence[PeriodType] = (),
+) -> list[DayWindow]:
+    """Split the days from `start` (or `resume_from`, if later) to `end` into monthly windows.
+
+    With `period_types`, each window reaches to the end of the last period starting in it,
+    even past `end`. Periods that started before `start` aren't part of any window.
+    """
+    first = max(start, resume_from) if resume_from is not None else start
+    windows = []
+    while first <= end:
+        next_month = (first.replace(day=28) + timedelta(days=4)).replace(day=1)
+        last = min(end, next_month - timedelta(days=1))
+        until = max([last, *(period_bounds(last, period_type)[1] for period_type in period_types)])
+        windows.append(DayWindow(first, last, until if until > last else None))
+        first = next_month
+    return windows
+
+
+def select_hours(data: xr.Dataset, window: DayWindow, timezone_offset: int) -> xr.Dataset:
+    """Select the hours of hourly data that fall within the local days of a window."""
+    start, stop = window.utc_range(timezone_offset)
+    times = data["valid_time"].values
+    return data.isel(valid_time=(times >= np.datetime64(start)) & (times < np.datetime64(stop)))
+
+
+def plan_chunks(start: date, end: date, months_per_chunk: int = 12) -> list[DayWindow]:
+    """Split the days from `start` to `end` into chunks of `months_per_chunk` calendar months.
+
+    Chunks are aligned to the start of the year (when `months_per_chunk` divides 12), so a
+    chunk of 12 months is a calendar year and one of 3 months a quarter.
+    """
+    if months_per_chunk < 1:
+        raise ValueError("months_per_chunk must be at least 1")
+    chunks = []
+    first = start
+    while first <= end:
+        index = (first.year * 12 + first.month - 1) // months_per_chunk
+        next_chunk = (index + 1) * months_per_chunk
+        chunk_end = date(next_chunk // 12, next_chunk % 12 + 1, 1) - timedelta(days=1)
+        chunks.append(DayWindow(first, min(end, chunk_end)))
+        first = chunk_end + timedelta(days=1)
+    return chunks
@@ -22,3 +22,18 @@ def test_openapi() -> None:
     assert response.status_code == 200
     data = response.json()
     assert data["info"]["title"] == "dhis2-era5land"
+
+
+def test_metrics() -> None:
+    """Test Prometheus metrics endpoint."""
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "# TYPE dhis2_era5land_runs_total counter" in response.text
+
+
+def test_job_not_found() -> None:
+    """Test unknown jobs return 404."""
+    assert client.get("/jobs/unknown").status_code == 404
+    assert client.delete("/jobs/unknown").status_code == 404
+    assert client.get("/jobs").status_code == 200
@@ -0,0 +1,131 @@
+"""Tests for backfills, with synthetic data and a fake DHIS2."""
+
+import threading
+import time
+from pathlib import Path
+from typing import Any, cast
+from unittest import mock
+
+import pytest
+import xarray as xr
+
+from dhis2_era5land import importer
+from dhis2_era5land.backfill import open_checkpoint, run_backfill
+from dhis2_era5land.benchmark import FakeDHIS2, synthetic_month, synthetic_org_units
+from dhis2_era5land.cache import BBox
+from dhis2_era5land.importer import ImportOptions
+from dhis2_era5land.periods import PeriodType
+from dhis2_era5land.settings import VariableSpec
+from dhis2_era5land.sinks import create_sinks
+
+SPECS = [VariableSpec(variable="total_precipitation", data_element_id="de000000001", value_col="tp")]
+
+
+def backfill(
+    client: FakeDHIS2,
+    checkpoint_path: Path,
+    fail_month: tuple[int, int] | None = None,
+    specs: list[VariableSpec] = SPECS,
+    org_unit_level: int | list[int] = 2,
+    months_per_chunk: int = 12,
+    parallel_chunks: int = 1,
+    download_concurrency: int = 1,
+) -> None:
+    def get(year: int, month: int, variables: list[str], bbox: BBox) -> xr.Dataset:
+        if (year, month) == fail_month:
+            raise RuntimeError("CDS request failed")
+        return synthetic_month(year, month, ["tp"], bbox)
+
+    with mock.patch.object(importer.era5_land.hourly, "get", get):
+        run_backfill(
+            ImportOptions(
+                client=cast(Any, client),
+                specs=specs,
+                start_date="2019-11-01",
+                end_date="2020-02-29",
+                timezone_offset=0,
+                org_unit_level=org_unit_level,
+                sinks=create_sinks(client.connection),
+                download_concurrency=download_concurrency,
+            ),
+            open_checkpoint(checkpoint_path, specs, 0, org_unit_level),
+            months_per_chunk=months_per_chunk,
+            parallel_chunks=parallel_chunks,
+        )
+
+
+def test_resumes_after_failure(tmp_path: Path) -> None:
+    client = FakeDHIS2(synthetic_org_units(4))
+    with pytest.raises(RuntimeError, match="CDS request failed"):
+        backfill(client, tmp_path / "checkpoint.json", fail_month=(2020, 2))
+    # November to January were imported and recorded
+    assert client.values_received == 4 * (30 + 31 + 31)
+
+    backfill(client, tmp_path / "checkpoint.json")
+    assert client.values_received == 4 * (30 + 31 + 31 + 29)
+
+    # nothing left to import
+    backfill(client, tmp_path / "checkpoint.json")
+    assert client.values_received == 4 * (30 + 31 + 31 + 29)
+
+
+def test_parallel_chunks(tmp_path: Path) -> None:
+    client = FakeDHIS2(synthetic_org_units(4))
+    backfill(client, tmp_path / "checkpoint.json", months_per_chunk=1, parallel_chunks=3, download_concurrency=2)
+    assert client.values_received == 4 * (30 + 31 + 31 + 29)
+    assert len(open_checkpoint(tmp_path / "checkpoint.json", SPECS, 0, 2)) == 4
+
+
+def test_parallel_chunks_share_cds_requests(tmp_path: Path) -> None:
+    client = FakeDHIS2(synthetic_org_units(4))
+    lock = threading.Lock()
+    in_flight = [0, 0]  # current, max
+
+    def get(year: int, month: int, variables: list[str], bbox: BBox) -> xr.Dataset:
+        with lock:
+            in_flight[0] += 1
+            in_flight[1] = max(in_flight)
+        time.sleep(0.05)
+        with lock:
+            in_flight[0] -= 1
+        return synthetic_month(year, month, ["tp"], bbox)
+
+    with mock.patch.object(importer.era5_land.hourly, "get", get):
+        run_backfill(
+            ImportOptions(
+                client=cast(Any, client),
+                specs=SPECS,
+                start_date="2019-11-01",
+                end_date="2020-02-29",
+                timezone_offset=0,
+                org_unit_level=2,
+                sinks=create_sinks(client.connection),
+                download_concurrency=2,
+            ),
+            checkpoint=open_checkpoint(tmp_path / "checkpoint.json", SPECS, 0, 2),
+            months_per_chunk=1,
+            parallel_chunks=4,
+        )
+    assert in_flight[1] == 2
+
+
+def test_weekly_periods_are_imported_once(tmp_path: Path) -> None:
+    client = FakeDHIS2(synthetic_org_units(4))
+    specs = [SPECS[0].model_copy(update={"period_type": PeriodType.WEEKLY})]
+    backfill(client, tmp_path / "checkpoint.json", specs=specs, months_per_chunk=1, parallel_chunks=3)
+    # the 17 weeks starting from Monday 2019-11-04 to Monday 2020-02-24
+    assert client.values_received == 4 * 17
+
+
+def test_several_levels(tmp_path: Path) -> None:
+    region, districts = synthetic_org_units(1)["features"], synthetic_org_units(4)["features"]
+    for feature in region:
+        feature["id"] = "region00000"
+        feature["properties"]["level"] = 2
+    for feature in districts:
+        feature["properties"]["level"] = 3
+    client = FakeDHIS2({"type": "FeatureCollection", "features": region + districts})
+    backfill(client, tmp_path / "checkpoint.json", org_unit_level=[2, 3])
+    assert client.values_received == (1 + 4) * (30 + 31 + 31 + 29)
+    # each level is posted in its own batches
+    assert client.requests == 2 * 4
@@ -0,0 +1,51 @@
+"""Tests for the benchmark harness."""
+
+import json
+
+import geopandas as gpd
+import numpy as np
+
+from dhis2_era5land.benchmark import FakeDHIS2, compare, synthetic_month, synthetic_org_units
+from dhis2_era5land.serialize import DataValueColumns, PayloadFormat
+from dhis2_era5land.upload import UploadOptions, post_data_values
+
+
+def test_synthetic_org_units() -> None:
+    org_units = gpd.read_file(json.dumps(synthetic_org_units(50, extent=2.0)))
+    assert len(org_units) == 50
+    assert org_units["id"].is_unique
+    assert org_units.geometry.is_valid.all()
+    xmin, ymin, xmax, ymax = org_units.total_bounds
+    assert xmax - xmin <= 2.0 and ymax - ymin <= 2.0
+
+
+def test_synthetic_month_covers_bbox() -> None:
+    data = synthetic_month(2024, 2, ["tp", "t2m"], bbox=(30.03, -9.96, 30.52, -9.41))
+    assert set(data.data_vars) == {"tp", "t2m"}
+    assert data.sizes["valid_time"] == 29 * 24
+    assert data["latitude"].values[0] >= -9.41 and data["latitude"].values[-1] <= -9.96
+    assert data["longitude"].values[0] <= 30.03 and data["longitude"].values[-1] >= 30.52
+
+
+def test_fake_dhis2_counts_values() -> None:
+    client = FakeDHIS2(synthetic_org_units(1))
+    columns = DataValueColumns(
+        data_elements=np.full(5, "de"),
+        org_units=np.full(5, "ou"),
+        periods=np.full(5, "20240101"),
+        values=np.full(5, "1"),
+    )
+    post_data_values(client.connection, columns, options=UploadOptions(batch_size=2))
+    post_data_values(client.connection, columns, options=UploadOptions(payload_format=PayloadFormat.CSV, gzip=True))
+    assert client.values_received == 10
+    assert client.requests == 4
+
+
+def test_compare_matches_scenarios() -> None:
+    result = {"org_units": 10, "months": 1, "variables": 1, "extent": 10.0, "peak_rss_mb": 100.0}
+    rows = compare(
+        {"results": [{**result, "wall_time": 1.0}, {**result, "months": 2, "wall_time": 2.0}]},
+        {"results": [{**result, "wall_time": 2.0}]},
+    )
+    assert len(rows) == 1
+    assert rows[0]["wall_time_ratio"] == 0.5
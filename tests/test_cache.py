@@ -0,0 +1,111 @@
+"""Tests for the download cache."""
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import UTC, datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from dhis2_era5land.cache import DownloadCache, cache_key, crop_to_bbox, month_is_complete
+
+BBOX = (30.0, 9.0, 31.0, 10.0)
+
+
+def make_cube(bbox: tuple[float, float, float, float] = BBOX) -> xr.Dataset:
+    xmin, ymin, xmax, ymax = bbox
+    lat = np.round(np.arange(ymax, ymin - 0.05, -0.1), 1)
+    lon = np.round(np.arange(xmin, xmax + 0.05, 0.1), 1)
+    time = pd.date_range("2020-01-01", periods=24, freq="h")
+    values = np.random.default_rng(0).random((len(time), len(lat), len(lon)))
+    return xr.Dataset(
+        {"tp": (("valid_time", "latitude", "longitude"), values)},
+        coords={"valid_time": time, "latitude": lat, "longitude": lon},
+    )
+
+
+def test_month_is_complete() -> None:
+    assert month_is_complete(2020, 1, datetime(2020, 2, 6, tzinfo=UTC))
+    assert not month_is_complete(2020, 1, datetime(2020, 2, 5, tzinfo=UTC))
+    assert not month_is_complete(2020, 12, datetime(2021, 1, 2, tzinfo=UTC))
+
+
+def test_cache_key_is_stable() -> None:
+    assert cache_key(2020, 1, ["b", "a"], BBOX) == cache_key(2020, 1, ["a", "b"], BBOX)
+    assert cache_key(2020, 1, ["a"], BBOX) != cache_key(2020, 2, ["a"], BBOX)
+
+
+def test_crop_to_bbox() -> None:
+    cropped = crop_to_bbox(make_cube(), (30.5, 9.5, 30.6, 9.6))
+    assert cropped["longitude"].values.tolist() == [30.4, 30.5, 30.6, 30.7]
+    assert cropped["latitude"].values.tolist() == [9.7, 9.6, 9.5, 9.4]
+
+
+def test_get_put_roundtrip(tmp_path: Path) -> None:
+    cache = DownloadCache(tmp_path, max_bytes=10**9)
+    assert cache.get(2020, 1, ["total_precipitation"], BBOX) is None
+    cache.put(2020, 1, ["total_precipitation"], BBOX, make_cube())
+
+    cached = cache.get(2020, 1, ["total_precipitation"], BBOX)
+    assert cached is not None
+    xr.testing.assert_allclose(cached, make_cube())
+
+    # manifest survives reopening the cache
+    assert DownloadCache(tmp_path, max_bytes=10**9).get(2020, 1, ["total_precipitation"], BBOX) is not None
+
+
+def test_concurrent_puts_of_the_same_cube(tmp_path: Path) -> None:
+    cache = DownloadCache(tmp_path, max_bytes=10**9)
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(lambda _: cache.put(2020, 1, ["total_precipitation"], BBOX, make_cube()), range(8)))
+
+    cached = cache.get(2020, 1, ["total_precipitation"], BBOX)
+    assert cached is not None
+    xr.testing.assert_allclose(cached, make_cube())
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_get_reuses_covering_bbox(tmp_path: Path) -> None:
+    cache = DownloadCache(tmp_path, max_bytes=10**9)
+    cache.put(2020, 1, ["total_precipitation"], BBOX, make_cube())
+
+    cached = cache.get(2020, 1, ["total_precipitation"], (30.2, 9.2, 30.4, 9.4))
+    assert cached is not None
+    assert cached.sizes["longitude"] == 5
+    assert cache.get(2020, 1, ["total_precipitation"], (29.0, 9.2, 30.4, 9.4)) is None
+    assert cache.get(2020, 1, ["2m_temperature"], BBOX) is None
+
+
+def test_get_chunked(tmp_path: Path) -> None:
+    cache = DownloadCache(tmp_path, max_bytes=10**9)
+    cache.put(2020, 1, ["total_precipitation"], BBOX, make_cube())
+
+    cached = cache.get(2020, 1, ["total_precipitation"], (30.2, 9.2, 30.4, 9.4), chunks={"valid_time": 6})
+    assert cached is not None
+    assert cached["tp"].chunks is not None
+    assert cached.chunks["valid_time"] == (6, 6, 6, 6)
+    xr.testing.assert_allclose(cached.load(), crop_to_bbox(make_cube(), (30.2, 9.2, 30.4, 9.4)))
+
+
+def test_incomplete_months_are_refetched(tmp_path: Path) -> None:
+    cache = DownloadCache(tmp_path, max_bytes=10**9)
+    now = datetime.now(UTC)
+    cache.put(now.year, now.month, ["total_precipitation"], BBOX, make_cube())
+    assert cache.get(now.year, now.month, ["total_precipitation"], BBOX) is None
+
+
+def test_lru_eviction(tmp_path: Path) -> None:
+    cache = DownloadCache(tmp_path, max_bytes=10**9)
+    cache.put(2020, 1, ["total_precipitation"], BBOX, make_cube())
+    cube_size = cache.size
+    cache.max_bytes = 2 * cube_size
+
+    cache.put(2020, 2, ["total_precipitation"], BBOX, make_cube())
+    assert cache.get(2020, 1, ["total_precipitation"], BBOX) is not None  # January is now most recently used
+    cache.put(2020, 3, ["total_precipitation"], BBOX, make_cube())
+
+    assert cache.size <= 2 * cube_size
+    assert cache.get(2020, 1, ["total_precipitation"], BBOX) is not None
+    assert cache.get(2020, 2, ["total_precipitation"], BBOX) is None
+    assert cache.get(2020, 3, ["total_precipitation"], BBOX) is not None
@@ -0,0 +1,31 @@
+"""Tests for import checkpoints."""
+
+from datetime import date
+from pathlib import Path
+
+import pytest
+
+from dhis2_era5land.checkpoint import Checkpoint
+from dhis2_era5land.window import DayWindow
+
+JANUARY = DayWindow(date(2020, 1, 1), date(2020, 1, 31))
+FEBRUARY = DayWindow(date(2020, 2, 1), date(2020, 2, 29))
+
+
+def test_resumes_imported_windows(tmp_path: Path) -> None:
+    path = tmp_path / "checkpoint.json"
+    checkpoint = Checkpoint(path, {"level": 2})
+    assert not checkpoint.is_done(JANUARY)
+    checkpoint.mark_done(JANUARY)
+
+    resumed = Checkpoint(path, {"level": 2})
+    assert len(resumed) == 1
+    assert resumed.is_done(JANUARY)
+    assert not resumed.is_done(FEBRUARY)
+
+
+def test_rejects_other_imports(tmp_path: Path) -> None:
+    path = tmp_path / "checkpoint.json"
+    Checkpoint(path, {"level": 2}).mark_done(JANUARY)
+    with pytest.raises(ValueError, match="another import"):
+        Checkpoint(path, {"level": 3})
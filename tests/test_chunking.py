@@ -0,0 +1,60 @@
+"""Tests for out-of-core aggregation."""
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+from earthkit import transforms
+
+from dhis2_era5land.chunking import Chunking
+from dhis2_era5land.settings import Settings
+
+
+def make_month() -> xr.Dataset:
+    time = pd.date_range("2020-01-01", "2020-01-31 23:00", freq="h")
+    lat = np.round(np.arange(10.0, 8.95, -0.1), 1)
+    lon = np.round(np.arange(30.0, 31.25, 0.1), 1)
+    values = np.random.default_rng(0).random((len(time), len(lat), len(lon)))
+    values[:, 0, 0] = np.nan  # e.g. a sea cell
+    return xr.Dataset(
+        {"tp": (("valid_time", "latitude", "longitude"), values)},
+        coords={"valid_time": time, "latitude": lat, "longitude": lon},
+    )
+
+
+def test_from_settings() -> None:
+    assert Chunking.from_settings(Settings()) is None
+    chunking = Chunking.from_settings(Settings(chunk_hours=48, chunk_cells=100, chunk_threads=2))
+    assert chunking == Chunking(hours=48, cells=100, threads=2)
+
+
+def test_chunk() -> None:
+    chunked = Chunking(hours=240, cells=5).chunk(make_month())
+    assert chunked.chunks["valid_time"] == (240, 240, 240, 24)
+    assert chunked.chunks["latitude"] == (5, 5, 1)
+
+    # only dimensions of the cube are chunked
+    assert Chunking(hours=24).chunk(make_month().isel(latitude=0)).chunks["valid_time"][0] == 24
+
+
+def test_daily_reduce_in_chunks_matches_in_memory(tmp_path: Path) -> None:
+    make_month().to_netcdf(tmp_path / "month.nc")
+    chunking = Chunking(hours=100, cells=4, threads=2)
+
+    with xr.open_dataset(tmp_path / "month.nc", chunks=chunking.sizes) as lazy:
+        reduced = chunking.compute(
+            transforms.temporal.daily_reduce(
+                lazy["tp"], how="sum", time_shift={"hours": 3}, remove_partial_periods=False
+            )
+        )
+    expected = transforms.temporal.daily_reduce(
+        make_month()["tp"], how="sum", time_shift={"hours": 3}, remove_partial_periods=False
+    )
+    assert reduced.chunks is None
+    xr.testing.assert_allclose(reduced, expected)
+
+
+def test_compute_returns_loaded_arrays() -> None:
+    data = make_month()["tp"]
+    assert Chunking().compute(data) is data
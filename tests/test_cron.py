@@ -0,0 +1,69 @@
+"""Tests for cron expressions."""
+
+from datetime import datetime
+
+import pytest
+
+from dhis2_era5land.cron import CronSchedule
+
+
+def test_daily() -> None:
+    cron = CronSchedule.parse("0 6 * * *")
+    assert cron.next_after(datetime(2024, 5, 1, 5, 59, 30)) == datetime(2024, 5, 1, 6, 0)
+    assert cron.next_after(datetime(2024, 5, 1, 6, 0)) == datetime(2024, 5, 2, 6, 0)
+    assert cron.next_after(datetime(2024, 12, 31, 7, 0)) == datetime(2025, 1, 1, 6, 0)
+
+
+def test_lists_ranges_and_steps() -> None:
+    cron = CronSchedule.parse("*/15 9-17 * * 1-5")
+    assert cron.minutes == {0, 15, 30, 45}
+    assert cron.hours == set(range(9, 18))
+    # Friday 17:45, then Monday 9:00
+    assert cron.next_after(datetime(2024, 5, 3, 17, 40)) == datetime(2024, 5, 3, 17, 45)
+    assert cron.next_after(datetime(2024, 5, 3, 17, 45)) == datetime(2024, 5, 6, 9, 0)
+
+    assert CronSchedule.parse("0,30 6/6 1 */3 *").hours == {6, 12, 18}
+    assert CronSchedule.parse("5-20/5 * * * *").minutes == {5, 10, 15, 20}
+
+
+def test_month_and_weekday_names() -> None:
+    assert CronSchedule.parse("0 6 * * MON") == CronSchedule.parse("0 6 * * 1")
+    assert CronSchedule.parse("0 6 * * mon-fri") == CronSchedule.parse("0 6 * * 1-5")
+    assert CronSchedule.parse("0 6 1 JAN,jul SUN") == CronSchedule.parse("0 6 1 1,7 0")
+    assert CronSchedule.parse("0 6 * * MON").next_after(datetime(2024, 5, 1)) == datetime(2024, 5, 6, 6, 0)
+    # names only stand for months and days of the week
+    with pytest.raises(ValueError):
+        CronSchedule.parse("0 6 MON * *")
+
+
+def test_sunday_is_0_and_7() -> None:
+    assert CronSchedule.parse("0 0 * * 0") == CronSchedule.parse("0 0 * * 7")
+    assert CronSchedule.parse("0 0 * * 7").matches(datetime(2024, 5, 5))  # a Sunday
+
+
+def test_day_of_month_or_day_of_week() -> None:
+    # the 1st of the month or any Monday
+    cron = CronSchedule.parse("0 0 1 * 1")
+    assert cron.next_after(datetime(2024, 5, 1)) == datetime(2024, 5, 6)
+    assert cron.next_after(datetime(2024, 5, 27)) == datetime(2024, 6, 1)
+
+
+def test_day_field_starting_with_star_is_unrestricted() -> None:
+    # as in Vixie cron, `*/2` doesn't restrict the day, so only odd days that are Mondays match
+    cron = CronSchedule.parse("0 1 */2 * 1")
+    assert cron.any_day and not cron.any_weekday
+    assert not cron.matches(datetime(2024, 5, 6, 1))  # an even Monday
+    assert not cron.matches(datetime(2024, 5, 7, 1))  # an odd Tuesday
+    assert cron.next_after(datetime(2024, 5, 1)) == datetime(2024, 5, 13, 1)
+
+
+def test_leap_day() -> None:
+    assert CronSchedule.parse("0 0 29 2 *").next_after(datetime(2024, 3, 1)) == datetime(2028, 2, 29)
+    with pytest.raises(ValueError, match="never runs"):
+        CronSchedule.parse("0 0 30 2 *").next_after(datetime(2024, 1, 1))
+
+
+@pytest.mark.parametrize("expression", ["0 6 * *", "60 * * * *", "* 24 * * *", "0 0 0 * *", "*/0 * * * *", "a * * * *"])
+def test_invalid(expression: str) -> None:
+    with pytest.raises(ValueError):
+        CronSchedule.parse(expression)
@@ -0,0 +1,159 @@
+"""Tests for imports into several DHIS2 instances sharing downloads."""
+
+import threading
+from collections import Counter
+from typing import Any
+from unittest import mock
+
+import pytest
+import xarray as xr
+
+from dhis2_era5land import importer
+from dhis2_era5land.benchmark import FakeDHIS2, synthetic_month, synthetic_org_units
+from dhis2_era5land.cache import BBox
+from dhis2_era5land.fanout import DownloadGroup, SharedDownloads, group_downloads, run_fan_out
+from dhis2_era5land.settings import InstanceSpec, Settings, VariableSpec
+
+PRECIPITATION = VariableSpec(variable="total_precipitation", data_element_id="de000000001", value_col="tp")
+
+
+def instance(name: str, **kwargs: Any) -> InstanceSpec:
+    return InstanceSpec(
+        name=name,
+        base_url=f"http://{name}.test",
+        username="admin",
+        password_env=f"{name.upper()}_PASSWORD",
+        variables=[PRECIPITATION],
+        **kwargs,
+    )
+
+
+def test_shared_downloads_keep_cubes_by_plan() -> None:
+    bbox = (30.0, -10.0, 31.0, -9.0)
+    downloads = SharedDownloads([DownloadGroup(bbox, ["total_precipitation"], ["a", "b", "c"])])
+    requests: list[tuple[int, int]] = []
+
+    def get(year: int, month: int, variables: list[str], bbox: BBox) -> xr.Dataset:
+        requests.append((year, month))
+        return synthetic_month(year, month, ["tp"], bbox)
+
+    with mock.patch.object(importer.era5_land.hourly, "get", get):
+        # "c" hasn't planned yet, so it may still need January
+        downloads.plan("a", Counter({(2024, 1): 2}))
+        downloads.get("a", 2024, 1, ["total_precipitation"], bbox)
+        assert downloads.pending == 1
+
+        # "b" is already up to date and "c" only needs February; January waits for "a" alone
+        downloads.plan("b", Counter())
+        downloads.plan("c", Counter({(2024, 2): 1}))
+        assert downloads.pending == 1
+        downloads.get("a", 2024, 1, ["total_precipitation"], bbox)
+        assert downloads.pending == 0
+
+        downloads.get("c", 2024, 2, ["total_precipitation"], bbox)
+        assert downloads.pending == 0
+
+    assert requests == [(2024, 1), (2024, 2)]
+
+
+def test_group_downloads() -> None:
+    groups = group_downloads(
+        {
+            "a": ((30.0, -10.0, 32.0, -8.0), ["total_precipitation"]),
+            "b": ((31.0, -9.0, 33.0, -7.0), ["2m_temperature"]),
+            "c": ((31.5, -8.5, 32.5, -7.5), ["total_precipitation"]),
+            "far": ((0.0, 40.0, 1.0, 41.0), ["total_precipitation"]),
+        }
+    )
+    # "b" overlaps as well, but with another variable the shared request would be much larger
+    assert sorted(sorted(group.instances) for group in groups) == [["a", "c"], ["b"], ["far"]]
+    shared = next(group for group in groups if "a" in group.instances)
+    assert shared.bbox == (30.0, -10.0, 32.5, -7.5)
+    assert shared.variables == ["total_precipitation"]
+
+    # with the same variable, "a" and "b" share one request
+    same_variable = group_downloads(
+        {
+            "a": ((30.0, -10.0, 32.0, -8.0), ["total_precipitation"]),
+            "b": ((31.0, -9.0, 33.0, -7.0), ["total_precipitation"]),
+        }
+    )
+    assert [group.instances for group in same_variable] == [["a", "b"]]
+
+
+def test_fan_out_shares_downloads() -> None:
+    clients = {name: FakeDHIS2(synthetic_org_units(4, seed=seed)) for seed, name in enumerate(["a", "b"])}
+    requests: list[BBox] = []
+    lock = threading.Lock()
+
+    def get(year: int, month: int, variables: list[str], bbox: BBox) -> xr.Dataset:
+        with lock:
+            requests.append(bbox)
+        return synthetic_month(year, month, ["tp"], bbox)
+
+    with mock.patch.object(importer.era5_land.hourly, "get", get):
+        run_fan_out(
+            [instance("a"), instance("b")],
+            Settings(aggregation_workers=0, cache_dir=None),
+            start_date="2024-01-01",
+            end_date="2024-02-29",
+            clients=clients,  # type: ignore[arg-type]
+            connections={name: client.connection for name, client in clients.items()},
+        )
+
+    # one request per month for both instances
+    assert len(requests) == 2
+    assert clients["a"].values_received == clients["b"].values_received == 4 * 60
+
+
+def test_fan_out_reports_failed_instances() -> None:
+    clients = {"a": FakeDHIS2(synthetic_org_units(4)), "b": FakeDHIS2(synthetic_org_units(4))}
+    with (
+        mock.patch.object(clients["b"], "analytics_latest_period_for_level", side_effect=RuntimeError("down")),
+        mock.patch.object(
+            importer.era5_land.hourly,
+            "get",
+            lambda year, month, variables, bbox: synthetic_month(year, month, ["tp"], bbox),
+        ),
+        pytest.raises(RuntimeError, match="Import failed for instances: b"),
+    ):
+        run_fan_out(
+            [instance("a"), instance("b")],
+            Settings(aggregation_workers=0, cache_dir=None),
+            start_date="2024-01-01",
+            end_date="2024-01-31",
+            clients=clients,  # type: ignore[arg-type]
+            connections={name: client.connection for name, client in clients.items()},
+        )
+    assert clients["a"].values_received == 4 * 31
+
+
+def test_shared_downloads_free_cubes_of_failed_instances() -> None:
+    bbox = (30.0, -10.0, 31.0, -9.0)
+    downloads = SharedDownloads([DownloadGroup(bbox, ["total_precipitation"], ["a", "b"])])
+    requests: list[tuple[int, int]] = []
+
+    def get(year: int, month: int, variables: list[str], bbox: BBox) -> xr.Dataset:
+        requests.append((year, month))
+        return synthetic_month(year, month, ["tp"], bbox)
+
+    with mock.patch.object(importer.era5_land.hourly, "get", get):
+        months = Counter({(2024, 1): 1, (2024, 2): 1, (2024, 3): 1})
+        downloads.plan("a", months)
+        downloads.plan("b", months)
+        for name in ["a", "b"]:
+            downloads.get(name, 2024, 1, ["total_precipitation"], bbox)
+        assert downloads.pending == 0
+
+        # "a" is ahead, so February is kept for "b", until "b" fails partway
+        downloads.get("a", 2024, 2, ["total_precipitation"], bbox)
+        assert downloads.pending == 1
+        downloads.release("b")
+        assert downloads.pending == 0
+
+        # later months are only needed by "a"
+        downloads.get("a", 2024, 3, ["total_precipitation"], bbox)
+        assert downloads.pending == 0
+        downloads.release("a")
+
+    assert requests == [(2024, 1), (2024, 2), (2024, 3)]
@@ -0,0 +1,289 @@
+"""Tests for aggregation post-processing."""
+
+import logging
+import pickle
+from dataclasses import replace
+from datetime import date
+from functools import partial
+from pathlib import Path
+from typing import Any, cast
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from dhis2_era5land import importer
+from dhis2_era5land import weights as weights_module
+from dhis2_era5land.benchmark import FakeDHIS2, synthetic_month, synthetic_org_units
+from dhis2_era5land.cache import BBox
+from dhis2_era5land.importer import ImportOptions, aggregate_month, drop_invalid_values
+from dhis2_era5land.orgunits import get_org_units
+from dhis2_era5land.periods import PeriodType
+from dhis2_era5land.pipeline import create_aggregation_pool
+from dhis2_era5land.progress import ImportProgress
+from dhis2_era5land.serialize import DataValueColumns
+from dhis2_era5land.settings import Settings, VariableSpec
+from dhis2_era5land.sinks import DHIS2Sink, StoreSink
+from dhis2_era5land.weights import get_weights, land_cells, org_units_key
+
+
+def test_drop_invalid_values(caplog: pytest.LogCaptureFixture) -> None:
+    times = pd.date_range("2024-01-01", periods=3, freq="D")
+    values = np.array([[1.0, np.nan, 3.0], [np.nan, np.nan, np.inf], [4.0, 5.0, 6.0]])
+    data = xr.DataArray(values, dims=("id", "valid_time"), coords={"id": ["a", "b", "c"], "valid_time": times})
+
+    with caplog.at_level(logging.WARNING):
+        df = drop_invalid_values(data.transpose("valid_time", "id"))
+    assert df.columns.tolist() == ["id", "valid_time", "value"]
+    assert df["id"].tolist() == ["a", "a", "c", "c", "c"]
+    assert df["valid_time"].tolist() == [times[0], times[2], times[0], times[1], times[2]]
+    assert df["value"].tolist() == [1.0, 3.0, 4.0, 5.0, 6.0]
+    assert "Dropping 4 invalid values (NaN/inf) of 2 org units: b (3), a (1)" in caplog.text
+
+
+def test_drop_invalid_values_caps_sample(caplog: pytest.LogCaptureFixture) -> None:
+    ids = [f"ou{i:02d}" for i in range(20)]
+    data = xr.DataArray(
+        np.full((20, 2), np.nan),
+        dims=("id", "valid_time"),
+        coords={"id": ids, "valid_time": pd.date_range("2024-01-01", periods=2, freq="D")},
+    )
+    with caplog.at_level(logging.WARNING):
+        assert drop_invalid_values(data).empty
+    assert "ou09 (2), ..." in caplog.text
+    assert "ou10" not in caplog.text
+
+
+def test_aggregate_month_keeps_strings_encoded() -> None:
+    org_units = get_org_units(cast(Any, FakeDHIS2(synthetic_org_units(20))), 2)
+    hourly_data = synthetic_month(2024, 2, ["tp"], tuple(org_units.total_bounds))
+    specs = [
+        VariableSpec(variable="total_precipitation", data_element_id="de1", value_col="tp"),
+        VariableSpec(
+            variable="total_precipitation", data_element_id="de2", value_col="tp", period_type=PeriodType.WEEKLY
+        ),
+    ]
+    agg_df = aggregate_month(hourly_data, org_units, specs, timezone_offset=0)
+
+    for column in ("data_element", "id", "period"):
+        assert isinstance(agg_df[column].dtype, pd.CategoricalDtype)
+    assert len(agg_df) == 20 * 29 + 20 * 5
+    assert agg_df.memory_usage(deep=True).sum() / len(agg_df) < 32
+    weekly = agg_df[agg_df["data_element"] == "de2"]
+    assert sorted(weekly["period"].unique()) == ["2024W5", "2024W6", "2024W7", "2024W8", "2024W9"]
+
+    columns = DataValueColumns.from_dataframe(agg_df, "data_element", "id", "period", "value")
+    assert columns.org_units.codes.dtype == np.int8
+    assert columns.org_units[:].tolist() == agg_df["id"].astype(str).tolist()
+
+
+@pytest.mark.parametrize("how", ["mean", "max"])
+def test_aggregate_variable_leaves_out_org_units_without_data(how: str, caplog: pytest.LogCaptureFixture) -> None:
+    org_units = get_org_units(cast(Any, FakeDHIS2(synthetic_org_units(20))), 2)
+    hourly_data = synthetic_month(2024, 2, ["tp"], tuple(org_units.total_bounds))
+    # no data east of the first org unit, as over the sea
+    sea = org_units.geometry.iloc[0].bounds[2] + 0.1
+    hourly_data["tp"] = hourly_data["tp"].where(hourly_data["longitude"] < sea)
+    spec = VariableSpec(variable="total_precipitation", data_element_id="de1", value_col="tp", spatial_aggregation=how)
+
+    weights_module._memory.clear()
+    with caplog.at_level(logging.WARNING):
+        agg_df = importer.aggregate_variable(hourly_data, org_units, spec, timezone_offset=0)
+    assert "only cover grid cells without data" in caplog.text
+
+    # both spatial paths leave out the same org units up front
+    weights = get_weights(org_units, hourly_data["latitude"].values, hourly_data["longitude"].values)
+    excluded = set(weights.ids[weights.excluded(land_cells(hourly_data["tp"]))])
+    kept = set(agg_df["id"].astype(str))
+    assert excluded and kept
+    assert not kept & excluded
+    assert org_units["id"].iloc[0] in kept
+    invalid = " ".join(record.getMessage() for record in caplog.records if "invalid" in record.getMessage())
+    assert not any(uid in invalid for uid in excluded)
+    if how == "mean":
+        assert kept == set(org_units["id"]) - excluded
+        assert not invalid
+
+
+class RecordingSink:
+    def __init__(self) -> None:
+        self.values: list[pd.DataFrame] = []
+
+    def write(self, values: pd.DataFrame, month: date, level: int) -> int:
+        self.values.append(values)
+        return len(values)
+
+
+def test_local_days_have_all_hours_without_cache() -> None:
+    requests = []
+
+    def get(year: int, month: int, variables: list[str], bbox: BBox) -> xr.Dataset:
+        requests.append((year, month))
+        return xr.ones_like(synthetic_month(year, month, ["tp"], bbox))
+
+    sink = RecordingSink()
+    with mock.patch.object(importer.era5_land.hourly, "get", get):
+        importer.import_era5_land_to_dhis2(
+            ImportOptions(
+                client=cast(Any, FakeDHIS2(synthetic_org_units(2))),
+                specs=[
+                    VariableSpec(
+                        variable="total_precipitation",
+                        data_element_id="de1",
+                        value_col="tp",
+                        temporal_aggregation="sum",
+                    )
+                ],
+                start_date="2024-01-01",
+                end_date="2024-01-31",
+                timezone_offset=3,
+                org_unit_level=2,
+                sinks=[sink],
+            ),
+        )
+
+    # the first local day starts at 21:00 UTC on December 31st
+    assert requests == [(2023, 12), (2024, 1)]
+    values = pd.concat(sink.values)
+    assert values["period"].nunique() == 31
+    assert values["value"].tolist() == pytest.approx([24.0] * len(values))
+
+
+def test_months_are_downloaded_once_without_cache(caplog: pytest.LogCaptureFixture) -> None:
+    requests = []
+
+    def get(year: int, month: int, variables: list[str], bbox: BBox) -> xr.Dataset:
+        requests.append((year, month))
+        return xr.ones_like(synthetic_month(year, month, ["tp"], bbox))
+
+    sink = RecordingSink()
+    with mock.patch.object(importer.era5_land.hourly, "get", get), caplog.at_level(logging.WARNING):
+        importer.import_era5_land_to_dhis2(
+            ImportOptions(
+                client=cast(Any, FakeDHIS2(synthetic_org_units(2))),
+                specs=[VariableSpec(variable="total_precipitation", data_element_id="de1", value_col="tp")],
+                start_date="2024-01-01",
+                end_date="2024-03-31",
+                timezone_offset=3,
+                org_unit_level=2,
+                sinks=[sink],
+                download_concurrency=2,
+            ),
+        )
+
+    # January and February are needed by two windows each, but downloaded once
+    assert sorted(requests) == [(2023, 12), (2024, 1), (2024, 2), (2024, 3)]
+    assert "No download cache" in caplog.text
+    assert pd.concat(sink.values)["period"].nunique() == 31 + 29 + 31
+
+
+def test_first_window_starts_with_era5_land() -> None:
+    requests = []
+
+    def get(year: int, month: int, variables: list[str], bbox: BBox) -> xr.Dataset:
+        requests.append((year, month))
+        return xr.ones_like(synthetic_month(year, month, ["tp"], bbox))
+
+    sink = RecordingSink()
+    with mock.patch.object(importer.era5_land.hourly, "get", get):
+        importer.import_era5_land_to_dhis2(
+            ImportOptions(
+                client=cast(Any, FakeDHIS2(synthetic_org_units(2))),
+                specs=[VariableSpec(variable="total_precipitation", data_element_id="de1", value_col="tp")],
+                start_date="1950-01-01",
+                end_date="1950-01-31",
+                timezone_offset=3,
+                org_unit_level=2,
+                sinks=[sink],
+            ),
+        )
+
+    # December 1949 isn't in ERA5-Land, so the first day has the hours from midnight UTC
+    assert requests == [(1950, 1)]
+    assert pd.concat(sink.values)["period"].nunique() == 31
+
+
+def test_progress_counts_values_posted_to_dhis2() -> None:
+    client = FakeDHIS2(synthetic_org_units(2))
+    progress = ImportProgress()
+    with mock.patch.object(
+        importer.era5_land.hourly,
+        "get",
+        lambda year, month, variables, bbox: synthetic_month(year, month, ["tp"], bbox),
+    ):
+        importer.import_era5_land_to_dhis2(
+            ImportOptions(
+                client=cast(Any, client),
+                specs=[VariableSpec(variable="total_precipitation", data_element_id="de1", value_col="tp")],
+                start_date="2024-01-01",
+                end_date="2024-01-31",
+                timezone_offset=0,
+                org_unit_level=2,
+                sinks=[mock.Mock(write=mock.Mock(return_value=0)), DHIS2Sink(client.connection)],
+            ),
+            progress=progress,
+        )
+    assert progress.values_posted == client.values_received == 2 * 31
+
+
+def test_import_options_from_settings(tmp_path: Path) -> None:
+    client = FakeDHIS2(synthetic_org_units(2))
+    settings = Settings(
+        base_url="http://dhis2.test",
+        data_element_id="de1",
+        value_col="tp",
+        start_date="2024-01-01",
+        end_date="2024-01-31",
+        timezone_offset=0,
+        cache_dir=str(tmp_path / "cache"),
+        ledger_path=str(tmp_path / "ledger.db"),
+        store_dir=str(tmp_path / "store"),
+        aggregation_workers=0,
+        chunk_hours=0,
+    )
+    options = ImportOptions.from_settings(
+        settings, dry_run=True, client=cast(Any, client), connection=client.connection
+    )
+
+    assert options.dry_run is True
+    assert [spec.data_element_id for spec in options.specs] == ["de1"]
+    assert options.cache is not None and options.cache.directory == tmp_path / "cache"
+    dhis2, store = options.sinks
+    assert isinstance(dhis2, DHIS2Sink) and dhis2.dry_run and dhis2.ledger is not None
+    assert isinstance(store, StoreSink) and store.directory == tmp_path / "store" and store.dry_run
+
+    # the options run an import as they are
+    sink = RecordingSink()
+    with mock.patch.object(
+        importer.era5_land.hourly,
+        "get",
+        lambda year, month, variables, bbox: synthetic_month(year, month, ["tp"], bbox),
+    ):
+        importer.import_era5_land_to_dhis2(replace(options, sinks=[sink]))
+    assert sum(len(values) for values in sink.values) == 2 * 31
+
+
+def test_aggregation_processes_get_org_units_by_file(tmp_path: Path) -> None:
+    org_units = get_org_units(cast(Any, FakeDHIS2(synthetic_org_units(50))), 2)
+    xmin, ymin, xmax, ymax = (float(v) for v in org_units.total_bounds)
+    org_units_file = importer.OrgUnitsFile.write(org_units, tmp_path)
+    aggregate = partial(
+        aggregate_month,
+        org_units=org_units_file,
+        specs=[VariableSpec(variable="total_precipitation", data_element_id="de1", value_col="tp")],
+        timezone_offset=0,
+        geometries_key=org_units_key(org_units),
+    )
+    # the pickled task holds a path, not the geometries
+    assert len(pickle.dumps(aggregate)) < len(pickle.dumps(org_units)) / 4
+
+    pool = create_aggregation_pool(1)
+    try:
+        hourly = synthetic_month(2024, 1, ["tp"], (xmin, ymin, xmax, ymax))
+        in_process = aggregate_month(hourly, org_units, aggregate.keywords["specs"], 0)
+        on_worker = pool.submit(aggregate, hourly).result()
+    finally:
+        pool.shutdown()
+    pd.testing.assert_frame_equal(on_worker, in_process)
@@ -0,0 +1,133 @@
+"""Tests for import jobs."""
+
+import threading
+import time
+from typing import Any
+
+from dhis2_era5land.jobs import Job, JobManager, JobStatus
+from dhis2_era5land.progress import ImportProgress
+from dhis2_era5land.timing import timed
+
+
+def wait_for(job: Job, timeout: float = 5.0) -> Job:
+    deadline = time.monotonic() + timeout
+    while job.status in (JobStatus.QUEUED, JobStatus.RUNNING):
+        assert time.monotonic() < deadline, f"job still {job.status}"
+        time.sleep(0.01)
+    return job
+
+
+class BlockingRun:
+    """Import stand-in that runs until released or cancelled."""
+
+    def __init__(self) -> None:
+        self.release = threading.Event()
+        self.started = threading.Event()
+        self.calls: list[dict[str, Any]] = []
+
+    def __call__(self, params: dict[str, Any], progress: ImportProgress) -> None:
+        self.calls.append(params)
+        progress.windows_total = 2
+        self.started.set()
+        while not self.release.wait(0.01):
+            progress.check_cancelled()
+        with timed("post") as span:
+            span.rows = 10
+        progress.window_done(10)
+
+
+def test_job_succeeds_with_progress() -> None:
+    run = BlockingRun()
+    manager = JobManager(run)
+    job, created = manager.submit({"dry_run": True})
+    assert created
+    run.release.set()
+
+    wait_for(job)
+    assert job.status == JobStatus.SUCCEEDED
+    assert (job.progress.windows_total, job.progress.windows_done, job.progress.values_posted) == (2, 1, 10)
+    assert job.stages()["post"].rows == 10
+    assert manager.get(job.id) is job
+
+
+def test_identical_requests_share_a_job() -> None:
+    run = BlockingRun()
+    manager = JobManager(run)
+    first, _ = manager.submit({"dry_run": False})
+    second, created = manager.submit({"dry_run": False})
+    other, other_created = manager.submit({"dry_run": True})
+    assert second is first and not created
+    assert other is not first and other_created
+    run.release.set()
+    wait_for(first)
+    wait_for(other)
+    assert len(run.calls) == 2
+
+    # finished jobs don't absorb new requests
+    again, created = manager.submit({"dry_run": False})
+    assert created and again is not first
+    wait_for(again)
+
+
+def test_jobs_with_the_same_target_run_one_at_a_time() -> None:
+    run = BlockingRun()
+    manager = JobManager(run, workers=3)
+    target = {"base_url": "http://dhis2.test", "ledger_path": "/data/ledger.db"}
+    first, _ = manager.submit({"dry_run": False}, target)
+    dry_run, created = manager.submit({"dry_run": True}, target)
+    other, other_created = manager.submit({"dry_run": False}, {**target, "base_url": "http://other.test"})
+    assert created and other_created and other is not first
+
+    # the other target runs alongside, the dry run waits for the import sharing its ledger
+    deadline = time.monotonic() + 5
+    while len(run.calls) < 2:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    time.sleep(0.05)
+    assert len(run.calls) == 2
+    assert dry_run.status == JobStatus.QUEUED and dry_run.started is None
+
+    run.release.set()
+    for job in (first, dry_run, other):
+        assert wait_for(job).status == JobStatus.SUCCEEDED
+    assert dry_run.started is not None and first.finished is not None and dry_run.started >= first.finished
+
+    # no lock is kept for targets without jobs
+    deadline = time.monotonic() + 5
+    while manager._target_locks:
+        assert time.monotonic() < deadline, "target locks not released"
+        time.sleep(0.01)
+
+
+def test_cancel_queued_and_running_jobs() -> None:
+    run = BlockingRun()
+    manager = JobManager(run, workers=1)
+    running, _ = manager.submit({"n": 1})
+    queued, _ = manager.submit({"n": 2})
+    assert run.started.wait(5)
+    assert queued.started is None
+
+    manager.cancel(queued.id)
+    assert queued.status == JobStatus.CANCELLED
+    manager.cancel(running.id)
+    assert wait_for(running).status == JobStatus.CANCELLED
+    assert len(run.calls) == 1
+
+
+def test_failed_job_records_error() -> None:
+    def fail(params: dict[str, Any], progress: ImportProgress) -> None:
+        raise RuntimeError("DHIS2 unreachable")
+
+    job, _ = JobManager(fail).submit({})
+    assert wait_for(job).status == JobStatus.FAILED
+    assert job.error == "DHIS2 unreachable"
+
+
+def test_history_is_limited() -> None:
+    run = BlockingRun()
+    run.release.set()
+    manager = JobManager(run, history=2)
+    for i in range(4):
+        wait_for(manager.submit({"n": i})[0])
+    manager.submit({"n": 4})
+    assert len(manager.jobs()) <= 3
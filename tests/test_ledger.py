@@ -0,0 +1,48 @@
+"""Tests for the ledger of sent data values."""
+
+from pathlib import Path
+
+import numpy as np
+
+from dhis2_era5land.ledger import ValueLedger
+from dhis2_era5land.serialize import DataValueColumns
+
+
+def make_columns(values: list[float], periods: list[str] | None = None, data_element: str = "de1") -> DataValueColumns:
+    n = len(values)
+    return DataValueColumns(
+        data_elements=np.array([data_element] * n),
+        org_units=np.array([f"ou{i}" for i in range(n)]),
+        periods=np.array(periods or ["20240101"] * n),
+        values=np.array([str(v) for v in values]),
+    )
+
+
+def test_empty_ledger_marks_everything_changed(tmp_path: Path) -> None:
+    ledger = ValueLedger(tmp_path / "ledger.sqlite")
+    assert ledger.changed(make_columns([1.0, 2.0])).tolist() == [True, True]
+
+
+def test_only_new_and_changed_values(tmp_path: Path) -> None:
+    ledger = ValueLedger(tmp_path / "ledger.sqlite", tolerance=0.01)
+    ledger.record(make_columns([1.0, 2.0]))
+
+    columns = make_columns([1.005, 2.5, 3.0])
+    assert ledger.changed(columns).tolist() == [False, True, True]
+
+    # recording updates existing values
+    ledger.record(columns.take(ledger.changed(columns)))
+    assert not ledger.changed(make_columns([1.0, 2.5, 3.0])).any()
+
+
+def test_keyed_by_period_and_data_element(tmp_path: Path) -> None:
+    ledger = ValueLedger(tmp_path / "ledger.sqlite")
+    ledger.record(make_columns([1.0], periods=["20240101"]))
+
+    assert ledger.changed(make_columns([1.0], periods=["20240102"])).tolist() == [True]
+    assert ledger.changed(make_columns([1.0], data_element="de2")).tolist() == [True]
+
+
+def test_ledger_persists(tmp_path: Path) -> None:
+    ValueLedger(tmp_path / "ledger.sqlite").record(make_columns([1.0]))
+    assert ValueLedger(tmp_path / "ledger.sqlite").changed(make_columns([1.0])).tolist() == [False]
@@ -0,0 +1,48 @@
+"""Tests for run summaries and Prometheus metrics."""
+
+import json
+
+import pytest
+
+from dhis2_era5land.metrics import render_prometheus, reset_runs, track_run
+from dhis2_era5land.timing import reset_stage_stats, timed
+
+
+def test_track_run_records_stages_of_the_run() -> None:
+    reset_stage_stats()
+    with timed("download"):
+        pass
+
+    with track_run() as summary:
+        with timed("spatial") as span:
+            span.rows = 42
+
+    assert summary.status == "success"
+    assert set(summary.stages) == {"spatial"}
+    assert summary.stages["spatial"].rows == 42
+    data = json.loads(json.dumps(summary.to_dict()))
+    assert data["stages"]["spatial"]["calls"] == 1
+    assert data["peak_rss"] > 0
+
+
+def test_track_run_records_failures() -> None:
+    with pytest.raises(RuntimeError), track_run() as summary:
+        raise RuntimeError("CDS unavailable")
+    assert summary.status == "failed"
+    assert summary.error == "CDS unavailable"
+
+
+def test_render_prometheus() -> None:
+    reset_stage_stats()
+    reset_runs()
+    with track_run():
+        with timed("post") as span:
+            span.rows = 10
+            span.bytes = 1000
+
+    text = render_prometheus()
+    assert "# TYPE dhis2_era5land_stage_seconds_total counter" in text
+    assert 'dhis2_era5land_stage_rows_total{stage="post"} 10' in text
+    assert 'dhis2_era5land_stage_bytes_total{stage="post"} 1000' in text
+    assert 'dhis2_era5land_runs_total{status="success"} 1' in text
+    assert "dhis2_era5land_last_run_success 1" in text
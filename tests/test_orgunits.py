@@ -0,0 +1,65 @@
+"""Tests for fetching and caching org unit geometries."""
+
+from pathlib import Path
+from typing import Any, cast
+from unittest import mock
+
+import shapely
+
+from dhis2_era5land.benchmark import FakeDHIS2, synthetic_org_units
+from dhis2_era5land.orgunits import OrgUnitCache, fetch_org_units, get_org_units, simplify_org_units
+
+
+def test_fetch_org_units() -> None:
+    client = FakeDHIS2(synthetic_org_units(5))
+    org_units = fetch_org_units(cast(Any, client), 2)
+    assert org_units["id"].tolist() == [f"ou{i:09d}" for i in range(5)]
+    assert org_units.crs == "EPSG:4326"
+    assert (org_units.geometry.geom_type == "Polygon").all()
+
+
+def test_cache_fetches_only_changed_org_units(tmp_path: Path) -> None:
+    features = synthetic_org_units(5)
+    client = FakeDHIS2(features)
+    cache = OrgUnitCache(tmp_path)
+    first = cache.get(cast(Any, client), 2)
+
+    # unchanged: the stored geometries are returned as they were
+    with mock.patch.object(client, "get", wraps=client.get) as get:
+        cached = cache.get(cast(Any, client), 2)
+    assert shapely.equals(cached.geometry.values, first.geometry.values).all()
+    assert get.call_args_list[0].kwargs["params"]["filter"][1] == "lastUpdated:gt:2024-01-01T00:00:00.000"
+
+    # one org unit moved, one was deleted
+    moved = features["features"][1]
+    moved["properties"]["lastUpdated"] = "2024-06-01T00:00:00.000"
+    moved["geometry"] = {"type": "Polygon", "coordinates": [[[0, 0], [1, 0], [1, 1], [0, 0]]]}
+    del features["features"][3]
+    refreshed = cache.get(cast(Any, client), 2)
+    assert refreshed["id"].tolist() == ["ou000000000", "ou000000001", "ou000000002", "ou000000004"]
+    assert refreshed.geometry.iloc[1].equals(shapely.Polygon([(0, 0), (1, 0), (1, 1)]))
+    assert OrgUnitCache(tmp_path).get(cast(Any, client), 2)["id"].tolist() == refreshed["id"].tolist()
+
+    # the geometry of one org unit was removed, so its old shape is dropped too
+    removed = features["features"][0]
+    removed["properties"]["lastUpdated"] = "2024-07-01T00:00:00.000"
+    removed["geometry"] = None
+    assert cache.get(cast(Any, client), 2)["id"].tolist() == ["ou000000001", "ou000000002", "ou000000004"]
+
+
+def test_simplify_org_units() -> None:
+    client = FakeDHIS2(synthetic_org_units(1))
+    org_units = fetch_org_units(cast(Any, client), 2)
+    circle = shapely.Point(0, 0).buffer(1.0, quad_segs=64)
+    org_units.geometry = [circle]
+    simplified = simplify_org_units(org_units, 0.01)
+    assert shapely.get_num_coordinates(simplified.geometry.iloc[0]) < shapely.get_num_coordinates(circle)
+    assert abs(simplified.geometry.iloc[0].area / circle.area - 1) < 0.01
+    assert simplify_org_units(org_units, 0.0) is org_units
+
+
+def test_get_org_units_uses_cache(tmp_path: Path) -> None:
+    client = FakeDHIS2(synthetic_org_units(3))
+    org_units = get_org_units(cast(Any, client), 2, tmp_path)
+    assert len(org_units) == 3
+    assert len(list(tmp_path.glob("org-units-*-level-2.npz"))) == 1
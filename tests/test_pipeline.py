@@ -0,0 +1,92 @@
+"""Tests for the staged month pipeline."""
+
+import threading
+import time
+
+import pytest
+
+from dhis2_era5land.pipeline import create_aggregation_pool, run_pipeline
+
+
+def slow_download(item: int) -> int:
+    # later items finish first, so ordering has to come from the pipeline
+    time.sleep(0.01 * (5 - item))
+    return item
+
+
+def test_uploads_in_order() -> None:
+    uploaded: list[tuple[int, str]] = []
+    run_pipeline(
+        range(5),
+        download=slow_download,
+        aggregate=str,
+        upload=lambda item, result: uploaded.append((item, result)),
+        download_workers=4,
+        max_pending=4,
+    )
+    assert uploaded == [(i, str(i)) for i in range(5)]
+
+
+def test_uploads_in_order_with_process_pool() -> None:
+    uploaded: list[tuple[int, int]] = []
+    run_pipeline(
+        [-1, -2, -3],
+        download=slow_download,
+        aggregate=abs,
+        upload=lambda item, result: uploaded.append((item, result)),
+        download_workers=2,
+        aggregation_workers=2,
+    )
+    assert uploaded == [(-1, 1), (-2, 2), (-3, 3)]
+
+
+def test_shared_process_pool_is_kept_open() -> None:
+    pool = create_aggregation_pool(1)
+    try:
+        for _ in range(2):
+            uploaded: list[str] = []
+            run_pipeline(
+                range(3),
+                download=slow_download,
+                aggregate=str,
+                upload=lambda item, result: uploaded.append(result),
+                aggregation_pool=pool,
+            )
+            assert uploaded == ["0", "1", "2"]
+    finally:
+        pool.shutdown()
+
+
+def test_max_pending_bounds_downloads() -> None:
+    lock = threading.Lock()
+    in_flight = 0
+    max_in_flight = 0
+
+    def download(item: int) -> int:
+        nonlocal in_flight, max_in_flight
+        with lock:
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+        return item
+
+    def upload(item: int, result: int) -> None:
+        nonlocal in_flight
+        time.sleep(0.01)
+        with lock:
+            in_flight -= 1
+
+    run_pipeline(range(10), download=download, aggregate=abs, upload=upload, download_workers=2, max_pending=2)
+    # the pending window plus the item being uploaded
+    assert max_in_flight <= 3
+
+
+def test_download_error_propagates() -> None:
+    def download(item: int) -> int:
+        if item == 2:
+            raise RuntimeError("CDS request failed")
+        return item
+
+    uploaded: list[int] = []
+    with pytest.raises(RuntimeError, match="CDS request failed"):
+        run_pipeline(range(5), download=download, aggregate=abs, upload=lambda item, _: uploaded.append(item))
+    assert uploaded == [0, 1]
@@ -0,0 +1,49 @@
+"""Tests for the scheduler."""
+
+import threading
+from typing import Any
+
+import pytest
+
+from dhis2_era5land.jobs import JobManager, JobStatus
+from dhis2_era5land.progress import ImportProgress
+from dhis2_era5land.scheduler import Scheduler
+from dhis2_era5land.settings import ScheduleSpec
+
+DAILY = ScheduleSpec(name="daily", cron="0 6 * * *")
+HOURLY = ScheduleSpec(name="hourly", cron="0 * * * *")
+
+
+def test_skips_tick_while_previous_run_is_active() -> None:
+    release = threading.Event()
+    runs: list[str] = []
+
+    def run(params: dict[str, Any], progress: ImportProgress) -> None:
+        runs.append(params["schedule"])
+        release.wait(5)
+
+    scheduler = Scheduler([DAILY, HOURLY], JobManager(run, workers=2))
+    job = scheduler.submit(DAILY)
+    assert job is not None
+    assert scheduler.submit(DAILY) is None
+    # other schedules still run
+    assert scheduler.submit(HOURLY) is not None
+
+    release.set()
+    job._future.result(5)  # type: ignore[union-attr]
+    assert job.status == JobStatus.SUCCEEDED
+    assert scheduler.submit(DAILY) is not None
+
+
+def test_invalid_schedules() -> None:
+    jobs = JobManager(lambda params, progress: None)
+    with pytest.raises(ValueError, match="unique"):
+        Scheduler([DAILY, DAILY], jobs)
+    with pytest.raises(ValueError, match="hour"):
+        Scheduler([ScheduleSpec(name="bad", cron="0 25 * * *")], jobs)
+
+
+def test_stops() -> None:
+    stop = threading.Event()
+    stop.set()
+    Scheduler([DAILY], JobManager(lambda params, progress: None)).run(stop)
@@ -0,0 +1,90 @@
+"""Tests for data value serialization."""
+
+import gzip
+import json
+
+import numpy as np
+import pandas as pd
+
+from dhis2_era5land.serialize import (
+    DataValueColumns,
+    EncodedColumn,
+    PayloadFormat,
+    format_periods,
+    format_values,
+    gzip_chunks,
+    iter_payload,
+)
+
+
+def make_columns(n: int = 3) -> DataValueColumns:
+    df = pd.DataFrame(
+        {
+            "data_element": ["de1"] * n,
+            "id": [f"ou{i}" for i in range(n)],
+            "valid_time": pd.date_range("2024-01-30", periods=n, freq="D"),
+            "tp": [0.5 * i for i in range(n)],
+        }
+    )
+    return DataValueColumns.from_dataframe(
+        df, data_element_col="data_element", org_unit_col="id", period_col="valid_time", value_col="tp"
+    )
+
+
+def test_format_values_matches_scalar_formatting() -> None:
+    values = np.array([0.0, 1.0, 100.0, 8.24e-05, -2.5, 1 / 3, 12345.6789])
+    expected = [f"{v:.10f}".rstrip("0").rstrip(".") for v in values]
+    assert format_values(values).tolist() == expected
+
+
+def test_format_periods() -> None:
+    times = pd.date_range("2024-02-28", periods=3, freq="D").to_numpy()
+    assert format_periods(times).tolist() == ["20240228", "20240229", "20240301"]
+    assert format_periods(np.array(["2024W05"])).tolist() == ["2024W05"]
+
+
+def test_iter_payload_json() -> None:
+    payload = json.loads(b"".join(iter_payload(make_columns(), chunk_rows=2)))
+    assert payload == {
+        "dataValues": [
+            {"dataElement": "de1", "period": "20240130", "orgUnit": "ou0", "value": "0"},
+            {"dataElement": "de1", "period": "20240131", "orgUnit": "ou1", "value": "0.5"},
+            {"dataElement": "de1", "period": "20240201", "orgUnit": "ou2", "value": "1"},
+        ]
+    }
+
+
+def test_iter_payload_row_range() -> None:
+    payload = json.loads(b"".join(iter_payload(make_columns(5), start=1, stop=3)))
+    assert [dv["orgUnit"] for dv in payload["dataValues"]] == ["ou1", "ou2"]
+    assert json.loads(b"".join(iter_payload(make_columns(), start=0, stop=0))) == {"dataValues": []}
+
+
+def test_iter_payload_csv() -> None:
+    text = b"".join(iter_payload(make_columns(2), payload_format=PayloadFormat.CSV)).decode()
+    assert text.splitlines() == [
+        "dataelement,period,orgunit,categoryoptioncombo,attributeoptioncombo,value",
+        "de1,20240130,ou0,,,0",
+        "de1,20240131,ou1,,,0.5",
+    ]
+
+
+def test_gzip_chunks() -> None:
+    chunks = list(iter_payload(make_columns(), chunk_rows=1))
+    assert gzip.decompress(b"".join(gzip_chunks(chunks))) == b"".join(chunks)
+
+
+def test_encoded_column() -> None:
+    categorical = pd.Categorical.from_codes([1, 0, 1, 1], categories=["ou0", "ou1"])
+    column = EncodedColumn.encode(pd.Series(categorical))
+    assert column.codes.dtype == np.int8
+    assert column[1:3].tolist() == ["ou0", "ou1"]
+    assert column.take(np.array([True, False, False, True]))[:].tolist() == ["ou1", "ou1"]
+    assert column.take(np.array([1])).unique().tolist() == ["ou0"]
+    assert column.str_len().tolist() == [3, 3, 3, 3]
+
+    # plain arrays are encoded, and periods formatted once per distinct day
+    days = np.array(["2024-01-02", "2024-01-01", "2024-01-02"], dtype="datetime64[ns]")
+    periods = EncodedColumn.encode(days, format_periods)
+    assert periods.labels.tolist() == ["20240102", "20240101"]
+    assert periods[:].tolist() == ["20240102", "20240101", "20240102"]
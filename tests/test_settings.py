@@ -0,0 +1,39 @@
+"""Tests for settings."""
+
+import pytest
+
+from dhis2_era5land.settings import Settings, VariableSpec, org_unit_levels
+from dhis2_era5land.transforms import Transform
+
+
+def test_variable_specs_from_single_variable_settings() -> None:
+    settings = Settings(data_element_id="de1", variable="2m_temperature", value_col="t2m", variables=[])
+    [spec] = settings.variable_specs()
+    assert spec.data_element_id == "de1"
+    assert spec.value_col == "t2m"
+    assert spec.value_transform == settings.value_transform
+
+
+def test_variable_specs_from_variables(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv(
+        "DHIS2_VARIABLES",
+        '[{"variable": "2m_temperature", "value_col": "t2m", "data_element_id": "de2",'
+        ' "value_transform": "kelvin_to_celsius"}]',
+    )
+    [spec] = Settings().variable_specs()
+    assert spec == VariableSpec(
+        variable="2m_temperature", value_col="t2m", data_element_id="de2", value_transform=Transform.KELVIN_TO_CELSIUS
+    )
+    assert spec.value_func()(273.15) == pytest.approx(0.0)
+
+
+def test_variable_specs_require_a_data_element() -> None:
+    with pytest.raises(ValueError, match="DHIS2_DATA_ELEMENT_ID"):
+        Settings(data_element_id=None, variables=[]).variable_specs()
+
+
+def test_org_unit_levels(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("DHIS2_ORG_UNIT_LEVEL", "3")
+    assert org_unit_levels(Settings().org_unit_level) == [3]
+    monkeypatch.setenv("DHIS2_ORG_UNIT_LEVEL", "[2, 3, 4]")
+    assert org_unit_levels(Settings().org_unit_level) == [2, 3, 4]
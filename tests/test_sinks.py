@@ -0,0 +1,125 @@
+"""Tests for the DHIS2 and value store sinks."""
+
+import json
+from datetime import date
+from pathlib import Path
+
+import httpx
+import pandas as pd
+import pytest
+
+from dhis2_era5land.benchmark import FakeDHIS2, synthetic_org_units
+from dhis2_era5land.ledger import ValueLedger
+from dhis2_era5land.sinks import (
+    StoreSink,
+    create_sinks,
+    import_from_store,
+    post_month,
+    read_partition,
+    store_partitions,
+)
+from dhis2_era5land.upload import DHIS2Connection, UploadOptions
+
+pytest.importorskip("pyarrow")
+
+
+def _values(data_element: str, ids: list[str], day: str, value: float) -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "data_element": data_element,
+            "id": ids,
+            "period": day.replace("-", ""),
+            "valid_time": pd.Timestamp(day),
+            "value": value,
+        }
+    )
+
+
+def test_post_month_records_accepted_batches(tmp_path: Path) -> None:
+    def handle(request: httpx.Request) -> httpx.Response:
+        # DHIS2 ignores the values of org unit "a", e.g. in a locked period
+        body = json.loads(request.read())["dataValues"]
+        ignored = sum(value["orgUnit"] == "a" for value in body)
+        import_count = {"imported": len(body) - ignored, "ignored": ignored}
+        return httpx.Response(200, json={"response": {"importCount": import_count}})
+
+    connection = DHIS2Connection("http://dhis2.test", transport=httpx.MockTransport(handle))
+    ledger = ValueLedger(tmp_path / "ledger.sqlite")
+    values = _values("de1", ["a", "b", "c", "d"], "2024-01-01", 1.0)
+    assert post_month(connection, values, upload_options=UploadOptions(batch_size=2), ledger=ledger) == 4
+
+    # the batch with "a" is sent again, the other one is skipped
+    assert post_month(connection, values, upload_options=UploadOptions(batch_size=2), ledger=ledger) == 2
+
+
+@pytest.mark.parametrize("format", ["parquet", "arrow"])
+def test_store_round_trip(tmp_path: Path, format: str) -> None:
+    sink = StoreSink(tmp_path, format)
+    assert sink.write(_values("de1", ["a", "b"], "2024-01-01", 1.0), date(2024, 1, 1), 2) == 2
+    # rewriting a day replaces its values, other days are kept
+    sink.write(_values("de1", ["b"], "2024-01-01", 5.0), date(2024, 1, 1), 2)
+    sink.write(_values("de1", ["a", "b"], "2024-01-02", 2.0), date(2024, 1, 1), 2)
+
+    path = sink.path("de1", date(2024, 1, 1), 2)
+    assert path == tmp_path / "data_element=de1" / "month=2024-01" / f"level-2.{format}"
+    stored = read_partition(path)
+    assert stored.columns.tolist() == ["data_element", "id", "period", "valid_time", "value"]
+    assert (stored["data_element"] == "de1").all()
+    assert stored[["id", "period", "value"]].values.tolist() == [
+        ["a", "20240101", 1.0],
+        ["b", "20240101", 5.0],
+        ["a", "20240102", 2.0],
+        ["b", "20240102", 2.0],
+    ]
+
+
+def test_store_partitions(tmp_path: Path) -> None:
+    sink = StoreSink(tmp_path)
+    for data_element in ["de1", "de2"]:
+        for month in [date(2024, 2, 1), date(2024, 1, 1)]:
+            for level in [2, 3]:
+                sink.write(_values(data_element, ["a"], f"{month:%Y-%m}-01", 1.0), month, level)
+
+    partitions = store_partitions(tmp_path)
+    assert len(partitions) == 8
+    assert [path.parent.name for path in partitions[:4]] == ["month=2024-01"] * 4
+    assert len(store_partitions(tmp_path, data_elements=["de2"], start_month="2024-02", levels=[3])) == 1
+    assert store_partitions(tmp_path, end_month="2023-12") == []
+
+
+def test_store_sink_dry_run(tmp_path: Path) -> None:
+    sink = create_sinks(FakeDHIS2(synthetic_org_units(1)).connection, dry_run=True, store_dir=str(tmp_path))[1]
+    assert isinstance(sink, StoreSink) and sink.dry_run
+    assert sink.write(_values("de1", ["a", "b"], "2024-01-01", 1.0), date(2024, 1, 1), 2) == 2
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_read_partition_needs_partition_path(tmp_path: Path) -> None:
+    sink = StoreSink(tmp_path)
+    sink.write(_values("de1", ["a"], "2024-01-01", 1.0), date(2024, 1, 1), 2)
+    moved = tmp_path / "values.parquet"
+    sink.path("de1", date(2024, 1, 1), 2).rename(moved)
+    with pytest.raises(ValueError, match="Not a store partition"):
+        read_partition(moved)
+
+
+def test_create_sinks(tmp_path: Path) -> None:
+    connection = FakeDHIS2(synthetic_org_units(1)).connection
+    assert [type(sink).__name__ for sink in create_sinks(connection)] == ["DHIS2Sink"]
+    sinks = create_sinks(connection, store_dir=str(tmp_path), store_format="arrow", store_only=True)
+    assert [type(sink).__name__ for sink in sinks] == ["StoreSink"]
+    with pytest.raises(ValueError):
+        create_sinks(connection, store_only=True)
+    with pytest.raises(ValueError):
+        create_sinks(connection, store_dir=str(tmp_path), store_format="csv")
+
+
+def test_import_from_store(tmp_path: Path) -> None:
+    sink = StoreSink(tmp_path)
+    sink.write(_values("de1", ["a", "b", "c"], "2024-01-01", 1.0), date(2024, 1, 1), 2)
+    sink.write(_values("de2", ["a", "b"], "2024-02-01", 1.0), date(2024, 2, 1), 2)
+
+    client = FakeDHIS2(synthetic_org_units(1))
+    assert import_from_store(client.connection, tmp_path) == 5
+    assert client.values_received == 5
+    assert import_from_store(client.connection, tmp_path, data_elements=["de2"]) == 2
@@ -0,0 +1,46 @@
+"""Tests for startup time of the CLI and the API server.
+
+Each check runs in a fresh interpreter, so nothing imported by other tests counts.
+"""
+
+import json
+import subprocess
+import sys
+import time
+
+import pytest
+
+# Imported only when an import runs
+HEAVY_MODULES = ("numpy", "pandas", "xarray", "geopandas", "scipy", "shapely", "earthkit", "dhis2eo", "dhis2_client")
+
+# Cold start budgets in seconds, generous enough for slow CI machines
+IMPORT_BUDGET = {"dhis2_era5land.cli": 1.5, "dhis2_era5land.server": 2.5}
+HELP_BUDGET = 4.0
+
+
+def cold_import(module: str) -> tuple[float, list[str]]:
+    code = (
+        "import json, sys, time\n"
+        "start = time.perf_counter()\n"
+        f"import {module}\n"
+        "print(json.dumps([time.perf_counter() - start, sorted(sys.modules)]))"
+    )
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    seconds, modules = json.loads(result.stdout)
+    return seconds, modules
+
+
+@pytest.mark.parametrize("module", IMPORT_BUDGET)
+def test_import_budget(module: str) -> None:
+    seconds, modules = cold_import(module)
+    loaded = sorted({name.split(".")[0] for name in modules} & set(HEAVY_MODULES))
+    assert not loaded, f"{module} imports {', '.join(loaded)}"
+    assert seconds < IMPORT_BUDGET[module], f"importing {module} took {seconds:.2f}s"
+
+
+def test_help_budget() -> None:
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-m", "dhis2_era5land", "--help"], capture_output=True, text=True)
+    seconds = time.perf_counter() - start
+    assert result.returncode == 0
+    assert seconds < HELP_BUDGET, f"--help took {seconds:.2f}s"
@@ -0,0 +1,148 @@
+"""Tests for grid-aligned download tiles."""
+
+import threading
+import time
+from typing import Any
+from unittest import mock
+
+import geopandas as gpd
+import numpy as np
+import shapely
+import xarray as xr
+
+from dhis2_era5land import importer
+from dhis2_era5land.benchmark import FakeDHIS2, synthetic_month
+from dhis2_era5land.cache import BBox
+from dhis2_era5land.settings import VariableSpec
+from dhis2_era5land.sinks import create_sinks
+from dhis2_era5land.tiling import covered_cells, grid_cells, merge_tiles, plan_tiles, snap_bbox
+
+# two islands at opposite corners of a 3x3 degree bbox
+ISLANDS = [shapely.box(30.02, -10.0, 30.48, -9.53), shapely.box(32.52, -7.48, 32.98, -7.02)]
+
+
+def org_units(geometries: list[shapely.Geometry]) -> gpd.GeoDataFrame:
+    return gpd.GeoDataFrame({"id": [f"ou{i}" for i in range(len(geometries))]}, geometry=geometries, crs="EPSG:4326")
+
+
+def tile_mask(plan_tiles: list[BBox], lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    mask = np.zeros((len(lat), len(lon)), dtype=bool)
+    for xmin, ymin, xmax, ymax in plan_tiles:
+        mask[np.ix_((lat >= ymin - 1e-9) & (lat <= ymax + 1e-9), (lon >= xmin - 1e-9) & (lon <= xmax + 1e-9))] = True
+    return mask
+
+
+def test_snap_bbox() -> None:
+    assert snap_bbox((30.03, -10.0, 30.51, -9.41)) == (30.0, -10.0, 30.6, -9.4)
+    assert grid_cells((30.0, -10.0, 30.6, -9.4)) == 7 * 7
+
+
+def test_plan_tiles_covers_islands() -> None:
+    units = org_units(ISLANDS)
+    plan = plan_tiles(units, max_tiles=4)
+    assert len(plan.tiles) == 2
+    assert plan.bbox_cells == 31 * 31
+    assert plan.saved_cells > 0.9 * plan.bbox_cells
+
+    # every grid cell of an org unit is in a tile
+    mask, lat, lon = covered_cells(units)
+    assert (tile_mask(plan.tiles, lat, lon) >= mask).all()
+
+    # one tile is the bbox of the covered cells
+    assert plan_tiles(units, max_tiles=1).cells == plan.bbox_cells
+
+
+def test_plan_tiles_l_shape() -> None:
+    l_shape = shapely.union(shapely.box(30.0, -10.0, 30.5, -7.0), shapely.box(30.0, -10.0, 33.0, -9.5))
+    units = org_units([l_shape])
+    plan = plan_tiles(units, max_tiles=4)
+    assert len(plan.tiles) == 2
+    mask, lat, lon = covered_cells(units)
+    assert (tile_mask(plan.tiles, lat, lon) >= mask).all()
+    assert plan.cells < 0.5 * plan.bbox_cells
+
+
+def test_merge_tiles() -> None:
+    first = synthetic_month(2024, 1, ["tp"], (30.0, -10.0, 30.2, -9.8))
+    second = synthetic_month(2024, 1, ["tp"], (30.5, -9.5, 30.6, -9.4), seed=1)
+    merged = merge_tiles([first, second])
+    assert merged["latitude"].values.tolist() == [-9.4, -9.5, -9.8, -9.9, -10.0]
+    assert merged["longitude"].values.tolist() == [30.0, 30.1, 30.2, 30.5, 30.6]
+    xr.testing.assert_equal(merged["tp"].sel(latitude=first["latitude"], longitude=first["longitude"]), first["tp"])
+    assert np.isnan(merged["tp"].sel(latitude=-9.4, longitude=30.0)).all()
+
+
+def island_features() -> dict[str, Any]:
+    return {
+        "type": "FeatureCollection",
+        "features": [
+            {"type": "Feature", "id": f"ou{i}", "properties": {"name": f"Island {i}"}, "geometry": geometry}
+            for i, geometry in enumerate(shapely.geometry.mapping(island) for island in ISLANDS)
+        ],
+    }
+
+
+def test_import_downloads_tiles() -> None:
+    client = FakeDHIS2(island_features())
+    requests: list[BBox] = []
+    lock = threading.Lock()
+
+    def get(year: int, month: int, variables: list[str], bbox: BBox) -> xr.Dataset:
+        with lock:
+            requests.append(bbox)
+        return synthetic_month(year, month, ["tp"], bbox)
+
+    with mock.patch.object(importer.era5_land.hourly, "get", get):
+        importer.import_era5_land_to_dhis2(
+            importer.ImportOptions(
+                client=client,  # type: ignore[arg-type]
+                specs=[VariableSpec(variable="total_precipitation", data_element_id="de000000001", value_col="tp")],
+                start_date="2024-01-01",
+                end_date="2024-01-31",
+                timezone_offset=0,
+                org_unit_level=2,
+                sinks=create_sinks(client.connection),
+                download_tiles=4,
+            ),
+        )
+
+    # one request per tile, each much smaller than the bbox
+    assert len(requests) == 2
+    assert all(grid_cells(bbox) < 0.05 * grid_cells((30.0, -10.0, 33.0, -7.0)) for bbox in requests)
+    assert client.values_received == 2 * 31
+
+
+def test_tiles_share_download_concurrency() -> None:
+    client = FakeDHIS2(island_features())
+    lock = threading.Lock()
+    in_flight = 0
+    max_in_flight = 0
+
+    def get(year: int, month: int, variables: list[str], bbox: BBox) -> xr.Dataset:
+        nonlocal in_flight, max_in_flight
+        with lock:
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+        time.sleep(0.05)
+        with lock:
+            in_flight -= 1
+        return synthetic_month(year, month, ["tp"], bbox)
+
+    with mock.patch.object(importer.era5_land.hourly, "get", get):
+        importer.import_era5_land_to_dhis2(
+            importer.ImportOptions(
+                client=client,  # type: ignore[arg-type]
+                specs=[VariableSpec(variable="total_precipitation", data_element_id="de000000001", value_col="tp")],
+                start_date="2024-01-01",
+                end_date="2024-03-31",
+                timezone_offset=0,
+                org_unit_level=2,
+                sinks=create_sinks(client.connection),
+                download_concurrency=2,
+                download_tiles=4,
+            ),
+        )
+
+    # 3 months of 2 tiles each, but never more requests than download_concurrency
+    assert max_in_flight == 2
+    assert client.values_received == 2 * (31 + 29 + 31)
@@ -0,0 +1,58 @@
+"""Tests for stage statistics."""
+
+from dhis2_era5land.timing import (
+    StageStats,
+    add_stage_stats,
+    call_timed,
+    reset_stage_stats,
+    stage_stats,
+    stage_stats_since,
+    timed,
+    timed_iter,
+)
+
+
+def test_spans_add_up() -> None:
+    reset_stage_stats()
+    with timed("a") as span:
+        span.rows = 10
+    with timed("a") as span:
+        span.rows = 5
+        span.bytes = 100
+    add_stage_stats({"b": StageStats(seconds=1.5, calls=1)})
+
+    stats = stage_stats()
+    assert set(stats) == {"a", "b"}
+    assert (stats["a"].calls, stats["a"].rows, stats["a"].bytes) == (2, 15, 100)
+    assert stats["a"].peak_rss > 0
+    assert stats["b"].seconds == 1.5
+
+
+def test_timed_iter_records_bytes() -> None:
+    reset_stage_stats()
+    assert list(timed_iter("produce", [b"ab", b"cde"])) == [b"ab", b"cde"]
+    assert stage_stats()["produce"].bytes == 5
+
+
+def test_stage_stats_since_snapshot() -> None:
+    reset_stage_stats()
+    with timed("a"):
+        pass
+    snapshot = stage_stats()
+    with timed("b") as span:
+        span.rows = 3
+
+    since = stage_stats_since(snapshot)
+    assert set(since) == {"b"}
+    assert since["b"].rows == 3
+
+
+def test_call_timed_returns_stage_stats() -> None:
+    def work(x: int) -> int:
+        with timed("work"):
+            return x * 2
+
+    add_stage_stats({"earlier": StageStats(seconds=1.0, calls=1)})
+    result, stats = call_timed(work, 21)
+    assert result == 42
+    assert set(stats) == {"work"}
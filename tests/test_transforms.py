@@ -1,7 +1,11 @@
 """Tests for value transforms."""
 
+import numpy as np
+
 from dhis2_era5land.transforms import (
+    ScaleOffset,
     Transform,
+    compose,
     get_transform,
     identity,
     kelvin_to_celsius,
@@ -40,3 +44,27 @@ def test_get_transform() -> None:
     assert get_transform(Transform.METERS_TO_MILLIMETERS) == meters_to_millimeters
     assert get_transform(Transform.KELVIN_TO_CELSIUS) == kelvin_to_celsius
     assert get_transform(Transform.IDENTITY) == identity
+
+
+def test_transforms_are_vectorized() -> None:
+    values = np.array([273.15, 373.15])
+    np.testing.assert_allclose(kelvin_to_celsius(values), [0.0, 100.0])
+    np.testing.assert_allclose(meters_to_millimeters(np.array([0.001, 0.002])), [1.0, 2.0])
+
+
+def test_scale_offset() -> None:
+    func = ScaleOffset(scale=2.0, offset=1.0)
+    assert func(3.0) == 7.0
+    np.testing.assert_allclose(func(np.array([0.0, 1.0])), [1.0, 3.0])
+
+
+def test_compose() -> None:
+    func = compose(kelvin_to_celsius, ScaleOffset(scale=10.0))
+    np.testing.assert_allclose(func(np.array([273.15, 274.15])), [0.0, 10.0])
+    assert compose(identity, meters_to_millimeters) == meters_to_millimeters
+    assert compose() == identity
+
+
+def test_get_transform_with_scale_offset() -> None:
+    func = get_transform(Transform.KELVIN_TO_CELSIUS, scale=2.0, offset=1.0)
+    np.testing.assert_allclose(func(np.array([273.15, 283.15])), [1.0, 21.0])
@@ -0,0 +1,228 @@
+"""Tests for batched DHIS2 uploads."""
+
+import asyncio
+import gzip
+import importlib.util
+import json
+import threading
+from typing import Any
+
+import httpx
+import numpy as np
+import pytest
+
+from dhis2_era5land.serialize import DataValueColumns, PayloadFormat
+from dhis2_era5land.settings import Settings
+from dhis2_era5land.upload import (
+    DHIS2Connection,
+    UploadOptions,
+    post_data_values,
+    post_data_values_async,
+    require_http2,
+    split_batches,
+    sum_import_counts,
+)
+
+
+def make_columns(n: int) -> DataValueColumns:
+    return DataValueColumns(
+        data_elements=np.full(n, "de"),
+        org_units=np.array([f"ou{i}" for i in range(n)]),
+        periods=np.full(n, "20240101"),
+        values=np.full(n, "1.5"),
+    )
+
+
+def no_wait(**kwargs: Any) -> UploadOptions:
+    return UploadOptions(retry_backoff=0.0, poll_interval=0.0, **kwargs)
+
+
+class FakeDHIS2:
+    """Answers dataValueSets and task requests like DHIS2."""
+
+    def __init__(self, failures: int = 0) -> None:
+        self.bodies: list[bytes] = []
+        self.requests: list[httpx.Request] = []
+        self.failures = failures
+        self.lock = threading.Lock()
+        self.jobs: dict[str, int] = {}
+        self.polls = 0
+        self.connection = DHIS2Connection("http://dhis2.test", transport=httpx.MockTransport(self.handle))
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        if request.method == "GET":
+            return httpx.Response(200, json=self.get(request.url.path))
+        assert request.url.path == "/api/dataValueSets"
+        body = request.read()
+        with self.lock:
+            if self.failures > 0:
+                self.failures -= 1
+                return httpx.Response(503, json={"message": "unavailable"})
+            self.bodies.append(body)
+            self.requests.append(request)
+            count = self.count_values(body)
+            if request.url.params.get("async") == "true":
+                job_id = f"job{len(self.bodies)}"
+                self.jobs[job_id] = count
+                return httpx.Response(200, json={"response": {"id": job_id, "jobType": "DATAVALUE_IMPORT"}})
+        return httpx.Response(200, json={"response": {"importCount": {"imported": count, "updated": 0}}})
+
+    @staticmethod
+    def count_values(body: bytes) -> int:
+        if body[:2] == b"\x1f\x8b":
+            body = gzip.decompress(body)
+        if body.startswith(b"{"):
+            return len(json.loads(body)["dataValues"])
+        return len(body.decode().splitlines()) - 1
+
+    def get(self, path: str) -> Any:
+        job_id = path.rsplit("/", 1)[-1]
+        if path.startswith("/api/system/tasks/"):
+            with self.lock:
+                self.polls += 1
+                return [{"completed": self.polls % 2 == 0}]
+        return {"status": "OK", "importCount": {"imported": 0, "updated": self.jobs[job_id]}}
+
+
+def test_split_batches_by_count() -> None:
+    assert list(split_batches(make_columns(5), batch_size=2)) == [(0, 2), (2, 4), (4, 5)]
+
+
+def test_split_batches_by_bytes() -> None:
+    columns = make_columns(10)
+    row_bytes = int(columns.row_bytes()[0])
+    batches = list(split_batches(columns, batch_size=100, batch_bytes=3 * row_bytes))
+    assert batches == [(0, 3), (3, 6), (6, 9), (9, 10)]
+    # a single value larger than the limit still goes out on its own
+    assert list(split_batches(make_columns(2), batch_size=100, batch_bytes=1)) == [(0, 1), (1, 2)]
+
+
+def test_sum_import_counts() -> None:
+    counts = sum_import_counts([{"imported": 1, "updated": 2}, {"imported": 3, "ignored": 1}])
+    assert counts == {"imported": 4, "updated": 2, "ignored": 1, "deleted": 0}
+
+
+def test_connection_sends_credentials() -> None:
+    requests = []
+
+    def handle(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(200, json={"response": {"importCount": {"imported": 1}}})
+
+    connection = DHIS2Connection("http://dhis2.test/", "admin", "district", transport=httpx.MockTransport(handle))
+    assert "district" not in repr(connection)
+    post_data_values(connection, make_columns(1))
+    assert str(requests[0].url) == "http://dhis2.test/api/dataValueSets?dryRun=false"
+    assert requests[0].headers["authorization"] == httpx.BasicAuth("admin", "district")._auth_header
+
+
+def test_connection_waits_for_dhis2_to_import() -> None:
+    connection = DHIS2Connection.from_settings(Settings(base_url="http://dhis2.test", upload_timeout=900))
+    with connection.open() as client:
+        assert client.timeout.read == 900
+        assert client.timeout.connect == 30
+
+
+def test_post_data_values_in_batches() -> None:
+    client: Any = FakeDHIS2()
+    counts = post_data_values(client.connection, make_columns(25), options=UploadOptions(batch_size=10, concurrency=3))
+    assert sorted(FakeDHIS2.count_values(body) for body in client.bodies) == [5, 10, 10]
+    assert counts["imported"] == 25
+    assert all(request.url.params["dryRun"] == "false" for request in client.requests)
+    assert all(request.headers["content-type"] == "application/json" for request in client.requests)
+
+
+def test_post_data_values_csv_gzip() -> None:
+    client: Any = FakeDHIS2()
+    options = UploadOptions(payload_format=PayloadFormat.CSV, gzip=True)
+    counts = post_data_values(client.connection, make_columns(4), options=options)
+    assert counts["imported"] == 4
+    assert client.requests[0].headers["content-type"] == "application/csv"
+    assert gzip.decompress(client.bodies[0]).decode().splitlines()[1] == "de,20240101,ou0,,,1.5"
+
+
+def test_post_data_values_retries() -> None:
+    client: Any = FakeDHIS2(failures=2)
+    counts = post_data_values(client.connection, make_columns(3), options=no_wait(max_retries=2))
+    assert counts["imported"] == 3
+
+
+def test_post_data_values_gives_up_after_max_retries() -> None:
+    client: Any = FakeDHIS2(failures=3)
+    with pytest.raises(Exception, match="unavailable"):
+        post_data_values(client.connection, make_columns(3), options=no_wait(max_retries=2))
+
+
+def test_post_data_values_does_not_retry_rejected_payloads() -> None:
+    connection = DHIS2Connection(
+        "http://dhis2.test", transport=httpx.MockTransport(lambda _: httpx.Response(409, json={"status": "ERROR"}))
+    )
+    with pytest.raises(Exception, match="ERROR"):
+        post_data_values(connection, make_columns(3), options=no_wait(max_retries=2))
+
+
+def test_post_data_values_does_not_repost_failed_jobs() -> None:
+    client: Any = FakeDHIS2()
+    client.get = lambda path: [{"completed": False}]
+    options = no_wait(async_import=True, max_retries=2, poll_timeout=0.0)
+    with pytest.raises(TimeoutError):
+        post_data_values(client.connection, make_columns(3), options=options)
+    assert len(client.bodies) == 1
+
+
+def test_post_data_values_retries_transport_errors() -> None:
+    client: Any = FakeDHIS2()
+    attempts = []
+
+    def handle(request: httpx.Request) -> httpx.Response:
+        attempts.append(request)
+        if len(attempts) == 1:
+            raise httpx.ConnectError("connection refused")
+        response: httpx.Response = client.handle(request)
+        return response
+
+    connection = DHIS2Connection("http://dhis2.test", transport=httpx.MockTransport(handle))
+    assert post_data_values(connection, make_columns(3), options=no_wait(max_retries=2))["imported"] == 3
+    assert len(attempts) == 2
+
+
+def test_post_data_values_async_jobs() -> None:
+    client: Any = FakeDHIS2()
+    counts = post_data_values(
+        client.connection, make_columns(5), dry_run=True, options=no_wait(batch_size=2, async_import=True)
+    )
+    assert counts["updated"] == 5
+    assert all(request.url.params["async"] == "true" for request in client.requests)
+    assert all(request.url.params["dryRun"] == "true" for request in client.requests)
+
+
+def post_async(client: Any, columns: DataValueColumns, **kwargs: Any) -> dict[str, int]:
+    options = no_wait(**kwargs)
+
+    async def post() -> dict[str, int]:
+        async with client.connection.open_async(options) as http:
+            return await post_data_values_async(client.connection, columns, options=options, http=http)
+
+    return asyncio.run(post())
+
+
+def test_post_data_values_async_tasks() -> None:
+    client: Any = FakeDHIS2(failures=1)
+    counts = post_async(client, make_columns(25), batch_size=10, concurrency=8, connections=2, gzip=True)
+    assert counts["imported"] == 25
+    assert sorted(FakeDHIS2.count_values(body) for body in client.bodies) == [5, 10, 10]
+    assert all(request.headers["content-type"] == "application/json" for request in client.requests)
+
+
+def test_post_data_values_async_tasks_with_import_jobs() -> None:
+    client: Any = FakeDHIS2()
+    counts = post_async(client, make_columns(5), batch_size=2, connections=1, async_import=True)
+    assert counts["updated"] == 5
+
+
+def test_require_http2() -> None:
+    if importlib.util.find_spec("h2") is None:
+        with pytest.raises(ImportError, match="h2"):
+            require_http2()
+    else:
+        require_http2()
@@ -0,0 +1,136 @@
+"""Tests for org unit weight matrices."""
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+from shapely.geometry import box
+
+from dhis2_era5land import weights as weights_module
+from dhis2_era5land.weights import compute_weights, get_weights, land_cells, weighted_reduce, weights_key
+
+LAT = np.round(np.arange(0.9, -0.05, -0.1), 1)
+LON = np.round(np.arange(0.0, 0.95, 0.1), 1)
+
+
+def make_daily(values: np.ndarray | None = None) -> xr.DataArray:
+    time = pd.date_range("2020-01-01", periods=2, freq="D")
+    if values is None:
+        values = np.ones((len(time), len(LAT), len(LON)))
+    return xr.DataArray(
+        values,
+        dims=("valid_time", "latitude", "longitude"),
+        coords={"valid_time": time, "latitude": LAT, "longitude": LON},
+        name="tp",
+    )
+
+
+def make_org_units() -> gpd.GeoDataFrame:
+    return gpd.GeoDataFrame(
+        {"id": ["a", "b", "c"]},
+        geometry=[
+            box(-0.05, -0.05, 0.45, 0.95),  # left half, aligned to cell edges
+            box(0.45, -0.05, 0.95, 0.95),  # right half
+            box(0.3, 0.3, 0.32, 0.32),  # smaller than a single cell
+        ],
+        crs="EPSG:4326",
+    )
+
+
+@pytest.fixture(autouse=True)
+def clear_memory() -> None:
+    weights_module._memory.clear()
+
+
+def test_compute_weights_fractions() -> None:
+    weights = compute_weights(make_org_units(), LAT, LON)
+    assert weights.matrix.shape == (3, len(LAT) * len(LON))
+    np.testing.assert_allclose(weights.matrix.sum(axis=1).A1, [50.0, 50.0, 0.04], rtol=1e-6)
+
+
+def test_weighted_mean_and_sum() -> None:
+    values = np.zeros((2, len(LAT), len(LON)))
+    values[:, :, :5] = 1.0
+    values[:, :, 5:] = 3.0
+    values[1, 0, 0] = np.nan
+
+    reduced = weighted_reduce(make_daily(values), compute_weights(make_org_units(), LAT, LON), how="mean")
+    assert reduced.dims == ("id", "valid_time")
+    assert reduced.name == "tp"
+    np.testing.assert_allclose(reduced.sel(id="a").values, [1.0, 1.0])
+    np.testing.assert_allclose(reduced.sel(id="b").values, [3.0, 3.0])
+    np.testing.assert_allclose(reduced.sel(id="c").values, [1.0, 1.0])
+
+    summed = weighted_reduce(make_daily(values), compute_weights(make_org_units(), LAT, LON), how="sum")
+    np.testing.assert_allclose(summed.sel(id="a").values, [50.0, 49.0], rtol=1e-6)
+
+
+def test_weighted_mean_all_missing_is_nan() -> None:
+    values = np.ones((2, len(LAT), len(LON)))
+    values[1] = np.nan
+    reduced = weighted_reduce(make_daily(values), compute_weights(make_org_units(), LAT, LON))
+    assert reduced["id"].values.tolist() == ["a", "b", "c"]
+    assert np.isnan(reduced.isel(valid_time=1).values).all()
+
+
+def test_weights_key_changes_with_geometry() -> None:
+    org_units = make_org_units()
+    key = weights_key(org_units, LAT, LON)
+    assert key == weights_key(make_org_units(), LAT, LON)
+
+    org_units.loc[0, "geometry"] = box(-0.05, -0.05, 0.35, 0.95)
+    assert weights_key(org_units, LAT, LON) != key
+    assert weights_key(make_org_units(), LAT[:-1], LON) != key
+
+
+def test_get_weights_persists(tmp_path: Path) -> None:
+    computed = get_weights(make_org_units(), LAT, LON, directory=tmp_path)
+    assert len(list(tmp_path.glob("weights-*.npz"))) == 1
+
+    weights_module._memory.clear()
+    loaded = get_weights(make_org_units(), LAT, LON, directory=tmp_path)
+    assert list(loaded.ids) == ["a", "b", "c"]
+    assert loaded.shape == computed.shape
+    assert (loaded.matrix != computed.matrix).nnz == 0
+
+
+def test_org_units_without_cells_are_left_out(caplog: pytest.LogCaptureFixture) -> None:
+    org_units = make_org_units()
+    org_units.loc[3] = ["d", box(5.0, 5.0, 6.0, 6.0)]
+    weights = get_weights(org_units, LAT, LON)
+    assert weights.empty.tolist() == [False, False, False, True]
+    assert "1 org units don't cover any grid cell and get no values: d" in caplog.text
+
+    reduced = weighted_reduce(make_daily(), weights)
+    assert reduced["id"].values.tolist() == ["a", "b", "c"]
+
+
+def test_org_units_without_data_are_left_out(caplog: pytest.LogCaptureFixture) -> None:
+    # the right half is sea, outside the land mask
+    values = np.ones((2, len(LAT), len(LON)))
+    values[:, :, 5:] = np.nan
+    weights = get_weights(make_org_units(), LAT, LON)
+    assert land_cells(make_daily(values)).shape == (len(LAT), len(LON))
+    assert weights.excluded(land_cells(make_daily(values))).tolist() == [False, True, False]
+    assert "1 org units only cover grid cells without data and get no values: b" in caplog.text
+
+    caplog.clear()
+    reduced = weighted_reduce(make_daily(values), weights)
+    assert reduced["id"].values.tolist() == ["a", "c"]
+    assert "without data" not in caplog.text
+
+
+def test_excluded_is_reported_once_across_threads(caplog: pytest.LogCaptureFixture) -> None:
+    values = np.ones((2, len(LAT), len(LON)))
+    values[:, :, 5:] = np.nan
+    land = land_cells(make_daily(values))
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        weights = list(executor.map(lambda _: get_weights(make_org_units(), LAT, LON), range(8)))
+        masks = list(executor.map(lambda matrix: matrix.excluded(land), weights))
+
+    assert all(mask.tolist() == [False, True, False] for mask in masks)
+    assert caplog.text.count("only cover grid cells without data") == len({id(matrix) for matrix in weights})
@@ -0,0 +1,138 @@
+"""Tests for incremental import windows."""
+
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from dhis2_era5land.periods import PeriodType, period_start
+from dhis2_era5land.window import (
+    DayWindow,
+    parse_period_day,
+    period_bounds,
+    period_ids,
+    period_starts,
+    plan_chunks,
+    plan_windows,
+    reduce_periods,
+    select_hours,
+)
+
+
+def test_parse_period_day() -> None:
+    assert parse_period_day("20240315") == date(2024, 3, 15)
+    assert parse_period_day("202403") == date(2024, 3, 1)
+    assert parse_period_day("2024W11") == date(2024, 3, 11)
+    with pytest.raises(ValueError, match="Unsupported"):
+        parse_period_day("2024Q1")
+
+
+def test_plan_windows_splits_by_month() -> None:
+    windows = plan_windows(date(2024, 1, 20), date(2024, 3, 5))
+    assert [str(w) for w in windows] == ["20240120-20240131", "20240201-20240229", "20240301-20240305"]
+
+
+def test_plan_windows_resumes_from_last_imported_day() -> None:
+    windows = plan_windows(date(2024, 1, 1), date(2024, 1, 31), resume_from=date(2024, 1, 30))
+    assert windows == [DayWindow(date(2024, 1, 30), date(2024, 1, 31))]
+    assert plan_windows(date(2024, 1, 1), date(2024, 1, 31), resume_from=date(2024, 2, 1)) == []
+    assert plan_windows(date(2024, 1, 10), date(2024, 1, 11), resume_from=date(2023, 1, 1))[0].start == date(
+        2024, 1, 10
+    )
+
+
+def test_utc_range_and_months_follow_timezone_offset() -> None:
+    window = DayWindow(date(2024, 3, 1), date(2024, 3, 31))
+    assert window.utc_range(0) == (datetime(2024, 3, 1), datetime(2024, 4, 1))
+    assert window.months(0) == [(2024, 3)]
+    assert window.utc_range(3) == (datetime(2024, 2, 29, 21), datetime(2024, 3, 31, 21))
+    assert window.months(3) == [(2024, 2), (2024, 3)]
+    assert window.months(-5) == [(2024, 3), (2024, 4)]
+
+
+def test_select_hours_gives_whole_local_days() -> None:
+    times = pd.date_range("2024-02-28", "2024-03-03", freq="h", inclusive="left")
+    data = xr.Dataset({"tp": ("valid_time", np.arange(len(times), dtype=float))}, coords={"valid_time": times})
+
+    selected = select_hours(data, DayWindow(date(2024, 3, 1), date(2024, 3, 1)), timezone_offset=3)
+    assert selected.sizes["valid_time"] == 24
+    assert pd.Timestamp(selected["valid_time"].values[0]) == pd.Timestamp("2024-02-29 21:00")
+
+
+def test_plan_chunks_follow_calendar() -> None:
+    chunks = plan_chunks(date(2022, 3, 15), date(2024, 2, 10))
+    assert [str(chunk) for chunk in chunks] == ["20220315-20221231", "20230101-20231231", "20240101-20240210"]
+
+    quarters = plan_chunks(date(2024, 2, 1), date(2024, 12, 31), months_per_chunk=3)
+    assert [str(chunk) for chunk in quarters] == [
+        "20240201-20240331",
+        "20240401-20240630",
+        "20240701-20240930",
+        "20241001-20241231",
+    ]
+    with pytest.raises(ValueError):
+        plan_chunks(date(2024, 1, 1), date(2024, 12, 31), months_per_chunk=0)
+
+
+@pytest.mark.parametrize(
+    ("period_type", "expected"),
+    [
+        (PeriodType.DAILY, ["20231231", "20240101", "20240107", "20240131"]),
+        (PeriodType.WEEKLY, ["2023W52", "2024W1", "2024W1", "2024W5"]),
+        (PeriodType.WEEKLY_WEDNESDAY, ["2023WedW52", "2023WedW52", "2024WedW1", "2024WedW5"]),
+        (PeriodType.WEEKLY_SUNDAY, ["2024SunW1", "2024SunW1", "2024SunW2", "2024SunW5"]),
+        (PeriodType.BI_WEEKLY, ["2023BiW26", "2024BiW1", "2024BiW1", "2024BiW3"]),
+        (PeriodType.MONTHLY, ["202312", "202401", "202401", "202401"]),
+    ],
+)
+def test_period_ids(period_type: PeriodType, expected: list[str]) -> None:
+    days = np.array(["2023-12-31", "2024-01-01", "2024-01-07", "2024-01-31"], dtype="datetime64[D]")
+    ids = period_ids(period_starts(days, period_type), period_type)
+    assert ids.tolist() == expected
+
+
+@pytest.mark.parametrize("period_type", list(PeriodType))
+def test_period_ids_round_trip(period_type: PeriodType) -> None:
+    days = np.arange("2019-12-01", "2027-01-31", dtype="datetime64[D]")
+    starts = period_starts(days, period_type)
+    ids = period_ids(starts, period_type)
+    for period_id, first in set(zip(ids.tolist(), starts.tolist(), strict=True)):
+        assert period_start(period_id) == first
+    assert (starts <= days).all()
+
+
+def test_weekly_periods_follow_iso_weeks() -> None:
+    days = np.arange("2020-01-01", "2027-01-01", dtype="datetime64[D]")
+    ids = period_ids(period_starts(days, PeriodType.WEEKLY), PeriodType.WEEKLY)
+    expected = [f"{year}W{week}" for year, week, _ in (day.isocalendar() for day in days.tolist())]
+    assert ids.tolist() == expected
+
+
+def test_bi_weekly_periods_of_53_week_year() -> None:
+    # 2026 has 53 ISO weeks, so its last bi-week has a single week
+    assert period_bounds(date(2026, 12, 31), PeriodType.BI_WEEKLY) == (date(2026, 12, 28), date(2027, 1, 3))
+    assert period_bounds(date(2027, 1, 4), PeriodType.BI_WEEKLY) == (date(2027, 1, 4), date(2027, 1, 17))
+
+
+def test_reduce_periods() -> None:
+    times = pd.date_range("2024-01-01", "2024-01-14", freq="D")
+    values = np.arange(14, dtype=float)
+    values[7:] = np.nan
+    data = xr.DataArray(values[:, None], dims=("valid_time", "id"), coords={"valid_time": times, "id": ["a"]})
+    summed = reduce_periods(data, PeriodType.WEEKLY, how="sum")
+    assert (summed["valid_time"].values == pd.to_datetime(["2024-01-01", "2024-01-08"]).values).all()
+    assert summed.values[0, 0] == 21.0
+    assert np.isnan(summed.values[1, 0])
+    assert reduce_periods(data, PeriodType.MONTHLY).values[0, 0] == 3.0
+
+
+def test_plan_windows_reach_to_end_of_last_period() -> None:
+    windows = plan_windows(date(2024, 1, 1), date(2024, 2, 29), period_types=[PeriodType.WEEKLY, PeriodType.MONTHLY])
+    assert windows == [
+        DayWindow(date(2024, 1, 1), date(2024, 1, 31), until=date(2024, 2, 4)),
+        DayWindow(date(2024, 2, 1), date(2024, 2, 29), until=date(2024, 3, 3)),
+    ]
+    assert windows[0].utc_range(0) == (datetime(2024, 1, 1), datetime(2024, 2, 5))
+    assert plan_windows(date(2024, 3, 1), date(2024, 3, 31), period_types=[PeriodType.MONTHLY])[0].until is None